@@ -0,0 +1,35 @@
+#!/bin/sh
+#$ -cwd
+#$ -j yes
+#$ -t @@ARRAY_TASKS@@
+#$ -tc @@ARRAY_LIMIT@@
+
+# one model per array task
+TASK=${SGE_TASK_ID}
+MODEL=`basename "@@INPUT_PDB_FILE@@" .pdb`
+
+# run Rosetta script
+echo "### start: " `date`
+echo "### node : " `hostname`
+echo "### task : " ${TASK}
+
+@@ROSETTA_SCRIPT_SERIAL_EXE@@ \
+  -parser:protocol @@ROSETTA_SCRIPT_FILE@@ \
+  -edensity:mapfile @@DENSITY_FILE@@ \
+  -s @@INPUT_PDB_FILE@@ \
+  -in::file::centroid_input \
+  -mapreso @@HIRES@@ \
+  -nstruct 1 \
+  -out:suffix _task${TASK} \
+  -out:file:scorefile score_task${TASK}.sc \
+  -default_max_cycles 200 \
+  -crystal_refine \
+  -edensity::cryoem_scatterers true \
+  -ignore_unrecognized_res
+
+# same model numbering as a single run with -nstruct @@NSTRUCT@@
+if [ -f ${MODEL}_task${TASK}_0001.pdb ]; then
+  mv ${MODEL}_task${TASK}_0001.pdb ${MODEL}_`printf "%04d" ${TASK}`.pdb
+fi
+
+echo "### end: " `date`
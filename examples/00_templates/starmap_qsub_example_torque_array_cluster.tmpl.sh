@@ -0,0 +1,40 @@
+#!/bin/sh
+#PBS -j oe
+#PBS -t @@ARRAY_TASKS@@%@@ARRAY_LIMIT@@
+
+set -u
+set -x
+
+if [ ! -z ${PBS_O_WORKDIR} ]; then
+	cd ${PBS_O_WORKDIR}
+fi
+
+# one model per array task
+TASK=${PBS_ARRAYID}
+MODEL=`basename "@@INPUT_PDB_FILE@@" .pdb`
+
+# run Rosetta script
+echo "### start: " `date`
+echo "### node : " `hostname`
+echo "### task : " ${TASK}
+
+@@ROSETTA_SCRIPT_SERIAL_EXE@@ \
+  -parser:protocol @@ROSETTA_SCRIPT_FILE@@ \
+  -edensity:mapfile @@DENSITY_FILE@@ \
+  -s @@INPUT_PDB_FILE@@ \
+  -in::file::centroid_input \
+  -mapreso @@HIRES@@ \
+  -nstruct 1 \
+  -out:suffix _task${TASK} \
+  -out:file:scorefile score_task${TASK}.sc \
+  -default_max_cycles 200 \
+  -crystal_refine \
+  -edensity::cryoem_scatterers true \
+  -ignore_unrecognized_res
+
+# same model numbering as a single run with -nstruct @@NSTRUCT@@
+if [ -f ${MODEL}_task${TASK}_0001.pdb ]; then
+  mv ${MODEL}_task${TASK}_0001.pdb ${MODEL}_`printf "%04d" ${TASK}`.pdb
+fi
+
+echo "### end: " `date`
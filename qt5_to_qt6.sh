@@ -18,6 +18,10 @@ sed -i "s/#self.starMapGui.executionTextEdit.setTabStopDistance/self.starMapGui.
 sed -i "s/self.starMapGui.medicTextEdit.setTabStopWidth/#self.starMapGui.medicTextEdit.setTabStopWidth/g" tool.py
 sed -i "s/font.setStyleHint/#font.setStyleHint/g" tool.py
 
+# jobs.py, progress.py
+sed -i "s/from PyQt5 /from PyQt6 /g" jobs.py
+sed -i "s/from PyQt5 /from PyQt6 /g" progress.py
+
 # qtstarmapwidget.py
 sed -i "s/PyQt5/PyQt6/g" qtstarmapwidget.py
 sed -i "s/setFrameShape(QtWidgets.QFrame.HLine)/setFrameStyle(QtWidgets.QFrame.Shape.HLine)/g" qtstarmapwidget.py
@@ -8,8 +8,8 @@ using the external Rosetta modeling software.
 """
 
 # -----------------------------------------------------------------------------
-__version__ = "1.2.23"
-__versionTime__ = "2 September 2024 15:17"
+__version__ = "1.2.24"
+__versionTime__ = "18 October 2026 10:00"
 __author__ = "Wolfgang Lugmayr <w.lugmayr@uke.de>"
 __copyright__ = "Copyright (c) 2013-2024 by the Universitätsklinikum Hamburg-Eppendorf (UKE)"
 
@@ -59,6 +59,10 @@ class _MyAPI(BundleAPI):
             register(command_name, cmd.starmap_runlcc_desc, cmd.starmap_cmd_handler, logger=logger)
         if command_name == "stmrunzsc":
             register(command_name, cmd.starmap_runzsc_desc, cmd.starmap_cmd_handler, logger=logger)
+        if command_name == "stmrunmodels":
+            register(command_name, cmd.starmap_runmodels_desc, cmd.starmap_cmd_handler, logger=logger)
+        if command_name == "stmsweep":
+            register(command_name, cmd.starmap_sweep_desc, cmd.starmap_cmd_handler, logger=logger)
         if command_name == "stmopenmedsum":
             register(command_name, cmd.starmap_openmedsum_desc, cmd.starmap_cmd_handler, logger=logger)
         return
@@ -0,0 +1,235 @@
+#
+# Copyright (c) 2024 by the Universitätsklinikum Hamburg-Eppendorf (UKE)
+# Written by Wolfgang Lugmayr <w.lugmayr@uke.de>
+#
+"""
+Parsing of the Rosetta density_tools analysis output and the analysis result model.
+"""
+
+# -----------------------------------------------------------------------------
+import os
+from collections import deque
+import numpy
+
+# -----------------------------------------------------------------------------
+FSC_TAG = "density_tools:"
+PERRESCC_TAG = "PERRESCC"
+FRAGMENTBIAS_TAG = "FragmentBias"
+FRAGMENTBIAS_SKIP = ("init", "Probs_", "rsn", "Size")
+
+# PERRESCC token positions
+PERRES_CHAIN = 4
+PERRES_RESNUM = 5
+PERRES_LCC = 6
+PERRES_ZSCORE = 7
+
+# per residue z-score attributes and their joined record columns
+ZSCORE_ATTRIBUTES = {"zscore": 4,
+                     "zdensity": 5,
+                     "zneighborhood": 6,
+                     "zrama": 7,
+                     "zbondstrain": 8}
+ZSCORE_PALETTE = "-1,red:-0.5,white:0,gold"
+
+
+# -----------------------------------------------------------------------------
+def iter_perrescc(logfile):
+    """Yields the tokens of all PERRESCC records of a density_tools log"""
+    with open(logfile, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.find(PERRESCC_TAG) != -1:
+                yield line.split()
+
+
+# -----------------------------------------------------------------------------
+def iter_zscore_records(logfile):
+    """Yields the joined PERRESCC and FragmentBias tokens per residue.
+
+    Both record types are paired in order of appearance in one pass over the
+    log, only records without partner so far are kept in memory.
+    """
+    perres = deque()
+    fragments = deque()
+    with open(logfile, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.find(PERRESCC_TAG) != -1:
+                perres.append(line.split()[3:])
+            elif line.find(FRAGMENTBIAS_TAG) != -1 and not any(skip in line for skip in FRAGMENTBIAS_SKIP):
+                fragments.append(line.split(':', 2)[1].split())
+            while perres and fragments:
+                yield perres.popleft() + fragments.popleft()
+
+
+# -----------------------------------------------------------------------------
+class StarMapAnalysisResult:
+    """Columnar FSC, LCC and Z-score data of one analysed model"""
+
+    # -------------------------------------------------------------------------
+    def __init__(self):
+        """Init this instance"""
+        self.resolution = numpy.zeros(0)
+        self.fsc = numpy.zeros(0)
+        self.chain = numpy.zeros(0, dtype=str)
+        self.resnum = numpy.zeros(0, dtype=int)
+        self.lcc = numpy.zeros(0)
+        self.zscore = numpy.zeros(0)
+        self.zdensity = numpy.zeros(0)
+        self.zneighborhood = numpy.zeros(0)
+        self.zrama = numpy.zeros(0)
+        self.zbondstrain = numpy.zeros(0)
+        return
+
+    # -------------------------------------------------------------------------
+    def read_fsc(self, logfile):
+        """Reads the FSC resolution bins of a density_tools log"""
+        resolution = []
+        fsc = []
+        with open(logfile, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.find(FSC_TAG) != -1:
+                    tok = line.split()
+                    try:
+                        res = float(tok[1])
+                        fsc.append(float(tok[8]))
+                        resolution.append(res)
+                    except (ValueError, IndexError):
+                        continue
+        self.resolution = numpy.array(resolution)
+        self.fsc = numpy.array(fsc)
+        return self
+
+    # -------------------------------------------------------------------------
+    def read_perres(self, logfile):
+        """Reads the PERRESCC records of a density_tools log"""
+        chain = []
+        resnum = []
+        lcc = []
+        zscore = []
+        for tok in iter_perrescc(logfile):
+            chain.append(tok[PERRES_CHAIN])
+            resnum.append(int(tok[PERRES_RESNUM]))
+            lcc.append(float(tok[PERRES_LCC]))
+            zscore.append(float(tok[PERRES_ZSCORE]) if len(tok) > PERRES_ZSCORE else numpy.nan)
+        self._set_residues(chain, resnum, lcc, zscore)
+        return self
+
+    # -------------------------------------------------------------------------
+    def read_zscore_log(self, logfile):
+        """Reads the per residue z-scores of a density_tools log"""
+        chain = []
+        resnum = []
+        lcc = []
+        zscores = {attr: [] for attr in ZSCORE_ATTRIBUTES}
+        for tok in iter_zscore_records(logfile):
+            if len(tok) <= max(ZSCORE_ATTRIBUTES.values()):
+                continue
+            chain.append(tok[1])
+            resnum.append(int(tok[2]))
+            lcc.append(float(tok[3]))
+            for attr, col in ZSCORE_ATTRIBUTES.items():
+                zscores[attr].append(float(tok[col]))
+        self._set_residues(chain, resnum, lcc, zscores["zscore"])
+        for attr in ZSCORE_ATTRIBUTES:
+            setattr(self, attr, numpy.array(zscores[attr], dtype=float))
+        return self
+
+    # -------------------------------------------------------------------------
+    def _set_residues(self, chain, resnum, lcc, zscore):
+        """Sets the per residue columns, unknown z-scores are NaN"""
+        self.chain = numpy.array(chain, dtype=str)
+        self.resnum = numpy.array(resnum, dtype=int)
+        self.lcc = numpy.array(lcc, dtype=float)
+        self.zscore = numpy.array(zscore, dtype=float)
+        for attr in ZSCORE_ATTRIBUTES:
+            if attr != "zscore":
+                setattr(self, attr, numpy.full(len(self.chain), numpy.nan))
+        return
+
+    # -------------------------------------------------------------------------
+    def chains(self):
+        """Returns the chain ids in order of appearance"""
+        _, first = numpy.unique(self.chain, return_index=True)
+        return [str(c) for c in self.chain[numpy.sort(first)]]
+
+    # -------------------------------------------------------------------------
+    def has_zscores(self):
+        """Returns True if the FragmentBias z-scores are available"""
+        return len(self.zdensity) > 0 and not numpy.isnan(self.zdensity).all()
+
+    # -------------------------------------------------------------------------
+    def write_fsc_csv(self, csvfile):
+        """Writes the FSC curve as resolution/FSC CSV file"""
+        with open(csvfile, 'w', encoding='utf-8', newline='\n') as f:
+            for res, fsc in zip(self.resolution, self.fsc):
+                f.write(_fmt(res) + ' ' + _fmt(fsc) + '\n')
+        return csvfile
+
+    # -------------------------------------------------------------------------
+    def write_perres_csv(self, prefix, attr):
+        """Writes one residue number/value CSV file per chain"""
+        csvFiles = {}
+        values = getattr(self, attr)
+        for chain in self.chains():
+            sel = self.chain == chain
+            csvFiles[chain] = prefix + '_' + chain + ".csv"
+            with open(csvFiles[chain], 'w', encoding='utf-8', newline='\n') as f:
+                for res, val in zip(self.resnum[sel], values[sel]):
+                    f.write(str(res) + ' ' + _fmt(val) + '\n')
+        return csvFiles
+
+    # -------------------------------------------------------------------------
+    def write_zscores_csv(self, csvfile):
+        """Writes all per residue values as one table"""
+        with open(csvfile, 'w', encoding='utf-8', newline='\n') as f:
+            for i in range(len(self.chain)):
+                tok = [str(i + 1), self.chain[i], str(self.resnum[i]), _fmt(self.lcc[i])]
+                tok += [_fmt(getattr(self, attr)[i]) for attr in ZSCORE_ATTRIBUTES]
+                f.write(' '.join(tok) + '\n')
+        return csvfile
+
+    # -------------------------------------------------------------------------
+    def write_color_cxc(self, colfile, attr):
+        """Writes a ChimeraX script coloring the residues by the attribute"""
+        values = getattr(self, attr)
+        with open(colfile, 'w', encoding='utf-8', newline='\n') as f:
+            f.write("hide atoms\n")
+            f.write("show cartoons\n")
+            for chain, res, val in zip(self.chain, self.resnum, values):
+                f.write("setattr /" + chain + ':' + str(res) + ' res ' + attr + ' ' + _fmt(val) + ' create true\n')
+            f.write("color byattribute " + attr + " palette " + ZSCORE_PALETTE + "\n")
+        return colfile
+
+
+# -----------------------------------------------------------------------------
+def write_veusz(vszfile, csvFiles, importPath=None):
+    """Writes a Veusz project file plotting each CSV file on its own page"""
+    if not importPath:
+        importPath = os.getcwd()
+    with open(vszfile, 'w', encoding='utf-8', newline='\n') as f:
+        f.write("# generated by StarMap\n")
+        f.write("AddImportPath(u'" + str(importPath) + "')\n")
+        for chain, csvfile in csvFiles.items():
+            f.write("ImportFileCSV(u'" + csvfile + "', delimiter=' ', linked=True, dsprefix=u'1', dssuffix=u'" + csvfile + "')\n")
+            f.write("Add('page', name='page" + str(chain) + "', autoadd=False)\n")
+            f.write("To('page" + str(chain) + "')\n")
+            f.write("Add('graph', name='graph" + str(chain) + "', autoadd=False)\n")
+            f.write("To('graph" + str(chain) + "')\n")
+            f.write("Add('axis', name='x', autoadd=False)\n")
+            f.write("Add('axis', name='y', autoadd=False)\n")
+            f.write("To('y')\n")
+            f.write("Set('direction', 'vertical')\n")
+            f.write("To('..')\n")
+            f.write("Add('xy', name='xy1', autoadd=False)\n")
+            f.write("To('xy1')\n")
+            f.write("Set('xData', u'1col1" + csvfile + "')\n")
+            f.write("Set('yData', u'1col2" + csvfile + "')\n")
+            f.write("To('..')\n")
+            f.write("To('..')\n")
+            f.write("To('..')\n")
+    return vszfile
+
+
+# -----------------------------------------------------------------------------
+def _fmt(value):
+    """Formats a float for the text outputs"""
+    return "%g" % value
@@ -0,0 +1,186 @@
+#
+# Copyright (c) 2024 by the Universitätsklinikum Hamburg-Eppendorf (UKE)
+# Written by Wolfgang Lugmayr <w.lugmayr@uke.de>
+#
+"""
+Content addressed cache of the density_tools analysis logs.
+"""
+
+# -----------------------------------------------------------------------------
+import os
+import json
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+ANALYSIS_CACHE_SIZE = 1024 * 1024 * 1024
+# checksums of the maps are kept next to the cache directory
+MAP_DIGEST_SUFFIX = "_maps.json"
+MAP_DIGEST_ENTRIES = 256
+# only complete logs of successful runs are cached
+ANALYSIS_LOG_END = "--- StarMap: end of log ---"
+DIGEST_BLOCK_SIZE = 1024 * 1024
+
+
+# -----------------------------------------------------------------------------
+def file_digest(filename):
+    """Returns the SHA-256 checksum of the file content"""
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(DIGEST_BLOCK_SIZE), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+# -----------------------------------------------------------------------------
+def cmd_identity(cmd):
+    """Returns the path of the executable with its modification time and size"""
+    path = cmd if os.path.isabs(cmd) else shutil.which(cmd) or cmd
+    try:
+        st = os.stat(path)
+    except OSError:
+        # not visible from here, e.g. inside WSL
+        return path
+    return path + ":" + str(st.st_mtime_ns) + ":" + str(st.st_size)
+
+
+# -----------------------------------------------------------------------------
+def analysis_key(pdbfile, mapdigest, resolution, options, cmdidentity):
+    """Returns the cache key of a density_tools run for the map with the given checksum"""
+    h = hashlib.sha256()
+    h.update(file_digest(pdbfile).encode())
+    h.update(mapdigest.encode())
+    h.update(str(resolution).encode())
+    h.update(' '.join(options.split()).encode())
+    h.update(cmdidentity.encode())
+    return h.hexdigest()
+
+
+# -----------------------------------------------------------------------------
+class AnalysisCache:
+    """Directory of density_tools logs named by their key, least recently used logs are removed"""
+
+    # -------------------------------------------------------------------------
+    def __init__(self, directory, maxbytes=ANALYSIS_CACHE_SIZE):
+        """Init this instance"""
+        self.directory = directory
+        self.maxbytes = maxbytes
+        self.lock = threading.Lock()
+        self.mapDigestFile = directory.rstrip(os.sep) + MAP_DIGEST_SUFFIX
+        self.mapDigests = None
+        return
+
+    # -------------------------------------------------------------------------
+    def map_digest(self, mapfile):
+        """Returns the map checksum, kept per path, modification time and size as maps are large"""
+        path = os.path.realpath(mapfile)
+        st = os.stat(path)
+        stamp = [st.st_mtime_ns, st.st_size]
+        with self.lock:
+            digests = self._load_map_digests()
+            entry = digests.get(path)
+            if entry and entry[:2] == stamp:
+                digests.move_to_end(path)
+                return entry[2]
+
+        digest = file_digest(path)
+        with self.lock:
+            digests[path] = stamp + [digest]
+            digests.move_to_end(path)
+            while len(digests) > MAP_DIGEST_ENTRIES:
+                digests.popitem(last=False)
+            self._save_map_digests()
+        return digest
+
+    # -------------------------------------------------------------------------
+    def _load_map_digests(self):
+        """Returns the stored map checksums, read once from the disk"""
+        if self.mapDigests is None:
+            self.mapDigests = OrderedDict()
+            try:
+                with open(self.mapDigestFile, 'r', encoding='utf-8') as f:
+                    self.mapDigests.update(json.load(f))
+            except (OSError, ValueError, TypeError):
+                pass
+        return self.mapDigests
+
+    # -------------------------------------------------------------------------
+    def _save_map_digests(self):
+        """Writes the map checksums, a failed write only loses them for the next session"""
+        tmpfile = self.mapDigestFile + "." + str(os.getpid())
+        try:
+            os.makedirs(os.path.dirname(self.mapDigestFile), exist_ok=True)
+            with open(tmpfile, 'w', encoding='utf-8', newline='\n') as f:
+                json.dump(self.mapDigests, f, indent=1)
+            os.replace(tmpfile, self.mapDigestFile)
+        except OSError:
+            pass
+        return
+
+    # -------------------------------------------------------------------------
+    def _path(self, key):
+        """Returns the cache file of the key"""
+        return os.path.join(self.directory, key[:2], key + ".out")
+
+    # -------------------------------------------------------------------------
+    def get(self, key, logfile):
+        """Copies the cached log to the given file, returns False if it is not cached"""
+        path = self._path(key)
+        try:
+            shutil.copyfile(path, logfile)
+            # mark as recently used
+            os.utime(path)
+        except OSError:
+            return False
+        return True
+
+    # -------------------------------------------------------------------------
+    def put(self, key, logfile):
+        """Stores a complete log, returns True if it was stored"""
+        try:
+            with open(logfile, 'rb') as f:
+                f.seek(max(0, os.path.getsize(logfile) - 256))
+                if ANALYSIS_LOG_END.encode() not in f.read():
+                    return False
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmpfile = path + "." + str(os.getpid()) + "." + str(threading.get_ident())
+            shutil.copyfile(logfile, tmpfile)
+            os.replace(tmpfile, path)
+        except OSError:
+            return False
+        self.evict()
+        return True
+
+    # -------------------------------------------------------------------------
+    def evict(self):
+        """Removes the least recently used logs until the cache fits its size"""
+        with self.lock:
+            entries = []
+            total = 0
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    try:
+                        st = os.stat(os.path.join(root, name))
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, os.path.join(root, name)))
+                    total += st.st_size
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.maxbytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+        return
+
+    # -------------------------------------------------------------------------
+    def clear(self):
+        """Removes all cached logs"""
+        with self.lock:
+            shutil.rmtree(self.directory, ignore_errors=True)
+        return
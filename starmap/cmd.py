@@ -5,7 +5,7 @@
 """
 Handle all command registered at ChimeraX.
 """
-from chimerax.core.commands import CmdDesc, NoArg, StringArg, BoolArg # @UnresolvedImport
+from chimerax.core.commands import CmdDesc, NoArg, StringArg, BoolArg, RestOfLine # @UnresolvedImport
 from chimerax.help_viewer.tool import HelpUI  # @UnresolvedImport
 from .tool import StarMap
 from . import config
@@ -24,6 +24,12 @@ starmap_runlcc_desc = CmdDesc(required=[('stmrunlcc', NoArg)],
 starmap_runzsc_desc = CmdDesc(required=[('stmrunzsc', NoArg)],
                               synopsis='Run StarMap LCC zscore analysis')
 
+starmap_runmodels_desc = CmdDesc(required=[('stmrunmodels', NoArg)],
+                                 synopsis='Run StarMap analysis for all result models')
+
+starmap_sweep_desc = CmdDesc(required=[('stmsweep', RestOfLine)],
+                             synopsis='Generate StarMap scripts for parameter ranges')
+
 starmap_openmedsum_desc = CmdDesc(required=[('stmopenmedsum', NoArg)],
                               synopsis='Open MEDIC summary window')
 
@@ -48,7 +54,7 @@ def print_init_warning(session):
     session.logger.warning("starmap> as first line in your CXC script!")
 
 # -----------------------------------------------------------------------------
-def starmap_cmd_handler(session, stmconfig=None, stmhelp=None, stmset=None, stmrunfsc=None, stmrunlcc=None, stmrunzsc=None, stmopenmedsum=None):
+def starmap_cmd_handler(session, stmconfig=None, stmhelp=None, stmset=None, stmrunfsc=None, stmrunlcc=None, stmrunzsc=None, stmopenmedsum=None, stmsweep=None, stmrunmodels=None):
     """StarMap command handler"""
     if stmset:
         #session.logger.info("stmset> " + stmset)
@@ -84,6 +90,22 @@ def starmap_cmd_handler(session, stmconfig=None, stmhelp=None, stmset=None, stmr
         stm.cxc_exec_zsc_calc()
         return
 
+    if stmrunmodels:
+        stm = StarMap.get_singleton(session, create=False)
+        if not stm:
+            print_init_warning(session)
+            return
+        stm.cxc_exec_models_analysis()
+        return
+
+    if stmsweep:
+        stm = StarMap.get_singleton(session, create=False)
+        if not stm:
+            print_init_warning(session)
+            return
+        stm.cxc_exec_sweep(stmsweep)
+        return
+
     if stmopenmedsum:
         stm = StarMap.get_singleton(session, create=True)
         stm._show_medic_summary_window()
@@ -0,0 +1,80 @@
+#
+# Copyright (c) 2024 by the Universitätsklinikum Hamburg-Eppendorf (UKE)
+# Written by Wolfgang Lugmayr <w.lugmayr@uke.de>
+#
+"""
+Direct per residue attribute assignment and coloring inside ChimeraX.
+"""
+
+# -----------------------------------------------------------------------------
+import os
+import numpy
+from chimerax.core.commands import run  # @UnresolvedImport
+from chimerax.atomic import AtomicStructure, Residue  # @UnresolvedImport
+from .analysis import ZSCORE_ATTRIBUTES, ZSCORE_PALETTE
+
+_registered = False
+
+
+# -----------------------------------------------------------------------------
+def register_residue_attributes(session):
+    """Registers the z-score residue attributes once per session"""
+    global _registered
+    if _registered:
+        return
+    for attr in ZSCORE_ATTRIBUTES:
+        Residue.register_attr(session, attr, "StarMap", attr_type=float)
+    _registered = True
+    return
+
+
+# -----------------------------------------------------------------------------
+def find_structures(session, pdbfile):
+    """Returns the open atomic structures read from the given file"""
+    path = os.path.realpath(pdbfile)
+    found = []
+    for m in session.models.list(type=AtomicStructure):
+        filename = getattr(m, 'filename', None)
+        if filename and os.path.realpath(filename) == path:
+            found.append(m)
+    return found
+
+
+# -----------------------------------------------------------------------------
+def residue_index(structure, result):
+    """Returns the residues of the structure and their row in the result, -1 if missing"""
+    residues = structure.residues
+    rows = {}
+    for i, key in enumerate(zip(result.chain.tolist(), result.resnum.tolist())):
+        rows[key] = i
+    keys = zip(residues.chain_ids.tolist(), residues.numbers.tolist())
+    index = numpy.fromiter((rows.get(k, -1) for k in keys), dtype=int, count=len(residues))
+    return residues, index
+
+
+# -----------------------------------------------------------------------------
+def assign_residue_attributes(structure, result):
+    """Copies all available z-score columns onto the residues, returns the number of matched residues"""
+    residues, index = residue_index(structure, result)
+    matched = index >= 0
+    if not matched.any():
+        return 0
+    targets = residues.filter(matched)
+    rows = index[matched]
+    for attr in ZSCORE_ATTRIBUTES:
+        values = getattr(result, attr)
+        if len(values) != len(result.chain) or numpy.isnan(values).all():
+            continue
+        for r, v in zip(targets, values[rows].tolist()):
+            setattr(r, attr, v)
+    return int(matched.sum())
+
+
+# -----------------------------------------------------------------------------
+def color_by_attribute(session, structures, attr, palette=ZSCORE_PALETTE):
+    """Shows cartoons and colors them with one byattribute command"""
+    spec = ' '.join(s.atomspec for s in structures)
+    run(session, "hide " + spec + " atoms", log=False)
+    run(session, "show " + spec + " cartoons", log=False)
+    run(session, "color byattribute r:" + attr + " " + spec + " palette " + palette)
+    return
@@ -9,6 +9,8 @@ import os
 import platform
 import subprocess
 import importlib
+import json
+from concurrent.futures import ThreadPoolExecutor, wait
 from shutil import which
 from . import __version__ as version
 from .medic import MEDIC_SCRIPT_TEMPLATE
@@ -32,11 +34,16 @@ STARMAP_HELP = None
 STARMAP_USER_ENV = {}
 STARMAP_TEMPLATES_DIR = ""
 STARMAP_CONFIG_CHECK = False
+STARMAP_ROSETTA_CHECK = False
 
 WSL = 'C:/Windows/system32/wsl.exe'
 WSL_ROSETTA_DIR = ''
 WSL_AVAIL = False
 
+ROSETTA_CACHE_FILE = "starmap_rosetta_paths.json"
+ANALYSIS_CACHE_DIR = "starmap_analysis_cache"
+ROSETTA_PROBE_TIMEOUT = 120
+
 # -----------------------------------------------------------------------------
 def cmd_exists(name):
     """Check whether `name` is on PATH and marked as executable"""
@@ -71,7 +78,10 @@ def wsl_find_location(findstr):
     startupinfo = subprocess.STARTUPINFO()
     startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
     win_kwargs['startupinfo'] = startupinfo
-    output = subprocess.run(findstr.split(), capture_output=True, text=True, **win_kwargs).stdout
+    try:
+        output = subprocess.run(findstr.split(), capture_output=True, text=True, timeout=ROSETTA_PROBE_TIMEOUT, **win_kwargs).stdout
+    except subprocess.TimeoutExpired:
+        return ""
     if not output:
         return ""
     return str(output.strip())
@@ -130,6 +140,15 @@ def wsl_rosetta_cmd_location(rosettacmd, grepdir):
                     return str(line.strip())
     return None
 
+# -----------------------------------------------------------------------------
+def wsl_rosetta_dir():
+    """Searches the Rosetta bin directory in WSL once before the parallel searches"""
+    global WSL_ROSETTA_DIR
+    if platform.system() == "Windows" and WSL_AVAIL and not WSL_ROSETTA_DIR:
+        findstr = r"/usr/bin/find /usr/local/rosetta -type d | /usr/bin/grep 'source\/bin'"
+        WSL_ROSETTA_DIR = wsl_find_location(findstr)
+    return WSL_ROSETTA_DIR
+
 # -----------------------------------------------------------------------------
 def rosetta_cmd_location(cmd):
     """Returns the full path to the executable"""
@@ -162,6 +181,41 @@ def rosetta_cmd_location(cmd):
                     return cmd_location(rosettacmd)
     return None
 
+# -----------------------------------------------------------------------------
+def symmdef_cmd_location():
+    """Returns the full path to the Rosetta symmetry definition script"""
+    symmcmd = 'make_symmdef_file.pl'
+    if platform.system() == "Windows":
+        return wsl_rosetta_cmd_location(symmcmd, 'apps') or symmcmd
+    if cmd_exists(symmcmd):
+        return cmd_location(symmcmd)
+    return None
+
+# -----------------------------------------------------------------------------
+def probe_rosetta_cmds(timeout=ROSETTA_PROBE_TIMEOUT):
+    """Searches all Rosetta executables concurrently and returns the found locations by name"""
+    wsl_rosetta_dir()
+    probes = {"ROSETTA_SCRIPTS_CMD": (rosetta_cmd_location, ROSETTA_SCRIPTS_CMD),
+              "ROSETTA_SCRIPTS_MPI_CMD": (rosetta_cmd_location, ROSETTA_SCRIPTS_MPI_CMD),
+              "ROSETTA_DENSITY_CMD": (rosetta_cmd_location, ROSETTA_DENSITY_CMD),
+              "ROSETTA_SYMMDEF_CMD": (symmdef_cmd_location,)}
+    executor = ThreadPoolExecutor(max_workers=len(probes))
+    futures = {executor.submit(*probe): name for name, probe in probes.items()}
+    done, notdone = wait(futures, timeout=timeout)
+    executor.shutdown(wait=False)
+
+    found = {}
+    for future in done:
+        try:
+            loc = future.result()
+        except (OSError, subprocess.SubprocessError):
+            loc = None
+        if loc:
+            found[futures[future]] = loc
+    for future in notdone:
+        print("starmap> searching " + futures[future] + " timed out after " + str(timeout) + "s")
+    return found
+
 # -----------------------------------------------------------------------------
 def get_data_location():
     """Returns the full datadir to the installed data directory"""
@@ -242,23 +296,112 @@ def wsl_cmd_wrapper(cmd=None, windrive=False):
     cmd = WSL + ' ' + wsl_path_wrapper(cmd, windrive)
     return cmd
 
+# -----------------------------------------------------------------------------
+def rosetta_cache_location():
+    """Returns the cache file of the found Rosetta executables in the ChimeraX user data directory"""
+    try:
+        from chimerax import app_dirs  # @UnresolvedImport
+        return os.path.join(app_dirs.user_data_dir, ROSETTA_CACHE_FILE)
+    except (ImportError, AttributeError):
+        return None
+
+# -----------------------------------------------------------------------------
+def analysis_cache_location():
+    """Returns the directory of the cached density_tools results in the ChimeraX user cache directory"""
+    try:
+        from chimerax import app_dirs  # @UnresolvedImport
+        return os.path.join(app_dirs.user_cache_dir, ANALYSIS_CACHE_DIR)
+    except (ImportError, AttributeError):
+        return None
+
+# -----------------------------------------------------------------------------
+def cmd_mtimes(paths):
+    """Returns the modification times of the existing executables"""
+    mtimes = {}
+    if platform.system() == "Windows":
+        # one WSL call for all files
+        output = wsl_find_location("/usr/bin/stat -c %Y:%n " + ' '.join(paths))
+        for line in output.splitlines():
+            mtime, _, name = line.strip().partition(':')
+            if name and mtime.isdigit():
+                mtimes[name] = int(mtime)
+        return mtimes
+    for p in paths:
+        try:
+            mtimes[p] = int(os.stat(p).st_mtime)
+        except OSError:
+            continue
+    return mtimes
+
+# -----------------------------------------------------------------------------
+def rosetta_cmd_values():
+    """Returns the current Rosetta cmd locations by name"""
+    return {"ROSETTA_SCRIPTS_CMD": ROSETTA_SCRIPTS_CMD,
+            "ROSETTA_SCRIPTS_MPI_CMD": ROSETTA_SCRIPTS_MPI_CMD,
+            "ROSETTA_DENSITY_CMD": ROSETTA_DENSITY_CMD,
+            "ROSETTA_SYMMDEF_CMD": ROSETTA_SYMMDEF_CMD}
+
+# -----------------------------------------------------------------------------
+def load_rosetta_cache():
+    """Restores the Rosetta cmd locations if no cached executable has changed"""
+    cachefile = rosetta_cache_location()
+    if not cachefile or not os.path.isfile(cachefile):
+        return False
+    try:
+        with open(cachefile, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        cmds = cache["commands"]
+        mtimes = cache["mtimes"]
+        if cache["platform"] != platform.system() or cache["path"] != os.environ.get("PATH", ""):
+            return False
+    except (OSError, ValueError, KeyError, TypeError):
+        return False
+    if not mtimes or cmd_mtimes(list(mtimes)) != mtimes:
+        return False
+
+    global ROSETTA_SCRIPTS_CMD, ROSETTA_SCRIPTS_MPI_CMD, ROSETTA_DENSITY_CMD, ROSETTA_FOUND, ROSETTA_SYMMDEF_CMD, WSL_ROSETTA_DIR
+    ROSETTA_SCRIPTS_CMD = cmds["ROSETTA_SCRIPTS_CMD"]
+    ROSETTA_SCRIPTS_MPI_CMD = cmds["ROSETTA_SCRIPTS_MPI_CMD"]
+    ROSETTA_DENSITY_CMD = cmds["ROSETTA_DENSITY_CMD"]
+    ROSETTA_SYMMDEF_CMD = cmds["ROSETTA_SYMMDEF_CMD"]
+    WSL_ROSETTA_DIR = cache.get("wsl_rosetta_dir", "")
+    ROSETTA_FOUND = True
+    return True
+
+# -----------------------------------------------------------------------------
+def save_rosetta_cache():
+    """Stores the found Rosetta cmd locations with their modification times"""
+    cachefile = rosetta_cache_location()
+    if not cachefile or not ROSETTA_FOUND:
+        return
+    cmds = rosetta_cmd_values()
+    paths = [p for p in cmds.values() if p.startswith('/')]
+    cache = {"version": version,
+             "platform": platform.system(),
+             "path": os.environ.get("PATH", ""),
+             "wsl_rosetta_dir": WSL_ROSETTA_DIR,
+             "commands": cmds,
+             "mtimes": cmd_mtimes(paths)}
+    try:
+        os.makedirs(os.path.dirname(cachefile), exist_ok=True)
+        with open(cachefile, 'w', encoding='utf-8', newline='\n') as f:
+            json.dump(cache, f, indent=1)
+    except OSError:
+        print("starmap> cannot write " + cachefile)
+    return
+
 # -----------------------------------------------------------------------------
 def check_rosetta_cmd():
     """Initializes the Rosetta cmd locations"""
     #print("starmap> searching Rosetta executables")
     global ROSETTA_SCRIPTS_CMD, ROSETTA_SCRIPTS_MPI_CMD, ROSETTA_DENSITY_CMD, ROSETTA_FOUND, ROSETTA_SYMMDEF_CMD
-    ROSETTA_SCRIPTS_CMD = rosetta_cmd_location(ROSETTA_SCRIPTS_CMD) or ROSETTA_SCRIPTS_CMD
-    ROSETTA_SCRIPTS_MPI_CMD = rosetta_cmd_location(ROSETTA_SCRIPTS_MPI_CMD) or ROSETTA_SCRIPTS_MPI_CMD
-    ROSETTA_DENSITY_CMD = rosetta_cmd_location(ROSETTA_DENSITY_CMD) or ROSETTA_DENSITY_CMD
-    symmcmd = 'make_symmdef_file.pl'
-    if platform.system() == "Windows":
-        loc = wsl_rosetta_cmd_location(symmcmd, 'apps')
-        if loc:
-            ROSETTA_SYMMDEF_CMD = loc
-        else:
-            ROSETTA_SYMMDEF_CMD = symmcmd
-    elif cmd_exists(symmcmd):
-        ROSETTA_SYMMDEF_CMD = cmd_location(symmcmd)
+    if load_rosetta_cache():
+        return
+    found = probe_rosetta_cmds()
+    ROSETTA_SCRIPTS_CMD = found.get("ROSETTA_SCRIPTS_CMD", ROSETTA_SCRIPTS_CMD)
+    ROSETTA_SCRIPTS_MPI_CMD = found.get("ROSETTA_SCRIPTS_MPI_CMD", ROSETTA_SCRIPTS_MPI_CMD)
+    ROSETTA_DENSITY_CMD = found.get("ROSETTA_DENSITY_CMD", ROSETTA_DENSITY_CMD)
+    ROSETTA_SYMMDEF_CMD = found.get("ROSETTA_SYMMDEF_CMD", ROSETTA_SYMMDEF_CMD)
     # add default suffix
     if not ROSETTA_SCRIPTS_MPI_CMD.endswith('release'):
         ROSETTA_SCRIPTS_MPI_CMD = ROSETTA_SCRIPTS_MPI_CMD + '.linuxgccrelease'
@@ -279,6 +422,7 @@ def check_rosetta_cmd():
             ROSETTA_SCRIPTS_CMD = 'rosetta_scripts.static.linuxgccrelease'
             ROSETTA_SCRIPTS_MPI_CMD = 'rosetta_scripts.static.linuxgccrelease'
             ROSETTA_DENSITY_CMD = 'density_tools.static.linuxgccrelease'
+    save_rosetta_cache()
     return
 
 # -----------------------------------------------------------------------------
@@ -304,20 +448,29 @@ def check_starmap_files():
 
 # -----------------------------------------------------------------------------
 def check_config():
-    """Return the configuration for printing"""
-    global ROSETTA_FOUND, STARMAP_CONFIG_CHECK
+    """Checks the StarMap files and user settings, Rosetta is searched on demand"""
+    global STARMAP_CONFIG_CHECK
     if not STARMAP_CONFIG_CHECK:
-        wsl_check_distribution()
-        if not ROSETTA_FOUND:
-            check_rosetta_cmd()
         get_user_env()
         check_starmap_files()
         STARMAP_CONFIG_CHECK = True
 
+# -----------------------------------------------------------------------------
+def check_rosetta_config():
+    """Searches the Rosetta executables when they are needed the first time"""
+    global STARMAP_ROSETTA_CHECK
+    if not STARMAP_ROSETTA_CHECK:
+        wsl_check_distribution()
+        if not ROSETTA_FOUND:
+            check_rosetta_cmd()
+        STARMAP_ROSETTA_CHECK = True
+    return ROSETTA_FOUND
+
 # -----------------------------------------------------------------------------
 def config_as_string():
     """Return the configuration for printing"""
     check_config()
+    check_rosetta_config()
     s = "\nSTARMAP_VERSION             = " + str(version)
     s += "\nROSETTA_SCRIPTS_CMD         = " + ROSETTA_SCRIPTS_CMD
     s += "\nROSETTA_SCRIPTS_MPI_CMD     = " + ROSETTA_SCRIPTS_MPI_CMD
@@ -329,6 +482,8 @@ def config_as_string():
     s += "\nSTARMAP_SYMMETRY_CMD        = " + STARMAP_SYMMETRY_CMD
     s += "\nSTARMAP_HELP                = " + STARMAP_HELP
     s += "\nSTARMAP_TEMPLATES_DIR       = " + STARMAP_TEMPLATES_DIR
+    s += "\nROSETTA_CACHE_FILE          = " + str(rosetta_cache_location())
+    s += "\nANALYSIS_CACHE_DIR          = " + str(analysis_cache_location())
     for k, v in STARMAP_USER_ENV.items():
         s += '\nSTARMAP_USER' + str(k) + '               = ' + str(v)
     if platform.system() == 'Windows':
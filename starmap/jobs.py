@@ -0,0 +1,371 @@
+#
+# Copyright (c) 2024 by the Universitätsklinikum Hamburg-Eppendorf (UKE)
+# Written by Wolfgang Lugmayr <w.lugmayr@uke.de>
+#
+"""
+Tracking of the external jobs started from the StarMap user interface.
+"""
+
+# -----------------------------------------------------------------------------
+import os
+import time
+import signal
+import platform
+import subprocess
+from collections import deque
+from PyQt5 import QtCore
+from .config import wsl_cmd_wrapper
+
+JOB_RUNNING = "running"
+JOB_FINISHED = "finished"
+JOB_FAILED = "failed"
+JOB_KILLED = "killed"
+
+JOB_POLL_INTERVAL = 2000
+# seconds to wait for the process group after SIGTERM and after SIGKILL
+JOB_KILL_TIMEOUT = 5.0
+
+POOL_RETRIES = 2
+# local templates run by the model pool instead of a single job
+POOL_TEMPLATE_SUFFIX = "pool_local.tmpl.sh"
+
+
+# -----------------------------------------------------------------------------
+class StarMapJob:
+    """An external script execution with its process handle"""
+
+    # -------------------------------------------------------------------------
+    def __init__(self, scriptfile, submit="", args="", cmd=None, stdout=None):
+        """Init this instance, a given command line is run instead of the script"""
+        self.script = scriptfile
+        self.submit = submit
+        self.args = args
+        logname = scriptfile.rsplit(".", 1)[0]
+        if args:
+            logname += "_" + "_".join(args.split())
+        self.stdout = stdout or logname + ".out"
+        self.stderr = logname + ".err"
+        self.cmd = cmd or wsl_cmd_wrapper(scriptfile, True)
+        if submit:
+            self.cmd = submit + ' ' + self.cmd
+        if args:
+            self.cmd += ' ' + args
+        self.proc = None
+        self.state = ""
+        self.returncode = None
+        self.startTime = None
+        self.endTime = None
+        self.callback = None
+        self.killed = False
+        return
+
+    # -------------------------------------------------------------------------
+    def start(self):
+        """Starts the process and keeps its handle"""
+        with open(self.stdout, 'w', encoding='utf-8') as o:
+            with open(self.stderr, 'w', encoding='utf-8') as e:
+                # own process group, so the shell and all its children can be stopped together
+                if platform.system() == "Windows":
+                    self.proc = subprocess.Popen(self.cmd, shell=True, stdout=o, stderr=e, universal_newlines=True,
+                                                 creationflags=subprocess.CREATE_NEW_PROCESS_GROUP)
+                else:
+                    self.proc = subprocess.Popen(self.cmd, shell=True, stdout=o, stderr=e, universal_newlines=True,
+                                                 start_new_session=True)
+        self.startTime = time.time()
+        self.state = JOB_RUNNING
+        return
+
+    # -------------------------------------------------------------------------
+    def poll(self):
+        """Returns True if the job has finished since the last call"""
+        if self.state != JOB_RUNNING:
+            return False
+        returncode = self.proc.poll()
+        if returncode is None:
+            return False
+        if self.killed:
+            # a terminated job is done when its whole process group has exited
+            if self._group_alive():
+                return False
+            self.state = JOB_KILLED
+        else:
+            self.state = JOB_FINISHED if returncode == 0 else JOB_FAILED
+        self.returncode = returncode
+        self.endTime = time.time()
+        return True
+
+    # -------------------------------------------------------------------------
+    def terminate(self):
+        """Stops the process group of a running job, returns True if all its processes have exited.
+
+        A job whose processes did not exit in time stays running until the
+        poll finds the group gone and then reports it as killed.
+        """
+        if self.state != JOB_RUNNING:
+            return True
+        if platform.system() == "Windows":
+            # kills the whole process tree
+            subprocess.run("taskkill /F /T /PID " + str(self.proc.pid), shell=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            self.proc.wait()
+            exited = True
+        else:
+            exited = self._stop_group(signal.SIGTERM) or self._stop_group(signal.SIGKILL)
+        self.killed = True
+        if exited:
+            self.returncode = self.proc.poll()
+            self.endTime = time.time()
+            self.state = JOB_KILLED
+        return exited
+
+    # -------------------------------------------------------------------------
+    def _stop_group(self, sig):
+        """Sends the signal to the process group and waits for it, returns False on timeout"""
+        try:
+            os.killpg(self.proc.pid, sig)
+        except ProcessLookupError:
+            pass
+        return self._wait_group(JOB_KILL_TIMEOUT)
+
+    # -------------------------------------------------------------------------
+    def _wait_group(self, timeout):
+        """Waits until all processes of the group have exited, returns False on timeout"""
+        end = time.time() + timeout
+        while True:
+            # the shell is our child and must be reaped, the others are reaped by init
+            self.proc.poll()
+            if not self._group_alive():
+                return True
+            if time.time() > end:
+                return False
+            time.sleep(0.05)
+
+    # -------------------------------------------------------------------------
+    def _group_alive(self):
+        """Returns True if a process of the group is still running, zombies are ignored"""
+        if not os.path.isdir("/proc/self"):
+            try:
+                os.killpg(self.proc.pid, 0)
+            except ProcessLookupError:
+                return False
+            except PermissionError:
+                pass
+            return True
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open("/proc/" + entry + "/stat", 'r') as f:
+                    stat = f.read()
+            except OSError:
+                continue
+            # the fields after the command name are state, ppid and pgrp
+            fields = stat[stat.rfind(")") + 2:].split()
+            if len(fields) > 2 and int(fields[2]) == self.proc.pid and fields[0] != "Z":
+                return True
+        return False
+
+    # -------------------------------------------------------------------------
+    def pid(self):
+        """Returns the process id of the started shell"""
+        if self.proc:
+            return self.proc.pid
+        return None
+
+    # -------------------------------------------------------------------------
+    def runtime(self):
+        """Returns the runtime in seconds"""
+        if not self.startTime:
+            return 0
+        return int((self.endTime or time.time()) - self.startTime)
+
+    # -------------------------------------------------------------------------
+    def status_line(self):
+        """Returns the job status as single line"""
+        s = "pid " + str(self.pid()) + " " + self.state
+        if self.returncode is not None:
+            s += " (return code " + str(self.returncode) + ")"
+        s += " after " + str(self.runtime()) + "s: " + os.path.basename(self.script)
+        if self.args:
+            s += " " + self.args
+        if self.submit:
+            s += " [" + self.submit.split()[0] + "]"
+        return s
+
+
+# -----------------------------------------------------------------------------
+class JobRunner(QtCore.QObject):
+    """Starts external jobs and polls them from the Qt event loop"""
+    jobChanged = QtCore.pyqtSignal(object)
+
+    # -------------------------------------------------------------------------
+    def __init__(self, parent=None, interval=JOB_POLL_INTERVAL):
+        """Init this instance"""
+        super(JobRunner, self).__init__(parent)
+        self.jobs = []
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self._poll_jobs)
+        return
+
+    # -------------------------------------------------------------------------
+    def submit(self, scriptfile, submit="", callback=None, args=""):
+        """Starts the given script and returns the tracked job"""
+        job = StarMapJob(scriptfile, submit, args)
+        job.callback = callback
+        return self.start(job)
+
+    # -------------------------------------------------------------------------
+    def start(self, job):
+        """Starts the given job and tracks it"""
+        job.start()
+        self.jobs.append(job)
+        self.jobChanged.emit(job)
+        if not self.timer.isActive():
+            self.timer.start()
+        return job
+
+    # -------------------------------------------------------------------------
+    def running_jobs(self):
+        """Returns all jobs which are still running"""
+        return [job for job in self.jobs if job.state == JOB_RUNNING]
+
+    # -------------------------------------------------------------------------
+    def terminate_all(self):
+        """Stops all running jobs with their process groups, returns True if all have exited"""
+        exited = True
+        for job in self.running_jobs():
+            exited = job.terminate() and exited
+            self.jobChanged.emit(job)
+        if exited:
+            self.timer.stop()
+        return exited
+
+    # -------------------------------------------------------------------------
+    def status_report(self):
+        """Returns the status of all jobs of this session"""
+        if not self.jobs:
+            return "No jobs started in this session\n"
+        s = ""
+        for job in self.jobs:
+            s += job.status_line() + "\n"
+        return s
+
+    # -------------------------------------------------------------------------
+    def _poll_jobs(self):
+        """Checks the process handles without blocking"""
+        for job in self.running_jobs():
+            if job.poll():
+                self.jobChanged.emit(job)
+                if job.callback:
+                    job.callback(job)
+        if not self.running_jobs():
+            self.timer.stop()
+        return
+
+
+# -----------------------------------------------------------------------------
+class ModelPool(QtCore.QObject):
+    """Runs a single model script once per model on a limited number of local workers.
+
+    The script gets the model number as argument and must write the model
+    <prefix>_pool<number>_0001.pdb, which is renamed to <prefix>_<number>.pdb
+    like the output of a single Rosetta run with -nstruct.
+    """
+    poolChanged = QtCore.pyqtSignal(object)
+    poolFinished = QtCore.pyqtSignal(object)
+
+    # -------------------------------------------------------------------------
+    def __init__(self, runner, scriptfile, prefix, models, workers=1, retries=POOL_RETRIES):
+        """Init this instance"""
+        super(ModelPool, self).__init__(runner)
+        self.runner = runner
+        self.script = scriptfile
+        self.prefix = prefix
+        self.workers = max(1, workers)
+        self.retries = retries
+        self.queue = deque(range(1, models + 1))
+        self.attempts = {}
+        self.running = {}
+        self.done = []
+        self.failed = []
+        self.stopped = False
+        return
+
+    # -------------------------------------------------------------------------
+    def start(self):
+        """Starts the first workers"""
+        self._fill()
+        return
+
+    # -------------------------------------------------------------------------
+    def stop(self):
+        """Stops the running models and drops the queued ones, returns True if all have exited"""
+        self.stopped = True
+        self.queue.clear()
+        exited = True
+        for job, model in list(self.running.items()):
+            exited = job.terminate() and exited
+            self.runner.jobChanged.emit(job)
+            self.failed.append(model)
+        self.running.clear()
+        self.poolFinished.emit(self)
+        return exited
+
+    # -------------------------------------------------------------------------
+    def model_file(self, model):
+        """Returns the collected output file of the model"""
+        return self.prefix + "_" + "%04d" % model + ".pdb"
+
+    # -------------------------------------------------------------------------
+    def task_file(self, model):
+        """Returns the output file written by the model run"""
+        return self.prefix + "_pool" + str(model) + "_0001.pdb"
+
+    # -------------------------------------------------------------------------
+    def is_finished(self):
+        """Returns True if no model is queued or running"""
+        return not self.queue and not self.running
+
+    # -------------------------------------------------------------------------
+    def status_line(self):
+        """Returns the pool status as single line"""
+        total = len(self.done) + len(self.failed) + len(self.running) + len(self.queue)
+        s = "models " + str(len(self.done)) + "/" + str(total) + " done"
+        s += ", " + str(len(self.running)) + " running"
+        s += ", " + str(len(self.queue)) + " queued"
+        if self.failed:
+            s += ", failed: " + " ".join(str(m) for m in self.failed)
+        return s
+
+    # -------------------------------------------------------------------------
+    def _fill(self):
+        """Starts queued models until all workers are busy"""
+        while self.queue and len(self.running) < self.workers:
+            model = self.queue.popleft()
+            self.attempts[model] = self.attempts.get(model, 0) + 1
+            if os.path.exists(self.task_file(model)):
+                os.remove(self.task_file(model))
+            job = self.runner.submit(self.script, callback=self._model_done, args=str(model))
+            self.running[job] = model
+        self.poolChanged.emit(self)
+        return
+
+    # -------------------------------------------------------------------------
+    def _model_done(self, job):
+        """Collects the output of a finished model or queues it again"""
+        model = self.running.pop(job, None)
+        if model is None:
+            return
+        if job.state == JOB_FINISHED and os.path.exists(self.task_file(model)):
+            os.replace(self.task_file(model), self.model_file(model))
+            self.done.append(model)
+        elif not self.stopped and self.attempts[model] <= self.retries:
+            self.queue.append(model)
+        else:
+            self.failed.append(model)
+        if not self.stopped:
+            self._fill()
+        if self.is_finished():
+            self.poolFinished.emit(self)
+        return
@@ -0,0 +1,70 @@
+#
+# Copyright (c) 2024 by the Universitätsklinikum Hamburg-Eppendorf (UKE)
+# Written by Wolfgang Lugmayr <w.lugmayr@uke.de>
+#
+"""
+Incremental reading of growing log files.
+"""
+
+# -----------------------------------------------------------------------------
+import os
+from collections import deque
+
+LOG_TAIL_LINES = 2000
+LOG_TAIL_BYTES = 200000
+
+
+# -----------------------------------------------------------------------------
+class LogTail:
+    """Remembers the byte offset of a log file and returns only new lines"""
+
+    # -------------------------------------------------------------------------
+    def __init__(self, filename, maxlines=LOG_TAIL_LINES, maxbytes=LOG_TAIL_BYTES):
+        """Init this instance"""
+        self.filename = filename
+        self.maxbytes = maxbytes
+        self.offset = None
+        self.partial = ""
+        self.lines = deque(maxlen=maxlines)
+        return
+
+    # -------------------------------------------------------------------------
+    def read_new_lines(self):
+        """Returns the complete lines appended since the last call"""
+        try:
+            size = os.path.getsize(self.filename)
+        except OSError:
+            return []
+
+        # first call or truncated file
+        if self.offset is None or size < self.offset:
+            self.offset = 0
+            self.partial = ""
+        if size == self.offset:
+            return []
+
+        # skip what would not fit into the buffer anyway
+        skipped = False
+        if size - self.offset > self.maxbytes:
+            self.offset = size - self.maxbytes
+            self.partial = ""
+            skipped = True
+
+        with open(self.filename, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        self.offset += len(data)
+
+        text = self.partial + data.decode('utf-8', errors='replace')
+        new = text.split('\n')
+        self.partial = new.pop()
+        if skipped and new:
+            # first line is cut in the middle
+            new = new[1:]
+        self.lines.extend(new)
+        return new
+
+    # -------------------------------------------------------------------------
+    def text(self):
+        """Returns the buffered last lines as text"""
+        return '\n'.join(self.lines)
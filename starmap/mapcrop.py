@@ -0,0 +1,132 @@
+#
+# Copyright (c) 2024 by the Universitätsklinikum Hamburg-Eppendorf (UKE)
+# Written by Wolfgang Lugmayr <w.lugmayr@uke.de>
+#
+"""
+Cropping of density maps to a padded box around the selected atoms.
+"""
+
+# -----------------------------------------------------------------------------
+import os
+import json
+import struct
+import numpy
+from .mrcheader import read_mrc_header, MrcHeaderError, MRC_HEADER_SIZE
+
+CROP_PADDING = 10.0
+CROP_SUFFIX = "_crop"
+# numpy types of the MRC modes which can be cropped
+MRC_MODE_DTYPES = {0: numpy.int8, 1: numpy.int16, 2: numpy.float32, 6: numpy.uint16, 12: numpy.float16}
+
+
+# -----------------------------------------------------------------------------
+def pdb_bounds(pdbfile):
+    """Returns the minimum and maximum atom coordinates of the PDB file"""
+    coords = []
+    with open(pdbfile, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            if line.startswith("ATOM") or line.startswith("HETATM"):
+                try:
+                    coords.append((float(line[30:38]), float(line[38:46]), float(line[46:54])))
+                except ValueError:
+                    continue
+    if not coords:
+        raise ValueError("No atoms found in " + pdbfile)
+    xyz = numpy.array(coords)
+    return xyz.min(axis=0), xyz.max(axis=0)
+
+
+# -----------------------------------------------------------------------------
+def crop_box(hdr, lower, upper, padding=CROP_PADDING):
+    """Returns the first voxel and the size of a cubic box around the coordinates, clipped to the map"""
+    voxel = numpy.array(hdr.voxel_size())
+    origin = numpy.array(hdr.origin_angstrom())
+    box = numpy.array(hdr.box())
+    first = numpy.floor((numpy.asarray(lower) - padding - origin) / voxel).astype(int)
+    last = numpy.ceil((numpy.asarray(upper) + padding - origin) / voxel).astype(int) + 1
+    # cubic box centered on the selection, as large as the map allows
+    size = min(int((last - first).max()), int(box.min()))
+    center = (first + last) // 2
+    first = numpy.clip(center - size // 2, 0, box - size)
+    return tuple(int(i) for i in first), size
+
+
+# -----------------------------------------------------------------------------
+def crop_map(mapfile, outfile, lower, upper, padding=CROP_PADDING):
+    """Writes a padded cubic sub-box of the map around the coordinates.
+
+    The volume is read with a memory map, only the sub-box is copied. The
+    shifted start and origin keep the sub-box at the same place, so models
+    fitted into the cropped map also fit into the full map. The offset is
+    recorded in <outfile>.json. Returns the recorded values.
+    """
+    hdr = read_mrc_header(mapfile)
+    if hdr.mode not in MRC_MODE_DTYPES:
+        raise MrcHeaderError("Cannot crop maps of mode " + str(hdr.mode) + ": " + mapfile)
+    if tuple(hdr.axes) != (1, 2, 3):
+        raise MrcHeaderError("Cannot crop maps with axis order " + ",".join(str(a) for a in hdr.axes) + ": " + mapfile)
+    first, size = crop_box(hdr, lower, upper, padding)
+    dtype = numpy.dtype(MRC_MODE_DTYPES[hdr.mode]).newbyteorder(hdr.byteorder)
+    data = numpy.memmap(mapfile, dtype=dtype, mode='r', offset=hdr.data_offset(), shape=(hdr.nz, hdr.ny, hdr.nx))
+    x, y, z = first
+    sub = numpy.ascontiguousarray(data[z:z + size, y:y + size, x:x + size])
+    del data
+
+    voxel = hdr.voxel_size()
+    with open(mapfile, 'rb') as f:
+        header = bytearray(f.read(MRC_HEADER_SIZE))
+    bo = hdr.byteorder
+    start = tuple(s + i for s, i in zip(hdr.start, first))
+    struct.pack_into(bo + "3i", header, 0, size, size, size)
+    struct.pack_into(bo + "3i", header, 16, *start)
+    struct.pack_into(bo + "3i", header, 28, size, size, size)
+    struct.pack_into(bo + "3f", header, 40, *(size * v for v in voxel))
+    values = sub.astype(numpy.float64)
+    struct.pack_into(bo + "3f", header, 76, values.min(), values.max(), values.mean())
+    # no extended header in the cropped map
+    struct.pack_into(bo + "i", header, 92, 0)
+    if any(hdr.origin):
+        struct.pack_into(bo + "3f", header, 196, *(o + i * v for o, i, v in zip(hdr.origin, first, voxel)))
+    struct.pack_into(bo + "f", header, 216, values.std())
+    with open(outfile, 'wb') as f:
+        f.write(header)
+        f.write(sub.tobytes())
+
+    record = {"map": os.path.abspath(mapfile),
+              "size": os.path.getsize(mapfile),
+              "mtime": os.path.getmtime(mapfile),
+              "padding": padding,
+              "lower": [float(v) for v in lower],
+              "upper": [float(v) for v in upper],
+              "offset": list(first),
+              "box": size,
+              "origin": [float(v) for v in read_mrc_header(outfile).origin_angstrom()]}
+    with open(outfile + ".json", 'w', encoding='utf-8', newline='\n') as f:
+        json.dump(record, f, indent=1)
+    return record
+
+
+# -----------------------------------------------------------------------------
+def crop_map_to_pdb(mapfile, pdbfile, outfile, padding=CROP_PADDING):
+    """Crops the map around the atoms of the PDB file unless the cropped map is up to date"""
+    lower, upper = pdb_bounds(pdbfile)
+    try:
+        with open(outfile + ".json", 'r', encoding='utf-8') as f:
+            record = json.load(f)
+        if (os.path.isfile(outfile) and record["map"] == os.path.abspath(mapfile)
+                and record["size"] == os.path.getsize(mapfile) and record["mtime"] == os.path.getmtime(mapfile)
+                and record["padding"] == padding and numpy.allclose(record["lower"], lower)
+                and numpy.allclose(record["upper"], upper)):
+            return record
+    except (OSError, ValueError, KeyError):
+        pass
+    return crop_map(mapfile, outfile, lower, upper, padding)
+
+
+# -----------------------------------------------------------------------------
+def cropped_map_name(mapfile, pdbfile):
+    """Returns the name of the cropped map next to the selection PDB"""
+    base = os.path.basename(mapfile).rsplit(".", 1)
+    ext = base[1] if len(base) > 1 else "mrc"
+    pdbbase = os.path.basename(pdbfile).rsplit(".", 1)[0]
+    return os.path.join(os.path.dirname(os.path.abspath(pdbfile)), base[0] + CROP_SUFFIX + "_" + pdbbase + "." + ext)
@@ -0,0 +1,96 @@
+#
+# Copyright (c) 2024 by the Universitätsklinikum Hamburg-Eppendorf (UKE)
+# Written by Wolfgang Lugmayr <w.lugmayr@uke.de>
+#
+"""
+FSC, LCC and Z-score analysis of all ranked result models.
+"""
+
+# -----------------------------------------------------------------------------
+import os
+import re
+import csv
+from concurrent.futures import ThreadPoolExecutor
+import numpy
+from .analysis import StarMapAnalysisResult
+from .ranking import RESULT_PREFIX
+
+ANALYSIS_TABLE = RESULT_PREFIX + "_analysis.csv"
+ANALYSIS_COLUMNS = ("model", "fsc_mean", "residues", "lcc_mean", "lcc_min", "zscore_mean", "zscore_outliers")
+# residues below this z-score are colored red
+ZSCORE_OUTLIER = -1.0
+
+# density_tools options of the FSC and the per residue runs
+DENSITY_FSC_OPTIONS = " -nresbins 200 -hires 0.01 -verbose -mask_resolution 10"
+DENSITY_PERRES_OPTIONS = " -perres -ignore_unrecognized_res -out:levels protocols.hybridization.FragmentBiasAssigner:999"
+
+
+# -----------------------------------------------------------------------------
+def result_pdbs(directory="."):
+    """Returns the ranked result models starmap_result_NNNN.pdb in the directory"""
+    pattern = re.compile('^' + RESULT_PREFIX + r'_\d{4}\.pdb$')
+    return sorted(name for name in os.listdir(directory) if pattern.match(name))
+
+
+# -----------------------------------------------------------------------------
+def run_parallel(func, items, workers):
+    """Calls the function for all items on at most workers threads, returns the results in order"""
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return list(executor.map(func, items))
+
+
+# -----------------------------------------------------------------------------
+def model_summary(pdbname, fsclog, perreslog, mapres):
+    """Returns the comparison table row of one model from its density_tools logs"""
+    row = {"model": pdbname}
+    result = StarMapAnalysisResult()
+    if os.path.isfile(fsclog):
+        result.read_fsc(fsclog)
+        # only the resolution range of the map
+        sel = result.resolution >= mapres
+        if sel.any():
+            row["fsc_mean"] = float(numpy.mean(result.fsc[sel]))
+    if os.path.isfile(perreslog):
+        # one per residue run gives the LCC and the z-scores
+        result.read_zscore_log(perreslog)
+        if not result.has_zscores():
+            result.read_perres(perreslog)
+        if len(result.lcc):
+            row["residues"] = len(result.lcc)
+            row["lcc_mean"] = float(numpy.mean(result.lcc))
+            row["lcc_min"] = float(numpy.min(result.lcc))
+        if not numpy.isnan(result.zscore).all():
+            row["zscore_mean"] = float(numpy.nanmean(result.zscore))
+            row["zscore_outliers"] = int(numpy.sum(result.zscore < ZSCORE_OUTLIER))
+    return row, result
+
+
+# -----------------------------------------------------------------------------
+def write_analysis_table(csvfile, rows):
+    """Writes one row per model, missing values stay empty"""
+    with open(csvfile, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(ANALYSIS_COLUMNS)
+        for row in rows:
+            writer.writerow([_cell(row.get(col)) for col in ANALYSIS_COLUMNS])
+    return csvfile
+
+
+# -----------------------------------------------------------------------------
+def format_analysis_table(rows):
+    """Returns the comparison table as aligned text for the log"""
+    fmt = "%-24s" + " %15s" * (len(ANALYSIS_COLUMNS) - 1)
+    lines = [fmt % ANALYSIS_COLUMNS]
+    for row in rows:
+        lines.append(fmt % tuple(_cell(row.get(col)) for col in ANALYSIS_COLUMNS))
+    return '\n'.join(lines)
+
+
+# -----------------------------------------------------------------------------
+def _cell(value):
+    """Formats a table value"""
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return "%.4f" % value
+    return str(value)
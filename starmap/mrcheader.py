@@ -0,0 +1,140 @@
+#
+# Copyright (c) 2024 by the Universitätsklinikum Hamburg-Eppendorf (UKE)
+# Written by Wolfgang Lugmayr <w.lugmayr@uke.de>
+#
+"""
+MRC/CCP4 map header reader and checks of the density maps before a Rosetta run.
+"""
+
+# -----------------------------------------------------------------------------
+import os
+import mmap
+import struct
+
+MRC_HEADER_SIZE = 1024
+# bytes per voxel of the MRC modes
+MRC_MODE_SIZES = {0: 1, 1: 2, 2: 4, 3: 4, 4: 8, 6: 2, 12: 2}
+# relative tolerance for equal pixel sizes
+MRC_VOXEL_TOLERANCE = 0.001
+
+
+# -----------------------------------------------------------------------------
+class MrcHeaderError(ValueError):
+    """Raised if a file is not a readable MRC/CCP4 map"""
+
+
+# -----------------------------------------------------------------------------
+class MrcHeader:
+    """Header values of a MRC/CCP4 map"""
+
+    # -------------------------------------------------------------------------
+    def __init__(self, filename, header, extended, filesize):
+        """Init this instance from the raw 1024 header bytes and the extended header"""
+        self.filename = filename
+        self.filesize = filesize
+        self.byteorder = '>' if header[212] == 0x11 else '<'
+        words = struct.unpack(self.byteorder + "10i6f3i3f2i", header[:96])
+        if not 0 <= words[3] <= 255 or min(words[:3]) < 1:
+            # files without machine stamp, try the other byte order
+            self.byteorder = '>' if self.byteorder == '<' else '<'
+            words = struct.unpack(self.byteorder + "10i6f3i3f2i", header[:96])
+        self.nx, self.ny, self.nz, self.mode = words[0:4]
+        self.start = words[4:7]
+        self.sampling = words[7:10]
+        self.cell = words[10:13]
+        self.angles = words[13:16]
+        self.axes = words[16:19]
+        self.dmin, self.dmax, self.dmean = words[19:22]
+        self.spacegroup, self.nsymbt = words[22:24]
+        self.exttype = header[104:108].decode('ascii', errors='replace').strip('\x00 ')
+        self.origin = struct.unpack(self.byteorder + "3f", header[196:208])
+        self.stamp = header[208:212]
+        self.extended = extended
+        return
+
+    # -------------------------------------------------------------------------
+    def box(self):
+        """Returns the number of voxels along x, y and z"""
+        return (self.nx, self.ny, self.nz)
+
+    # -------------------------------------------------------------------------
+    def voxel_size(self):
+        """Returns the pixel size in Angstrom along x, y and z"""
+        return tuple(c / m if m else 0.0 for c, m in zip(self.cell, self.sampling))
+
+    # -------------------------------------------------------------------------
+    def origin_angstrom(self):
+        """Returns the origin in Angstrom, from the start indices if the origin is not set"""
+        if any(self.origin):
+            return self.origin
+        return tuple(s * v for s, v in zip(self.start, self.voxel_size()))
+
+    # -------------------------------------------------------------------------
+    def data_offset(self):
+        """Returns the byte position of the first voxel"""
+        return MRC_HEADER_SIZE + self.nsymbt
+
+    # -------------------------------------------------------------------------
+    def data_size(self):
+        """Returns the number of bytes of the volume data"""
+        return self.nx * self.ny * self.nz * MRC_MODE_SIZES.get(self.mode, 0)
+
+    # -------------------------------------------------------------------------
+    def as_string(self):
+        """Returns the main values as single line"""
+        return (os.path.basename(self.filename) + ": box " + "x".join(str(n) for n in self.box())
+                + ", pixel size " + "/".join("%.4f" % v for v in self.voxel_size())
+                + ", origin " + "/".join("%.2f" % v for v in self.origin_angstrom())
+                + ", mode " + str(self.mode))
+
+
+# -----------------------------------------------------------------------------
+def read_mrc_header(filename):
+    """Reads the header of a MRC/CCP4 map without loading the volume"""
+    if os.path.getsize(filename) < MRC_HEADER_SIZE:
+        raise MrcHeaderError("File too small for a MRC header: " + filename)
+    with open(filename, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            hdr = MrcHeader(filename, mm[:MRC_HEADER_SIZE], b"", len(mm))
+            if hdr.nsymbt > 0:
+                hdr.extended = mm[MRC_HEADER_SIZE:MRC_HEADER_SIZE + hdr.nsymbt]
+    if hdr.mode not in MRC_MODE_SIZES or min(hdr.box()) < 1:
+        raise MrcHeaderError("Invalid MRC header (mode " + str(hdr.mode) + ", box "
+                             + "x".join(str(n) for n in hdr.box()) + "): " + filename)
+    return hdr
+
+
+# -----------------------------------------------------------------------------
+def check_map(filename, resolution=None):
+    """Returns the header and the problems of the map for a Rosetta run"""
+    hdr = read_mrc_header(filename)
+    problems = []
+    if hdr.filesize < hdr.data_offset() + hdr.data_size():
+        problems.append("file is truncated, " + str(hdr.data_offset() + hdr.data_size())
+                        + " bytes expected but only " + str(hdr.filesize) + " found")
+    if not hdr.nx == hdr.ny == hdr.nz:
+        problems.append("box is not cubic (" + "x".join(str(n) for n in hdr.box()) + ")")
+    voxel = hdr.voxel_size()
+    if min(voxel) <= 0:
+        problems.append("pixel size is not set in the header")
+    elif max(voxel) - min(voxel) > MRC_VOXEL_TOLERANCE * max(voxel):
+        problems.append("pixel size is not isotropic (" + "/".join("%.4f" % v for v in voxel) + ")")
+    if tuple(hdr.axes) != (1, 2, 3):
+        problems.append("axis order is " + ",".join(str(a) for a in hdr.axes) + " instead of 1,2,3")
+    if resolution and min(voxel) > 0 and resolution < 2 * max(voxel):
+        problems.append("resolution " + str(resolution) + " is beyond the Nyquist limit " + "%.2f" % (2 * max(voxel)))
+    return hdr, problems
+
+
+# -----------------------------------------------------------------------------
+def compare_maps(hdr1, hdr2):
+    """Returns the differences of two maps which must share the grid, e.g. half maps"""
+    problems = []
+    if hdr1.box() != hdr2.box():
+        problems.append("box sizes differ (" + "x".join(str(n) for n in hdr1.box()) + " and "
+                        + "x".join(str(n) for n in hdr2.box()) + ")")
+    for v1, v2 in zip(hdr1.voxel_size(), hdr2.voxel_size()):
+        if abs(v1 - v2) > MRC_VOXEL_TOLERANCE * max(v1, v2, 1e-6):
+            problems.append("pixel sizes differ (" + "%.4f" % v1 + " and " + "%.4f" % v2 + ")")
+            break
+    return problems
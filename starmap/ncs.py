@@ -0,0 +1,533 @@
+#
+# Copyright (c) 2024 by the Universitätsklinikum Hamburg-Eppendorf (UKE)
+# Written by Wolfgang Lugmayr <w.lugmayr@uke.de>
+#
+"""
+NumPy port of contrib/make_NCS.pl: detects the Cn/Dn symmetry of a complex and writes the Rosetta symmdef file.
+"""
+
+# -----------------------------------------------------------------------------
+import re
+import copy
+import math
+import numpy
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+NCS_MAX_TRANS_ERR = 5.0
+NCS_MAX_ROT_ERR = 3.0
+NCS_MAX_RMS = 3.0
+NCS_INTERACT_DIST = 999.0
+NCS_TOLERANCE = 1e-8
+# squared CA distances are computed in blocks of at most this many pairs
+NCS_DIST_BLOCK = 1000000
+
+
+# -----------------------------------------------------------------------------
+class NcsError(ValueError):
+    """Raised if the symmetry of the complex cannot be determined"""
+
+
+# -----------------------------------------------------------------------------
+class NcsNode:
+    """Node of the symmetry operator tree, the leaves are the subunits"""
+
+    # -------------------------------------------------------------------------
+    def __init__(self, rot, trans, path=""):
+        """Init this instance"""
+        self.rot = rot
+        self.trans = trans
+        self.path = path
+        self.children = []
+        return
+
+
+# -----------------------------------------------------------------------------
+def parse_ncs_options(text):
+    """Returns the keyword arguments of make_ncs from make_NCS.pl command line options"""
+    options = {}
+    tokens = text.split()
+    i = 0
+    while i < len(tokens):
+        opt = tokens[i]
+        value = tokens[i + 1] if i + 1 < len(tokens) and not tokens[i + 1].startswith('-') else None
+        if opt == "-f":
+            options["fast"] = True
+        elif opt == "-a" and value is not None:
+            options["chain"] = ' ' if value == '_' else value
+            i += 1
+        elif opt == "-r" and value is not None:
+            options["distance"] = float(int(float(value)))
+            i += 1
+        elif opt == "-p" and value is not None:
+            i += 1
+        else:
+            raise NcsError("Cannot parse symmetry check option '" + opt + "'")
+        i += 1
+    return options
+
+
+# -----------------------------------------------------------------------------
+def read_ca_chains(pdbfile):
+    """Returns the chain ids in file order and the CA coordinates of each chain"""
+    order = []
+    chains = {}
+    with open(pdbfile, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            if not (line.startswith("ATOM") or line.startswith("HETATM")) or line[12:16] != " CA ":
+                continue
+            try:
+                xyz = (float(line[30:38]), float(line[38:46]), float(line[46:54]))
+            except ValueError:
+                continue
+            chain = line[21:22]
+            if chain not in chains:
+                chains[chain] = []
+                order.append(chain)
+            chains[chain].append(xyz)
+    return order, {c: numpy.array(xyz, dtype=numpy.float64) for c, xyz in chains.items()}
+
+
+# -----------------------------------------------------------------------------
+def kabsch(ref, movs):
+    """Superposes all moving CA sets onto the reference with one batched SVD.
+
+    Like kabsch.pm the first min(len) atoms are used. Returns the rotations
+    of the centered moving sets onto the centered reference, the RMSDs and
+    the centers of the moving sets.
+    """
+    hs, e0s, ns, coms = [], [], [], []
+    for mov in movs:
+        n = min(len(ref), len(mov))
+        x = ref[:n] - ref[:n].mean(axis=0)
+        com = mov[:n].mean(axis=0)
+        y = mov[:n] - com
+        hs.append(y.T @ x)
+        e0s.append(0.5 * (numpy.sum(x * x) + numpy.sum(y * y)))
+        ns.append(n)
+        coms.append(com)
+    u, s, vt = numpy.linalg.svd(numpy.array(hs))
+    sigma = numpy.where(numpy.linalg.det(u) * numpy.linalg.det(vt) < 0.0, -1.0, 1.0)
+    # right handed systems as in kabsch.pm
+    v = vt.transpose(0, 2, 1).copy()
+    u[:, :, 2] = numpy.cross(u[:, :, 0], u[:, :, 1])
+    v[:, :, 2] = numpy.cross(v[:, :, 0], v[:, :, 1])
+    rots = v @ u.transpose(0, 2, 1)
+    residual = numpy.array(e0s) - s[:, 0] - s[:, 1] - sigma * s[:, 2]
+    rmsds = numpy.sqrt(numpy.abs(2.0 * residual / numpy.array(ns)))
+    return rots, rmsds, numpy.array(coms)
+
+
+# -----------------------------------------------------------------------------
+def rot_to_quat(r):
+    """Returns the quaternion (x, y, z, w) of the rotation matrix"""
+    if r[0, 0] > r[1, 1] and r[0, 0] > r[2, 2]:
+        s = math.sqrt(1.0 + r[0, 0] - r[1, 1] - r[2, 2]) * 2
+        return (0.25 * s, (r[1, 0] + r[0, 1]) / s, (r[2, 0] + r[0, 2]) / s, (r[2, 1] - r[1, 2]) / s)
+    if r[1, 1] > r[2, 2]:
+        s = math.sqrt(1.0 + r[1, 1] - r[0, 0] - r[2, 2]) * 2
+        return ((r[1, 0] + r[0, 1]) / s, 0.25 * s, (r[2, 1] + r[1, 2]) / s, (r[0, 2] - r[2, 0]) / s)
+    s = math.sqrt(1.0 + r[2, 2] - r[0, 0] - r[1, 1]) * 2
+    return ((r[0, 2] + r[2, 0]) / s, (r[2, 1] + r[1, 2]) / s, 0.25 * s, (r[1, 0] - r[0, 1]) / s)
+
+
+# -----------------------------------------------------------------------------
+def quat_to_rot(q):
+    """Returns the rotation matrix of the quaternion (x, y, z, w)"""
+    x, y, z, w = q
+    return numpy.array([[1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+                        [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+                        [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)]])
+
+
+# -----------------------------------------------------------------------------
+def _normalized(v):
+    """Returns the unit vector, short vectors are kept"""
+    v = numpy.array(v[:3], dtype=numpy.float64)
+    n = numpy.linalg.norm(v)
+    return v / n if n > 1e-6 else v
+
+
+# -----------------------------------------------------------------------------
+def _angle_deg(x, y):
+    """Returns the angle between the vectors in degrees"""
+    c = numpy.dot(x, y) / (numpy.linalg.norm(x) * numpy.linalg.norm(y))
+    return math.degrees(math.acos(min(1.0, max(-1.0, c))))
+
+
+# -----------------------------------------------------------------------------
+def _fold(rot):
+    """Returns the symmetry order, the ideal n-fold quaternion, the W and the half angle of the rotation"""
+    x, y, z, w = rot_to_quat(rot)
+    wmult = -1.0 if w < 0 else 1.0
+    omega = math.acos(min(1.0, abs(w)))
+    if omega < 1e-9:
+        return 0, None, w, omega
+    order = int(math.pi / omega + 0.5)
+    neww = -wmult * math.cos(math.pi / order)
+    s = math.sqrt((1 - neww * neww) / (x * x + y * y + z * z))
+    return order, (x * s, y * s, z * s, neww), w, omega
+
+
+# -----------------------------------------------------------------------------
+def _cyclic_sum(rot, vec, order):
+    """Returns the sum of the vector rotated 0 .. order-1 times"""
+    total = numpy.zeros(3)
+    r = numpy.identity(3)
+    for _ in range(order):
+        total += r @ vec
+        r = rot @ r
+    return total
+
+
+# -----------------------------------------------------------------------------
+def _apply_transformation(node, rot, about, post, prefix):
+    """Rotates the subtree about a point, translates it and prefixes its paths"""
+    node.rot = rot @ node.rot
+    node.trans = about + post + rot @ (node.trans - about)
+    node.path = prefix + "_" + node.path if node.path else prefix
+    for child in node.children:
+        _apply_transformation(child, rot, about, post, prefix)
+    return
+
+
+# -----------------------------------------------------------------------------
+def expand_by_split(tree, rot, delta, order):
+    """Returns a new root with order rotated copies of the tree as children"""
+    root = NcsNode(numpy.identity(3), None)
+    com = numpy.zeros(3)
+    r = numpy.identity(3)
+    total = numpy.zeros(3)
+    for i in range(order):
+        child = copy.deepcopy(tree)
+        _apply_transformation(child, r, tree.trans, com, str(i))
+        root.children.append(child)
+        total += child.trans
+        com = com + r @ delta
+        r = rot @ r
+    root.trans = total / order
+    return root
+
+
+# -----------------------------------------------------------------------------
+def tree_leaves(tree):
+    """Returns the leaves of the tree from left to right"""
+    if not tree.children:
+        return [tree]
+    return [leaf for child in tree.children for leaf in tree_leaves(child)]
+
+
+# -----------------------------------------------------------------------------
+def tree_paths_by_depth(tree, depth=0, levels=None):
+    """Returns the node paths of each tree level"""
+    if levels is None:
+        levels = []
+    if len(levels) <= depth:
+        levels.append([])
+    levels[depth].append(tree.path)
+    for child in tree.children:
+        tree_paths_by_depth(child, depth + 1, levels)
+    return levels
+
+
+# -----------------------------------------------------------------------------
+def tree_topology(tree):
+    """Returns the number of children per level as string, e.g. _2_4"""
+    if not tree.children:
+        return ""
+    return "_" + str(len(tree.children)) + tree_topology(tree.children[0])
+
+
+# -----------------------------------------------------------------------------
+def _first_contact(xyz, other, distance, tree=None):
+    """Returns the first CA pair index i*n+j in row order closer than the distance or None.
+
+    With a KD-tree of the other CAs the nearest neighbour of every row gives
+    the first row in contact, only this row is compared with all CAs.
+    """
+    d2max = distance * distance
+    if tree is not None:
+        nearest, _ = tree.query(xyz, distance_upper_bound=distance * (1.0 + 1e-9))
+        rows = numpy.nonzero(nearest <= distance * (1.0 + 1e-9))[0]
+        for i in rows:
+            hits = numpy.nonzero(numpy.sum((other - xyz[i]) ** 2, axis=1) < d2max)[0]
+            if len(hits):
+                return int(i) * len(other) + int(hits[0])
+        return None
+    block = max(1, NCS_DIST_BLOCK // max(1, len(other)))
+    for start in range(0, len(xyz), block):
+        d2 = numpy.sum((xyz[start:start + block, None, :] - other[None, :, :]) ** 2, axis=2)
+        hits = numpy.flatnonzero(d2 < d2max)
+        if len(hits):
+            return start * len(other) + int(hits[0])
+    return None
+
+
+# -----------------------------------------------------------------------------
+def _fmt(value):
+    """Formats a number like the Perl default output"""
+    return "%.15g" % value
+
+
+# -----------------------------------------------------------------------------
+def _fold_tree(tree, levels, interfaces):
+    """Returns the virtual coordinate, connect and degree of freedom lines of the tree"""
+    vrt_lines, connect_lines, dof_lines = [], [], []
+    firsts = [level[0] for level in levels]
+
+    def controlling(path):
+        depth = -1
+        for i, first in enumerate(firsts):
+            if first == path:
+                depth = i
+        return depth
+
+    def dof(jump, parent_com, origin, nsiblings):
+        x_dist = numpy.linalg.norm(parent_com - origin)
+        # symmetry operators with x == 0 must keep it
+        if x_dist > 1e-3:
+            if nsiblings == 2:
+                dof_lines.append("set_dof " + jump + " x(" + _fmt(x_dist) + ") angle_x")
+            elif nsiblings > 2:
+                dof_lines.append("set_dof " + jump + " x(" + _fmt(x_dist) + ")")
+        return
+
+    def xyz(name, x, y, pos):
+        return ("xyz VRT" + name + "  " + "%.7f,%.7f,%.7f" % tuple(x) + "  "
+                + "%.7f,%.7f,%.7f" % tuple(y) + "  " + "%.7f,%.7f,%.7f" % tuple(pos))
+
+    def recurse(node, parent_com, nsiblings):
+        origin = node.trans
+        myx = parent_com - origin
+        myz = node.rot @ numpy.array([0.0, 0.0, 1.0])
+        myy = numpy.cross(myz, myx)
+        # at top level, if the symmetry axis is x
+        if numpy.all(numpy.abs(myy) < 1e-6):
+            myz = node.rot @ numpy.array([1.0, 0.0, 0.0])
+            myy = numpy.cross(myz, myx)
+        myx = _normalized(myx)
+        myy = _normalized(myy)
+        for child in node.children:
+            recurse(child, origin, len(node.children))
+        vrt_lines.append(xyz(node.path, myx, myy, parent_com))
+        if node.children:
+            first = node.children[0].path
+            connect_lines.append("connect_virtual JUMP" + first + " VRT" + node.path + " VRT" + first)
+            if controlling(first) >= 1:
+                dof("JUMP" + first, parent_com, origin, nsiblings)
+            for child in node.children[1:]:
+                connect_lines.append("connect_virtual JUMP" + child.path + " VRT" + first + " VRT" + child.path)
+        else:
+            connect_lines.append("connect_virtual JUMP" + node.path + "_to_com VRT" + node.path + " VRT" + node.path + "_base")
+            if controlling(node.path) >= 1:
+                dof("JUMP" + node.path + "_to_com", parent_com, origin, nsiblings)
+            if node.path in interfaces:
+                if interfaces[node.path] == 0:
+                    dof_lines.append("set_dof JUMP" + node.path + "_to_subunit angle_x angle_y angle_z")
+                connect_lines.append("connect_virtual JUMP" + node.path + "_to_subunit VRT" + node.path + "_base SUBUNIT")
+            vrt_lines.append(xyz(node.path + "_base", myx, myy, origin))
+        return
+
+    recurse(tree, tree.trans + numpy.array([1.0, 0.0, 0.0]), 1)
+    return vrt_lines, connect_lines, dof_lines
+
+
+# -----------------------------------------------------------------------------
+def make_ncs(pdbfile, chain='A', distance=NCS_INTERACT_DIST, fast=False, outfile=None):
+    """Detects the symmetry of the complex and writes the symmdef file.
+
+    Same detection and output as contrib/make_NCS.pl. The chains are
+    superposed onto the main chain with one batched SVD and the interfaces
+    are found with a KD-tree of the CA positions (vectorized CA distance
+    blocks without scipy). Returns the symmetry type, the written file or
+    None and the messages of the Perl script.
+    """
+    messages = []
+    if fast:
+        messages.append("Fast distance checking enabled.")
+    order, chains = read_ca_chains(pdbfile)
+    if chain not in chains:
+        raise NcsError("Chain '" + chain + "' not in input!")
+    com0 = chains[chain].mean(axis=0)
+    ref = chains[chain] - com0
+    radius = math.sqrt(numpy.max(numpy.sum(ref * ref, axis=1)))
+    root = NcsNode(numpy.identity(3), com0)
+    secondary = [c for c in order if c != chain]
+
+    # pass 1 -- throw out non symmetric chains
+    best_score, best_order, best_chain = 999.0, 1, []
+    found = []
+    if secondary:
+        rots, rmsds, coms = kabsch(ref, [chains[c] for c in secondary])
+    for k, sec in enumerate(secondary):
+        if rmsds[k] > NCS_MAX_RMS:
+            continue
+        del_com = coms[k] - com0
+        sym_order, quat, w, _ = _fold(rots[k])
+        if not sym_order:
+            continue
+        werror = math.degrees(abs(w + quat[3]))
+        err_pos = _cyclic_sum(quat_to_rot(quat), del_com, sym_order)
+        if numpy.linalg.norm(err_pos) > NCS_MAX_TRANS_ERR or werror > NCS_MAX_ROT_ERR:
+            continue
+        found.append((sec, sym_order, quat, del_com, del_com - err_pos / sym_order))
+        score = werror + numpy.linalg.norm(err_pos)
+        if sym_order > best_order or (sym_order == best_order and best_score > score):
+            best_order, best_score, best_chain = sym_order, score, [sec]
+
+    # pass 2 -- pairs of a n-fold and a perpendicular 2-fold axis give Dn
+    for i, (sec_i, order_i, quat_i, _, corr_i) in enumerate(found):
+        axis_i = _normalized(quat_i)
+        complex_com = None
+        for j, (sec_j, order_j, quat_j, del_com_j, _) in enumerate(found):
+            if i == j or order_j != 2:
+                continue
+            ang = abs(90 - _angle_deg(axis_i, _normalized(quat_j)))
+            if ang > NCS_MAX_ROT_ERR:
+                continue
+            if complex_com is None:
+                complex_com = expand_by_split(root, quat_to_rot(quat_i), corr_i, order_i).trans
+            com_sec = del_com_j + com0 + quat_to_rot(quat_j) @ (complex_com - com0)
+            new_del = com_sec - complex_com
+            err = numpy.linalg.norm(order_i * (new_del - numpy.dot(new_del, axis_i) * axis_i))
+            if err > NCS_MAX_TRANS_ERR:
+                continue
+            score = ang + err
+            # same test as make_NCS.pl
+            if 2 * order_i > best_order or (order_j == best_order and best_score > score):
+                best_order, best_score, best_chain = 2 * order_i, score, [sec_i, sec_j]
+
+    symmtype = ("D" + str(best_order // 2)) if len(best_chain) == 2 else ("C" + str(best_order))
+    if symmtype == "C1":
+        messages.append(pdbfile + ": No symmetry found.")
+        return symmtype, None, messages
+    messages.append(pdbfile + ": Found " + symmtype + " symmetric complex!")
+
+    # symmetry operators of the best chains
+    quats, del_coms, sym_orders = [], [], []
+    for sec in best_chain:
+        if len(chains[chain]) != len(chains[sec]):
+            raise NcsError("Chains '" + chain + "' and '" + sec + "' have different residue counts ("
+                           + str(len(chains[chain])) + " vs " + str(len(chains[sec])) + ")")
+        k = secondary.index(sec)
+        sym_order, quat, _, omega = _fold(rots[k])
+        messages.append("Found " + str(sym_order) + "-fold (" + _fmt(math.pi / omega) + ") symmetric complex "
+                        + chain + ":" + sec)
+        quats.append(quat)
+        del_coms.append(coms[k] - com0)
+        sym_orders.append(sym_order)
+
+    # Dn symmetries need perpendicular axes, the Cn is expanded before the C2
+    if len(quats) == 2 and 2 in sym_orders:
+        x = _normalized(quats[0])
+        y = _normalized(quats[1])
+        xt = _normalized(x - numpy.dot(x, y) * y)
+        yt = _normalized(y - numpy.dot(x, y) * x)
+        x0 = (x + xt) / 2
+        y0 = (y + yt) / 2
+        sx = math.sqrt((1 - quats[0][3] ** 2) / numpy.dot(x0, x0))
+        sy = math.sqrt((1 - quats[1][3] ** 2) / numpy.dot(y0, y0))
+        quats = [tuple(x0 * sx) + (quats[0][3],), tuple(y0 * sy) + (quats[1][3],)]
+        if sym_orders[0] == 2 and sym_orders[1] != 2:
+            quats.reverse()
+            del_coms.reverse()
+            sym_orders.reverse()
+
+    # symmetry tree
+    tree = root
+    for i, (quat, del_com, sym_order) in enumerate(zip(quats, del_coms, sym_orders)):
+        rot = quat_to_rot(quat)
+        if i == 0:
+            com_sec = del_com + com0
+        else:
+            com_sec = del_com + com0 + rot @ (tree.trans - com0)
+        new_del = com_sec - tree.trans
+        err_pos = _cyclic_sum(rot, new_del, sym_order)
+        if i == 1 and len(quats) == 2:
+            axis = _normalized(quats[0])
+            err_pos = sym_order * (new_del - numpy.dot(new_del, axis) * axis)
+        tree = expand_by_split(tree, rot, new_del - err_pos / sym_order, sym_order)
+
+    # interfaces of the main chain, far away subunits are skipped
+    leaves = tree_leaves(tree)
+    trans = numpy.array([leaf.trans for leaf in leaves])
+    near = numpy.linalg.norm(trans - com0, axis=1) <= 2 * radius + distance
+    if fast:
+        contacts = [(0, k) for k in range(len(leaves)) if near[k]]
+    else:
+        xyz = ref + com0
+        contacts = []
+        for k, leaf in enumerate(leaves):
+            if not near[k]:
+                continue
+            other = ref @ leaf.rot.T + leaf.trans
+            first = _first_contact(xyz, other, distance, cKDTree(other) if cKDTree is not None else None)
+            if first is not None:
+                contacts.append((first, k))
+    # numbered in the order of the first contact as in the Perl loops
+    contacts.sort()
+    interfaces = {leaves[k].path: n for n, (_, k) in enumerate(contacts)}
+    syminterfaces = [leaves[k].path for _, k in contacts]
+    byname = {leaf.path: leaf for leaf in leaves}
+
+    # energy equation, pairs of inverse interfaces count twice
+    energy = {name: 1 for name in syminterfaces[1:]}
+    for i in range(1, len(syminterfaces)):
+        if syminterfaces[i] not in energy:
+            continue
+        ni = byname[syminterfaces[i]]
+        ti = ni.trans - com0
+        for j in range(i + 1, len(syminterfaces)):
+            nj = byname[syminterfaces[j]]
+            test_r = ni.rot @ nj.rot
+            test_t = nj.rot @ ti + nj.trans - com0
+            if (numpy.sum((test_r - numpy.identity(3)) ** 2) < NCS_TOLERANCE
+                    and numpy.sum(test_t ** 2) < NCS_TOLERANCE):
+                energy[syminterfaces[i]] = 2
+                energy.pop(syminterfaces[j], None)
+                break
+
+    # number of equivalent i->j interfaces of each 1->n interface
+    rots = numpy.array([leaf.rot for leaf in leaves])
+    rel = numpy.einsum('aij,bjk->abik', numpy.linalg.inv(rots), rots)
+    ii, jj = numpy.triu_indices(len(leaves), 1)
+    sel = ii >= 1
+    ii, jj = ii[sel], jj[sel]
+    for name in energy:
+        rn = byname[name].rot
+        same = ((numpy.sum((rel[ii, jj] - rn) ** 2, axis=(1, 2)) < NCS_TOLERANCE)
+                | (numpy.sum((rel[jj, ii] - rn) ** 2, axis=(1, 2)) < NCS_TOLERANCE))
+        energy[name] += int(numpy.count_nonzero(same))
+
+    # symmdef file
+    if outfile is None:
+        outfile = re.sub(r'\.pdb', '.symm', pdbfile, count=1)
+        if outfile == pdbfile:
+            outfile = pdbfile + ".symm"
+    levels = tree_paths_by_depth(tree)
+    vrt_lines, connect_lines, dof_lines = _fold_tree(tree, levels, interfaces)
+    base = "VRT" + syminterfaces[0] + "_base"
+    lines = ["symmetry_name " + re.sub(r'\.pdb$', '', pdbfile) + "_" + tree_topology(tree)]
+    lines.append("E = " + str(len(leaves)) + "*" + base
+                 + "".join(" + " + str(energy[name]) + "*(" + base + ":VRT" + name + "_base)"
+                           for name in syminterfaces[1:] if name in energy))
+    lines.append("anchor_residue COM")
+    lines.append("virtual_coordinates_start")
+    lines.extend(vrt_lines)
+    lines.append("virtual_coordinates_stop")
+    lines.extend(connect_lines)
+    lines.extend(dof_lines)
+    for depth, level in enumerate(levels):
+        if depth > 1:
+            lines.append("set_jump_group JUMPGROUP" + str(depth)
+                         + "".join(" JUMP" + path for path in level if path.endswith("_0")))
+    lines.append("set_jump_group JUMPGROUP" + str(len(levels))
+                 + "".join(" JUMP" + leaf.path + "_to_com" for leaf in leaves))
+    lines.append("set_jump_group JUMPGROUP" + str(len(levels) + 1)
+                 + "".join(" JUMP" + name + "_to_subunit" for name in syminterfaces))
+    with open(outfile, 'w', encoding='utf-8', newline='\n') as f:
+        f.write('\n'.join(lines) + '\n')
+    return symmtype, outfile, messages
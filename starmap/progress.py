@@ -0,0 +1,127 @@
+#
+# Copyright (c) 2024 by the Universitätsklinikum Hamburg-Eppendorf (UKE)
+# Written by Wolfgang Lugmayr <w.lugmayr@uke.de>
+#
+"""
+Progress of a Rosetta refinement from the written output models.
+"""
+
+# -----------------------------------------------------------------------------
+import os
+import re
+import time
+from PyQt5 import QtCore
+
+# backstop for file systems without change notification (e.g. network or WSL drives)
+PROGRESS_POLL_INTERVAL = 10000
+
+
+# -----------------------------------------------------------------------------
+class ModelProgress(QtCore.QObject):
+    """Counts the <prefix>_NNNN.pdb models written into a directory since the start.
+
+    The directory is watched with a QFileSystemWatcher, which uses inotify
+    on Linux, and additionally polled at a low rate.
+    """
+    progressChanged = QtCore.pyqtSignal(object)
+
+    # -------------------------------------------------------------------------
+    def __init__(self, directory, prefix, models, parent=None, interval=PROGRESS_POLL_INTERVAL):
+        """Init this instance"""
+        super(ModelProgress, self).__init__(parent)
+        self.directory = directory
+        self.pattern = re.compile('^' + re.escape(prefix) + r'_\d{4}\.pdb$')
+        self.models = models
+        self.done = 0
+        self.startTime = time.time()
+        self.lastTime = None
+        self.watcher = QtCore.QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.update)
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.update)
+        return
+
+    # -------------------------------------------------------------------------
+    def start(self):
+        """Starts watching the directory"""
+        self.startTime = time.time()
+        self.done = 0
+        self.lastTime = None
+        if not self.watcher.addPath(self.directory):
+            # no notification available, poll more often
+            self.timer.setInterval(max(1000, self.timer.interval() // 5))
+        self.timer.start()
+        return
+
+    # -------------------------------------------------------------------------
+    def stop(self):
+        """Stops watching the directory"""
+        self.timer.stop()
+        if self.watcher.directories():
+            self.watcher.removePaths(self.watcher.directories())
+        return
+
+    # -------------------------------------------------------------------------
+    def is_active(self):
+        """Returns True while the directory is watched"""
+        return self.timer.isActive()
+
+    # -------------------------------------------------------------------------
+    def count_models(self):
+        """Returns the number of models written since the start"""
+        count = 0
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    # models of earlier runs are overwritten, so only new files count
+                    if self.pattern.match(entry.name) and entry.stat().st_mtime >= self.startTime - 1:
+                        count += 1
+        except OSError:
+            return self.done
+        return count
+
+    # -------------------------------------------------------------------------
+    def update(self, path=None):
+        """Counts the models and reports a changed count"""
+        count = min(self.count_models(), self.models)
+        if count != self.done:
+            if count > self.done:
+                self.lastTime = time.time()
+            self.done = count
+            self.progressChanged.emit(self)
+        if self.done >= self.models:
+            self.stop()
+        return
+
+    # -------------------------------------------------------------------------
+    def percent(self):
+        """Returns the finished models in percent"""
+        if self.models < 1:
+            return 100
+        return int(100 * self.done / self.models)
+
+    # -------------------------------------------------------------------------
+    def remaining(self):
+        """Returns the estimated seconds until all models are written or None"""
+        if not self.done or not self.lastTime:
+            return None
+        perModel = (self.lastTime - self.startTime) / self.done
+        return int(max(0, perModel * (self.models - self.done) - (time.time() - self.lastTime)))
+
+    # -------------------------------------------------------------------------
+    def status_line(self):
+        """Returns the progress as single line"""
+        s = "Models " + str(self.done) + "/" + str(self.models) + " written"
+        remaining = self.remaining()
+        if remaining is not None and self.done < self.models:
+            s += ", about " + format_duration(remaining) + " remaining"
+        return s
+
+
+# -----------------------------------------------------------------------------
+def format_duration(seconds):
+    """Returns the seconds as h:mm:ss"""
+    m, s = divmod(int(seconds), 60)
+    h, m = divmod(m, 60)
+    return "%d:%02d:%02d" % (h, m, s)
@@ -889,6 +889,9 @@ class Ui_qtStarMapWidget(object):
         self.logStderrButton = QtWidgets.QPushButton(self.logTab)
         self.logStderrButton.setGeometry(QtCore.QRect(410, 10, 82, 23))
         self.logStderrButton.setObjectName("logStderrButton")
+        self.logJobsButton = QtWidgets.QPushButton(self.logTab)
+        self.logJobsButton.setGeometry(QtCore.QRect(230, 10, 82, 23))
+        self.logJobsButton.setObjectName("logJobsButton")
         self.logViewEdit = QtWidgets.QTextEdit(self.logTab)
         self.logViewEdit.setGeometry(QtCore.QRect(10, 40, 521, 461))
         self.logViewEdit.setObjectName("logViewEdit")
@@ -896,7 +899,7 @@ class Ui_qtStarMapWidget(object):
         self.logHelpButton.setGeometry(QtCore.QRect(500, 10, 31, 23))
         self.logHelpButton.setObjectName("logHelpButton")
         self.logTextLabel = QtWidgets.QLabel(self.logTab)
-        self.logTextLabel.setGeometry(QtCore.QRect(10, 10, 291, 21))
+        self.logTextLabel.setGeometry(QtCore.QRect(10, 10, 211, 21))
         self.logTextLabel.setObjectName("logTextLabel")
         self.tabWidget.addTab(self.logTab, "")
 
@@ -1264,6 +1267,8 @@ class Ui_qtStarMapWidget(object):
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab), _translate("qtStarMapWidget", "Apix"))
         self.logStdoutButton.setText(_translate("qtStarMapWidget", "stdout"))
         self.logStderrButton.setText(_translate("qtStarMapWidget", "stderr"))
+        self.logJobsButton.setToolTip(_translate("qtStarMapWidget", "Show the state of all started jobs"))
+        self.logJobsButton.setText(_translate("qtStarMapWidget", "jobs"))
         self.logHelpButton.setToolTip(_translate("qtStarMapWidget", "Show help"))
         self.logHelpButton.setText(_translate("qtStarMapWidget", "?"))
         self.logTextLabel.setText(_translate("qtStarMapWidget", "Press button to refresh log"))
@@ -0,0 +1,89 @@
+#
+# Copyright (c) 2024 by the Universitätsklinikum Hamburg-Eppendorf (UKE)
+# Written by Wolfgang Lugmayr <w.lugmayr@uke.de>
+#
+"""
+Ranking of the Rosetta result PDBs by the FSC value written at their end.
+"""
+
+# -----------------------------------------------------------------------------
+import os
+import re
+import csv
+from concurrent.futures import ThreadPoolExecutor
+
+RESULT_PREFIX = "starmap_result"
+RANKING_CSV = RESULT_PREFIX + "_ranking.csv"
+SCORE_LINE_TAG = b"mask"
+# the score lines are behind the coordinates, the tail is read in growing blocks
+TAIL_BLOCK_SIZE = 65536
+RANKING_WORKERS = 8
+
+
+# -----------------------------------------------------------------------------
+def read_score_line(filename, tag=SCORE_LINE_TAG, blocksize=TAIL_BLOCK_SIZE):
+    """Returns the first line containing the tag in the trailing block of the file or None"""
+    with open(filename, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        start = size
+        while start > 0:
+            start = max(0, size - blocksize)
+            f.seek(start)
+            data = f.read(size - start)
+            # the first line of a block may be cut, unless the block starts the file
+            lines = data.split(b'\n')
+            if start > 0:
+                lines = lines[1:]
+            for line in lines:
+                if tag in line:
+                    return line.decode('utf-8', errors='replace')
+            blocksize *= 4
+    return None
+
+
+# -----------------------------------------------------------------------------
+def score_value(line):
+    """Returns the FSC value, the 5th field of the score line, or None"""
+    if line is None:
+        return None
+    fields = line.split()
+    if len(fields) < 5:
+        return None
+    try:
+        return float(fields[4])
+    except ValueError:
+        return None
+
+
+# -----------------------------------------------------------------------------
+def result_models(prefix, directory="."):
+    """Returns the Rosetta output PDBs <prefix>_NNNN.pdb in the directory"""
+    pattern = re.compile('^' + re.escape(prefix) + r'_.{4}\.pdb$')
+    return sorted(name for name in os.listdir(directory)
+                  if pattern.match(name) and not name.startswith(RESULT_PREFIX))
+
+
+# -----------------------------------------------------------------------------
+def rank_models(filenames, workers=RANKING_WORKERS):
+    """Returns (filename, value) sorted by descending value, models without value last"""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        values = list(executor.map(lambda name: score_value(read_score_line(name)), filenames))
+    ranked = list(zip(filenames, values))
+    # stable for equal values and independent of the file system order
+    ranked.sort(key=lambda r: (r[1] is None, -(r[1] or 0.0), r[0]))
+    return ranked
+
+
+# -----------------------------------------------------------------------------
+def rename_ranked(ranked, directory="."):
+    """Renames the ranked models to starmap_result_NNNN.pdb and writes the ranking table"""
+    rows = []
+    for i, (name, value) in enumerate(ranked, 1):
+        result = RESULT_PREFIX + "_" + "%04d" % i + ".pdb"
+        os.replace(os.path.join(directory, name), os.path.join(directory, result))
+        rows.append((i, result, name, value))
+    with open(os.path.join(directory, RANKING_CSV), 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(("rank", "result", "model", "fsc"))
+        writer.writerows(rows)
+    return rows
@@ -1,16 +1,18 @@
 #!/bin/env python
 #
-# Copyright (c) 2013-2022 by the Universitätsklinikum Hamburg-Eppendorf (UKE)
+# Copyright (c) 2013-2024 by the Universitätsklinikum Hamburg-Eppendorf (UKE)
 # Written by Wolfgang Lugmayr <w.lugmayr@uke.de>
 #
 """
-PyParsing definition of the Rosetta scripts xml structure and the
+Element tree model of the Rosetta scripts xml structure and the
 corresponding handler.
 """
 
 # -----------------------------------------------------------------------------
+import re
 import sys
-from pyparsing import Literal, QuotedString, Word, Group, ZeroOrMore, Forward, OneOrMore, alphanums, ParseException
+import xml.etree.ElementTree as ET
+from copy import deepcopy
 
 # -----------------------------------------------------------------------------
 grammar = """
@@ -20,256 +22,282 @@ Name := (string without whitespace)
 Value := (string without whitespace) | "(string with whitespace)"
 """
 
-# basic definitions
-startLiteral = Literal("<").suppress()
-endLiteral = Literal(">").suppress()
-slashLiteral = Literal("/").suppress()
-equalsLiteral = Literal("=") #.suppress()
-qString = QuotedString(quoteChar='"', multiline=False)
+# one token per tag, comments and declarations are skipped
+_TAG_RE = re.compile(r'<!--.*?-->|<\?.*?\?>|<(/?)\s*(\w+)((?:\s+\w+\s*=\s*(?:"[^"\n]*"|[\w.%]+))*)\s*(/?)>', re.S)
+_OPTION_RE = re.compile(r'(\w+)\s*=\s*(?:"([^"\n]*)"|([\w.%]+))')
 
-# simple definitions
-name = Word(alphanums + "_")
-v = Word(alphanums + "_" + "." + "%") | qString
-option = Group(name + equalsLiteral + v)
-optionStar = ZeroOrMore(option)
-
-# complex recursive tags
-tagStar = Forward()
-longTag = startLiteral + name + optionStar + endLiteral + ZeroOrMore(tagStar) + startLiteral + slashLiteral + name + endLiteral
-shortTag = startLiteral + name + optionStar + slashLiteral + endLiteral
-tagStar << Group(longTag | shortTag)
-script = OneOrMore(longTag | shortTag)
-
-
-# -----------------------------------------------------------------------------
-# global variables
-scriptStr = ""
-subTags = []
-valueList = []
-tagName = ""
-tagList = []
-
-
-
-# -----------------------------------------------------------------------------
-def reset():
-    """Reset the values to initial value"""
-    global scriptStr, subTags, valueList, tagName
-    scriptStr = ""
-    subTags = []
-    valueList = []
-    tagName = ""
-
-
-# -----------------------------------------------------------------------------
-def cleanupList(l):
-    """Removes empty list entries"""
-    l[:] = [t for t in l if t]
-    for t in l:
-        if isinstance(t, list):
-            cleanupList(t)
+# task indices of the StarMap user interface
+TASK_FULL_REBUILD = 0
+TASK_MINIMUM_REBUILD = 1
+TASK_REFINEMENT_ONLY = 2
+TASK_TORSION_REFINEMENT = 3
 
 
 # -----------------------------------------------------------------------------
-def appendOption(optList):
-    """Reorder options in list"""
-    if len(optList) == 3 and optList[1] == '=':
-        return " " + optList[0] + optList[1] + '"' + optList[2] + '"'
-    return ""
+class RosettaScriptError(ValueError):
+    """Raised if a Rosetta script does not match the grammar"""
 
-
-# -----------------------------------------------------------------------------
-def asTabbedList(l, indent=0):
-    """Print as characters list with tab intends"""
-    for t in l:
-        if isinstance(t, str):
-            print('\t' * indent + str(t))
-        elif len(t) == 3 and t[1] == '=':
-            print('\t' * indent + appendOption(t))
-        elif isinstance(t, list):
-            asTabbedList(t, indent+1)
+    # -------------------------------------------------------------------------
+    def __init__(self, msg, text="", pos=0):
+        """Init this instance"""
+        self.lineno = text.count('\n', 0, pos) + 1
+        super(RosettaScriptError, self).__init__(msg + " (line " + str(self.lineno) + ")")
 
 
 # -----------------------------------------------------------------------------
-def asXmlList(l, hasOptions=False, indent=0):
-    """Print as characters list with XML and space intends"""
-    global scriptStr
-    endNameTag = ""
-    printedTag = 0
-    closeTag = False
-
-    for t in l:
-        # <tag></tag>
-        if isinstance(t, str) and l.count(t) == 2:
-            if printedTag < 1:
-                if not hasOptions:
-                    scriptStr += '\t' * indent + "<" + str(t) + ">\n"
-                else:
-                    scriptStr += '\t' * indent + "<" + str(t)
-                    closeTag = True
-            elif printedTag < 2:
-                scriptStr += '\t' * indent + "</" + str(endNameTag) + ">\n"
-            endNameTag = t
-            printedTag += 1
-        elif isinstance(t, str) and l.count(t) == 1:
-            scriptStr += '\t' * indent + "<" + str(t)
-        elif len(t) == 3 and t[1] == '=':
-            scriptStr += appendOption(t)
-        elif closeTag:
-            scriptStr += ">\n"
-            closeTag = False
-            hasOptions = False
-            if isinstance(t, list) and (len(t) >= 2 and t[1][1] == '='):
-                asXmlList(t, True, indent+1)
-            else:
-                asXmlList(t, False, indent+1)
-        elif isinstance(t, list) and (len(t) >= 2 and t[1][1] == '='):
-            asXmlList(t, True, indent+1)
+def parse_string(text):
+    """Parses the script text into a list of top level elements"""
+    roots = []
+    stack = []
+    pos = 0
+    for m in _TAG_RE.finditer(text):
+        if text[pos:m.start()].strip():
+            raise RosettaScriptError("Unexpected text", text, pos)
+        pos = m.end()
+        if m.group(2) is None:
+            continue
+        closing, name, options, short = m.group(1, 2, 3, 4)
+        if closing:
+            if options or short or not stack or stack[-1].tag != name:
+                raise RosettaScriptError("Unexpected closing tag </" + name + ">", text, m.start())
+            stack.pop()
+            continue
+        elem = ET.Element(name)
+        for o in _OPTION_RE.finditer(options):
+            elem.set(o.group(1), o.group(2) if o.group(2) is not None else o.group(3))
+        if stack:
+            stack[-1].append(elem)
         else:
-            asXmlList(t, False, indent+1)
-
-    if hasOptions:
-        scriptStr += "/>\n"
-
-    return scriptStr
-
-
-# -----------------------------------------------------------------------------
-def removeXmlTagByName(l, tagName):
-    """Removes the given XML tag by its name tag"""
-    for t in l:
-        if isinstance(t, str) and t == tagName:
-            # print(l[:])
-            # FastRelax relax must always be in the XML file for torsion refinement
-            if t == 'FastRelax' and len(l) == 6:
-                return
-            del l[:]
-        elif isinstance(t, list):
-            removeXmlTagByName(t, tagName)
-
-
-# -----------------------------------------------------------------------------
-def removeXmlTagByValueName(l, valueName):
-    """Removes the given XML tag by its value tag"""
-    global tagName, tagList
-    for t in l:
-        if isinstance(t, str) and t == valueName and l[0] == "name":
-            #print "tag=" + tagName + " value=" + t
-            del tagList[:]
-        elif isinstance(t, list):
-            tagName = l[0]
-            tagList = l
-            removeXmlTagByValueName(t, valueName)
-
-
-# -----------------------------------------------------------------------------
-def removeMoverByName(l, nameList):
-    """Removes a Rosetta script mover by its name tag"""
-    for t in l:
-        if isinstance(t, list) and len(t) == 2:
-            if isinstance(t[0], str) and t[0] == "Add":
-                #print t
-                if len(t[1]) == 3 and t[1][1] == '=' and t[1][0] == "mover":
-                    if t[1][2] == nameList:
-                        #print t[1][2]
-                        del t[:]
-        elif isinstance(t, list):
-            removeMoverByName(t, nameList)
-
-
-# -----------------------------------------------------------------------------
-def removeTagAndMoverByTagName(l, tag):
-    """Removes a Rosetta script mover and the given XML tag by its name tag"""
-    reset()
-    getTagsByTagName(l, tag)
-    #print subTags
-    getValueList(subTags, "name")
-    #print valueList
-    removeXmlTagByName(l, tag)
-    for i in range(len(valueList)):
-        removeMoverByName(l, valueList[i])
-    return
+            roots.append(elem)
+        if not short:
+            # long form is kept even without children
+            elem.text = ""
+            stack.append(elem)
+    if text[pos:].strip():
+        raise RosettaScriptError("Unexpected text", text, pos)
+    if stack:
+        raise RosettaScriptError("Missing closing tag </" + stack[-1].tag + ">", text, len(text))
+    if not roots:
+        raise RosettaScriptError("No tags found", text, 0)
+    return roots
 
 
 # -----------------------------------------------------------------------------
-def removeTagAndMoverByValueName(l, valueName):
-    """Removes a Rosetta script mover and the given XML tag by its value tag"""
-    reset()
-    removeXmlTagByValueName(l, valueName)
-    removeMoverByName(l, valueName)
-    cleanupList(l)
-    return
+def parse_file(filename):
+    """Parses the given Rosetta script file"""
+    with open(filename, 'r', encoding='utf-8') as f:
+        return RosettaScript(parse_string(f.read()))
 
 
 # -----------------------------------------------------------------------------
-def getTagsByTagName(l, tag):
-    """Returns all tags with the given name"""
-    for t in l:
-        if isinstance(t, str) and t == tag:
-            global subTags
-            subTags.append(l[:])
-        elif isinstance(t, list):
-            getTagsByTagName(t, tag)
+def load_file(filename):
+    """Returns an editable copy of the given Rosetta script, the parsed files are cached"""
+    # imported here, the module also runs standalone from the command line
+    from .tmplcache import template_cache
+    return template_cache.get(filename, parse_file).copy()
 
 
 # -----------------------------------------------------------------------------
-def getValueList(l, name):
-    """Returns all values with the given name"""
-    for t in l:
-        if len(t) == 3 and t[1] == '=' and t[0] == name:
-            global valueList
-            valueList.append(t[2])
-        elif isinstance(t, list):
-            getValueList(t, name)
+class RosettaScript:
+    """Rosetta script as element tree with an index by tag, name and mover"""
+
+    # -------------------------------------------------------------------------
+    def __init__(self, roots):
+        """Init this instance"""
+        self.roots = roots
+        self.parents = {}
+        self.byTag = {}
+        self.byName = {}
+        self.byMover = {}
+        for elem in roots:
+            self._index(elem, None)
+        return
+
+    # -------------------------------------------------------------------------
+    def copy(self):
+        """Returns an independent copy for editing"""
+        return RosettaScript([deepcopy(elem) for elem in self.roots])
+
+    # -------------------------------------------------------------------------
+    def _index(self, elem, parent):
+        """Adds the element and its children to the lookup tables"""
+        self.parents[elem] = parent
+        self.byTag.setdefault(elem.tag, []).append(elem)
+        if "name" in elem.attrib:
+            self.byName.setdefault(elem.get("name"), []).append(elem)
+        if elem.tag == "Add" and list(elem.attrib) == ["mover"] and elem.text is None:
+            self.byMover.setdefault(elem.get("mover"), []).append(elem)
+        for child in elem:
+            self._index(child, elem)
+        return
+
+    # -------------------------------------------------------------------------
+    def _remove(self, elem):
+        """Removes the element from its parent and the element with its children from the lookup tables"""
+        parent = self.parents.get(elem)
+        if parent is not None:
+            parent.remove(elem)
+        elif elem in self.roots:
+            self.roots.remove(elem)
+        for e in elem.iter():
+            self.parents.pop(e, None)
+            self.byTag[e.tag].remove(e)
+            if "name" in e.attrib:
+                self.byName[e.get("name")].remove(e)
+            if e in self.byMover.get(e.get("mover"), []):
+                self.byMover[e.get("mover")].remove(e)
+        return
+
+    # -------------------------------------------------------------------------
+    def remove_movers(self, name):
+        """Removes all protocol entries <Add mover=name/>"""
+        for elem in list(self.byMover.get(name, [])):
+            self._remove(elem)
+        return
+
+    # -------------------------------------------------------------------------
+    def remove_tag_and_movers(self, tag):
+        """Removes all tags with the given tag name and their movers"""
+        elems = list(self.byTag.get(tag, []))
+        names = [e.get("name") for elem in elems for e in elem.iter() if "name" in e.attrib]
+        for elem in elems:
+            # FastRelax relax must always be in the XML file for torsion refinement
+            if tag == 'FastRelax' and len(elem.attrib) == 5 and elem.text is None:
+                continue
+            if elem in self.parents:
+                self._remove(elem)
+        for name in names:
+            self.remove_movers(name)
+        return
+
+    # -------------------------------------------------------------------------
+    def remove_name_and_movers(self, name):
+        """Removes all tags with the given name value and their movers"""
+        for elem in list(self.byName.get(name, [])):
+            if elem in self.parents:
+                self._remove(elem)
+        self.remove_movers(name)
+        return
+
+    # -------------------------------------------------------------------------
+    def set_rebuilding_residues(self, tag, residues):
+        """Sets the residues of the given tags with user defined rebuilding strategy"""
+        for elem in self.byTag.get(tag, []):
+            if elem.get("strategy") == "user" or "residues" in elem.attrib:
+                elem.set("residues", residues)
+        return
+
+    # -------------------------------------------------------------------------
+    def as_xml(self):
+        """Returns the script as XML with tab intends"""
+        lines = []
+        for elem in self.roots:
+            _append_xml(lines, elem, 0)
+        return ''.join(lines)
 
 
 # -----------------------------------------------------------------------------
-def stripTagToNameValue(l, tag):
-    """Removes all value entries except the name value of a given tag"""
-    for t in l:
-        #print t
-        if isinstance(t, list) and len(t) > 1:
-            if isinstance(t[0], str) and t[0] == tag:
-                for i in range(1, len(t)):
-                    if t[i][0] != "name":
-                        #print t[i]
-                        del t[i]
-            stripTagToNameValue(t, tag)
-        elif isinstance(t, list):
-            stripTagToNameValue(t, tag)
+class RosettaScriptEditor:
+    """Applies the StarMap options to Rosetta script templates.
+
+    An editor only holds its option values, so variants can be generated
+    with different editors in parallel threads or processes.
+    """
+
+    # -------------------------------------------------------------------------
+    def __init__(self, residueCount=0, symmetry=False, constraints=False, halfMapValidation=False, userResidues=None, task=TASK_FULL_REBUILD):
+        """Init this instance"""
+        self.residueCount = residueCount
+        self.symmetry = symmetry
+        self.constraints = constraints
+        self.halfMapValidation = halfMapValidation
+        self.userResidues = userResidues
+        self.task = task
+        return
+
+    # -------------------------------------------------------------------------
+    def edit(self, script):
+        """Removes and replaces the tags of the parsed script for the options"""
+        # TODO handle residues > 800
+        if self.residueCount < 800:
+            script.remove_tag_and_movers("LocalRelax")
+        else:
+            script.remove_tag_and_movers("FastRelax")
 
-    return
+        # handle symmetry check and setup
+        if not self.symmetry:
+            script.remove_tag_and_movers("SetupForSymmetry")
+            script.remove_tag_and_movers("SymMinMover")
+        else:
+            script.remove_tag_and_movers("SetupForDensityScoring")
+            script.remove_tag_and_movers("MinMover")
 
+        # remove constraints
+        if not self.constraints:
+            script.remove_tag_and_movers("ConstraintSetMover")
 
-# -----------------------------------------------------------------------------
-def replaceUserDefinedRebuildingValues(l, tag, residues):
-    """Replaces Rosetta script values by the given ones"""
-    for t in l:
-        if isinstance(t, str) and t == tag:
-            c = 0
-            for x in l:
-                if isinstance(x, list):
-                    c += 1
-                    if len(x) == 3 and x[0] == "strategy" and x[2] == "user":
-                        #x[2] = "user"
-                        l.append(['residues', '=', residues])
-                    elif len(x) == 3 and x[0] == "residues":
-                        x[2] = residues
-        elif isinstance(t, list):
-            replaceUserDefinedRebuildingValues(t, tag, residues)
+        # handle model evaluation
+        if self.halfMapValidation:
+            script.remove_name_and_movers("reportFSC")
+        else:
+            script.remove_name_and_movers("reportFSC_withtest")
+
+        # handle user defined rebuilding strategy
+        if self.userResidues is not None:
+            script.set_rebuilding_residues("CartesianSampler", self.userResidues)
+
+        # full rebuild task
+        # -- default
+
+        # minimum rebuild task
+        if self.task == TASK_MINIMUM_REBUILD:
+            for name in ("cen5_50", "cen5_60", "cen5_70"):
+                script.remove_name_and_movers(name)
+
+        # refinement only tasks
+        if self.task == TASK_REFINEMENT_ONLY or self.task == TASK_TORSION_REFINEMENT:
+            for name in ("cen5_50", "cen5_60", "cen5_70", "cen5_80", "cen5_rama"):
+                script.remove_name_and_movers(name)
+        return script
+
+    # -------------------------------------------------------------------------
+    def as_xml(self, script):
+        """Returns the edited script as XML"""
+        s = self.edit(script).as_xml()
+        # torsion refinement
+        if self.task == TASK_TORSION_REFINEMENT:
+            s = s.replace("mover=\"relaxcart\"", "mover=\"relax\"", 9)
+        return s
+
+    # -------------------------------------------------------------------------
+    def edit_file(self, filename):
+        """Reads the given template and returns the edited XML"""
+        return self.as_xml(load_file(filename))
+
+    # -------------------------------------------------------------------------
+    def edit_string(self, text):
+        """Parses the given script text and returns the edited XML"""
+        return self.as_xml(RosettaScript(parse_string(text)))
 
 
 # -----------------------------------------------------------------------------
-def doRefinementOnly(l):
-    """Removes the movers to do Rosetta refinement only"""
-    removeTagAndMoverByTagName(l, "CartesianSampler")
-    cleanupList(l)
+def _append_xml(lines, elem, indent):
+    """Appends the element and its children as XML lines"""
+    s = '\t' * indent + "<" + elem.tag
+    for k, v in elem.attrib.items():
+        s += " " + k + '="' + v + '"'
+    if len(elem) == 0 and elem.text is None:
+        lines.append(s + "/>\n")
+        return
+    lines.append(s + ">\n")
+    for child in elem:
+        _append_xml(lines, child, indent+1)
+    lines.append('\t' * indent + "</" + elem.tag + ">\n")
     return
 
 
 # -----------------------------------------------------------------------------
 if __name__ == "__main__":
-    #from __future__ import print_function
 
     if not len(sys.argv) > 1:
         print(__doc__)
@@ -277,23 +305,12 @@ if __name__ == "__main__":
 
     infileName = sys.argv[1]
     try:
-        parsedScript = script.parseFile(infileName)
-        #print parsedScript
-        #print(asXmlList(parsedScript.asList()))
-
-        tmpList = parsedScript.asList()
-        #doRefinementOnly(tmpList)
-        #doUserDefinedRebuilding(tmpList, "22A-36A,56B-77B")
-        #removeXmlTagByValueName(tmpList, "reportFSC")
-        #cleanupList(tmpList)
-        #print tmpList
-        removeTagAndMoverByTagName(tmpList, "FastRelax")
-        cleanupList(tmpList)
-
-        #print asTabbedList(tmpList)
-        print(asXmlList(tmpList))
-
-    except ParseException as err:
-        print(err.line)
-        print(" "*(err.column-1) + "^")
+        parsedScript = parse_file(infileName)
+        #parsedScript.remove_tag_and_movers("CartesianSampler")
+        #parsedScript.set_rebuilding_residues("CartesianSampler", "22A-36A,56B-77B")
+        #parsedScript.remove_name_and_movers("reportFSC")
+        parsedScript.remove_tag_and_movers("FastRelax")
+        print(parsedScript.as_xml())
+
+    except RosettaScriptError as err:
         print(err)
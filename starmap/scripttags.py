@@ -0,0 +1,32 @@
+#
+# Copyright (c) 2024 by the Universitätsklinikum Hamburg-Eppendorf (UKE)
+# Written by Wolfgang Lugmayr <w.lugmayr@uke.de>
+#
+"""
+Replacement of the @@TAG@@ placeholders in the script templates.
+"""
+
+# -----------------------------------------------------------------------------
+import re
+
+TAG_RE = re.compile(r'@@(\w+?)@@')
+
+# placeholders which may stay in a generated script on purpose
+IGNORED_TAGS = ("XML_TAG_WILL_BE_DELETED", "RUN_SYMMETRY_COMMANDLINE")
+
+
+# -----------------------------------------------------------------------------
+def replace_tags(text, values):
+    """Replaces all known tags in one pass, returns the text and the names of the unknown tags"""
+    unknown = []
+
+    def _value(m):
+        """Returns the replacement of one tag"""
+        value = values.get(m.group(1))
+        if value is None:
+            if m.group(1) not in IGNORED_TAGS and m.group(1) not in unknown:
+                unknown.append(m.group(1))
+            return m.group(0)
+        return str(value)
+
+    return TAG_RE.sub(_value, text), unknown
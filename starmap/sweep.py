@@ -0,0 +1,71 @@
+#
+# Copyright (c) 2024 by the Universitätsklinikum Hamburg-Eppendorf (UKE)
+# Written by Wolfgang Lugmayr <w.lugmayr@uke.de>
+#
+"""
+Parameter ranges of the stmsweep command.
+"""
+
+# -----------------------------------------------------------------------------
+import re
+import itertools
+
+SWEEP_KEYS = ("mapres", "weights", "task", "models")
+SWEEP_DIR = "starmap_sweep"
+
+_RANGE_RE = re.compile(r'^(-?\d+)\.\.(-?\d+)$')
+
+
+# -----------------------------------------------------------------------------
+def expand_values(text):
+    """Returns the values of a comma separated list, a..b is an integer range"""
+    values = []
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        m = _RANGE_RE.match(item)
+        if m:
+            start, end = int(m.group(1)), int(m.group(2))
+            step = 1 if end >= start else -1
+            values += [str(i) for i in range(start, end + step, step)]
+        else:
+            values.append(item)
+    return values
+
+
+# -----------------------------------------------------------------------------
+def parse_sweep_spec(spec):
+    """Returns the parameter values by name and the output directory of e.g. 'mapres=3.2,3.4 task=0..3'"""
+    params = {}
+    outdir = SWEEP_DIR
+    for tok in spec.split():
+        if '=' not in tok:
+            raise ValueError("expected name=values instead of: " + tok)
+        name, text = tok.split('=', 1)
+        if name == "dir":
+            outdir = text
+            continue
+        if name not in SWEEP_KEYS:
+            raise ValueError("unknown sweep parameter: " + name + " (use " + ", ".join(SWEEP_KEYS) + " or dir)")
+        values = expand_values(text)
+        if not values:
+            raise ValueError("no values given for: " + name)
+        params[name] = values
+    if not params:
+        raise ValueError("no sweep parameters given")
+    return params, outdir
+
+
+# -----------------------------------------------------------------------------
+def sweep_variants(params):
+    """Returns all combinations of the parameter values"""
+    names = list(params)
+    return [dict(zip(names, values)) for values in itertools.product(*params.values())]
+
+
+# -----------------------------------------------------------------------------
+def variant_dirname(variant):
+    """Returns a directory name describing the parameter values"""
+    name = '_'.join(k + '-' + v for k, v in variant.items())
+    return re.sub(r'[^\w.+-]', '-', name)
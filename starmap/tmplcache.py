@@ -0,0 +1,74 @@
+#
+# Copyright (c) 2024 by the Universitätsklinikum Hamburg-Eppendorf (UKE)
+# Written by Wolfgang Lugmayr <w.lugmayr@uke.de>
+#
+"""
+In-process cache of read and parsed template files.
+"""
+
+# -----------------------------------------------------------------------------
+import os
+import threading
+from collections import OrderedDict
+
+TEMPLATE_CACHE_SIZE = 16
+
+
+# -----------------------------------------------------------------------------
+class TemplateCache:
+    """LRU cache of loaded files keyed by path, modification time and size"""
+
+    # -------------------------------------------------------------------------
+    def __init__(self, maxsize=TEMPLATE_CACHE_SIZE):
+        """Init this instance"""
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        return
+
+    # -------------------------------------------------------------------------
+    def get(self, filename, loader):
+        """Returns the cached loader result for the file or loads it"""
+        path = os.path.realpath(filename)
+        st = os.stat(path)
+        key = (path, loader, st.st_mtime_ns, st.st_size)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+
+        value = loader(path)
+        with self.lock:
+            for old in [k for k in self.entries if k[0] == path and k[1] == loader]:
+                del self.entries[old]
+            self.entries[key] = value
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return value
+
+    # -------------------------------------------------------------------------
+    def text(self, filename):
+        """Returns the content of the text file"""
+        return self.get(filename, read_text)
+
+    # -------------------------------------------------------------------------
+    def clear(self):
+        """Removes all cached files"""
+        with self.lock:
+            self.entries.clear()
+        return
+
+
+# -----------------------------------------------------------------------------
+def read_text(filename):
+    """Reads the whole text file"""
+    with open(filename, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+# -----------------------------------------------------------------------------
+template_cache = TemplateCache()
@@ -10,14 +10,10 @@ Handle the StarMap user interface.
 import os
 import platform
 import stat
-import threading
 import subprocess
 import string
 import random
-from shutil import copyfile
-import numpy
 import pyqtgraph.exporters
-from pyparsing import ParseException
 from PyQt5 import QtCore, QtWidgets, QtGui
 from PyQt5.Qt import QIntValidator, QDoubleValidator
 #from PyQt6 import QtCore, QtWidgets, QtGui
@@ -27,11 +23,26 @@ from chimerax.ui.gui import MainToolWindow
 from chimerax.core.commands import run
 from chimerax.core.models import Model
 from .qtstarmapwidget import Ui_qtStarMapWidget
-from .rosettascripts import cleanupList, asXmlList, removeTagAndMoverByTagName, removeTagAndMoverByValueName, replaceUserDefinedRebuildingValues, script, reset
-from .config import wsl_cmd_wrapper, data_location, check_config, check_rosetta_cmd
-from .config import STARMAP_USER_ENV, STARMAP_TEMPLATES_DIR, STARMAP_SYMMETRY_CMD, STARMAP_ROSETTA_SCRIPT, STARMAP_ROSETTA_APIX_SCRIPT
-from .config import ROSETTA_SCRIPTS_CMD, ROSETTA_SCRIPTS_MPI_CMD, ROSETTA_DENSITY_CMD, ROSETTA_SYMMDEF_CMD
+from .rosettascripts import load_file, RosettaScriptEditor, RosettaScriptError
+from .tmplcache import template_cache
+from .scripttags import replace_tags
+from .sweep import parse_sweep_spec, sweep_variants, variant_dirname
+from . import config
+from .config import wsl_cmd_wrapper, data_location, check_config
+from .config import STARMAP_USER_ENV, STARMAP_TEMPLATES_DIR, STARMAP_ROSETTA_SCRIPT, STARMAP_ROSETTA_APIX_SCRIPT
 from .medic import MedicSummaryPopupWindow, MEDIC_SCRIPT_TEMPLATE, MEDIC_SUMMARY
+from .jobs import JobRunner, StarMapJob, ModelPool, POOL_TEMPLATE_SUFFIX, JOB_RUNNING
+from .analysis import StarMapAnalysisResult, ZSCORE_ATTRIBUTES, write_veusz
+from .logtail import LogTail, LOG_TAIL_LINES
+from .progress import ModelProgress
+from .mrcheader import check_map, compare_maps, MrcHeaderError
+from .mapcrop import crop_map_to_pdb, cropped_map_name, CROP_PADDING
+from .analysiscache import AnalysisCache, analysis_key, cmd_identity
+from .ranking import result_models, rank_models, rename_ranked, RANKING_CSV, RESULT_PREFIX
+from .modelanalysis import result_pdbs, run_parallel, model_summary, write_analysis_table, format_analysis_table, ANALYSIS_TABLE
+from .modelanalysis import DENSITY_FSC_OPTIONS, DENSITY_PERRES_OPTIONS
+from .ncs import make_ncs, parse_ncs_options
+from .coloring import register_residue_attributes, find_structures, assign_residue_attributes, color_by_attribute
 
 
 _translate = QtCore.QCoreApplication.translate
@@ -41,43 +52,7 @@ TASK_MINIMUM_REBUILD = 'Minimum rebuild'
 TASK_REFINEMENT_ONLY = 'Refinement only'
 TASK_TORSIAN_REFINEMENT = 'Torsion refine'
 
-
-# -----------------------------------------------------------------------------
-class ExternalBashThread(threading.Thread):
-    """Background execution"""
-
-    # -------------------------------------------------------------------------
-    def __init__(self):
-        """Init this instance"""
-        self.cmd = None
-        self.stdout = None
-        self.stderr = None
-        threading.Thread.__init__(self)
-        return
-
-    # -------------------------------------------------------------------------
-    def set_script(self, cmd="", submit=""):
-        """Set the commandline to execute"""
-        self.cmd = cmd
-        self.stdout = cmd.rsplit(".", 1)[0]  + ".out"
-        self.stderr = cmd.rsplit(".", 1)[0]  + ".err"
-        self.cmd = wsl_cmd_wrapper(cmd, True)
-        if submit:
-            self.cmd = submit + ' ' + self.cmd
-        # TODO comment debugfile below
-        #debugfile = cmd.rsplit(".", 1)[0]  + ".cmd"
-        #with open(debugfile, 'w', encoding='utf-8') as d:
-        #    d.writelines(submit)
-        #    d.writelines(self.cmd)
-        return
-
-    # -------------------------------------------------------------------------
-    def run(self):
-        """Calls the command"""
-        with open(self.stdout, 'w', encoding='utf-8') as o:
-            with open(self.stderr, 'w', encoding='utf-8') as e:
-                subprocess.Popen(self.cmd, shell=True, stdout=o, stderr=e, universal_newlines=True)
-        return
+LOG_REFRESH_INTERVAL = 1000
 
 
 # -----------------------------------------------------------------------------
@@ -106,12 +81,25 @@ class StarMap(ToolInstance):
     stdout = stderr = None
     fscModelMapCsvFile = ""
     fscCsvFiles = {}
+    analysisResult = None
+    zscoreCxcFiles = True
+    rosettaChecked = False
     stmUserSelBashFile = ""
     stmUserSelRosettaFile = ""
     logTabIndex = 7
     localShellTemplates = {}
     remoteShellTemplates = {}
     medicSummeryWindow = None
+    logTail = None
+    modelPool = None
+    symmJob = None
+    symmJobButton = None
+    modelProgress = None
+    cropMapPadding = 0.0
+    croppedMaps = {}
+    analysisCache = None
+    analysisCacheEnabled = True
+    modelProgressJob = None
 
 
     # -------------------------------------------------------------------------
@@ -122,19 +110,43 @@ class StarMap(ToolInstance):
         tw = MainToolWindow(self)
         self.tool_window = tw
         self.logger = session.logger
+        self.jobRunner = JobRunner(tw.ui_area)
+        self.jobRunner.jobChanged.connect(self._job_changed)
+        self.analysisResult = StarMapAnalysisResult()
+        if config.analysis_cache_location():
+            self.analysisCache = AnalysisCache(config.analysis_cache_location())
         self._init_gui(tw.ui_area)
         self.tool_window.manage(placement="side")
         check_config()
         self._load_rosetta_script()
-        from .config import ROSETTA_FOUND
-        if not ROSETTA_FOUND:
+        return
+
+    # -------------------------------------------------------------------------
+    def delete(self):
+        """Stops the model pool, the progress watcher and all tracked jobs before the tool is closed"""
+        if self.modelPool and not self.modelPool.is_finished():
+            self.modelPool.stop()
+        if self.modelProgress:
+            self.modelProgress.stop()
+        if not self.jobRunner.terminate_all():
+            self.logger.warning("StarMap: some processes of the stopped jobs are still running")
+        self._stop_log_tail()
+        ToolInstance.delete(self)
+        return
+
+    # -------------------------------------------------------------------------
+    def _check_rosetta(self):
+        """Searches the Rosetta executables on first use and warns if they are missing"""
+        if self.rosettaChecked:
+            return
+        self.rosettaChecked = True
+        if not config.check_rosetta_config():
             msg = "Rosetta executables not found!\n"
             msg += "Scripts can only be generated with default Rosetta executable names.\n"
             msg += "Executing them directly from ChimeraX will therefore fail!\n\n"
             msg += "MEDIC does not need these Rosetta excutables, so MEDIC-only users can ignore this message."
             #QtWidgets.QMessageBox.warning(self.starMapGui.tabWidget, "StarMap Warning", msg, QtWidgets.QMessageBox.Ok)
             self.logger.warning(msg)
-
         return
 
     # -------------------------------------------------------------------------
@@ -266,6 +278,7 @@ class StarMap(ToolInstance):
                 self.starMapGui.executionLocalTemplateComboBox.addItem(file)
         #self._debug("local templates gui init = " + str(self.localShellTemplates))
         self.starMapGui.executionLocalTemplateComboBox.setCurrentIndex(0)
+        self.starMapGui.executionLocalTemplateComboBox.currentIndexChanged.connect(self._update_local_cores)
         self.starMapGui.executionRemoteTemplateComboBox.clear()
         self.starMapGui.executionRemoteTemplateComboBox.setDuplicatesEnabled(False)
         for file in sorted(files):
@@ -303,8 +316,13 @@ class StarMap(ToolInstance):
 
         # log buttons
         self.starMapGui.logViewEdit.setReadOnly(True)
+        self.starMapGui.logViewEdit.document().setMaximumBlockCount(LOG_TAIL_LINES)
+        self.logTimer = QtCore.QTimer(parent)
+        self.logTimer.setInterval(LOG_REFRESH_INTERVAL)
+        self.logTimer.timeout.connect(self._refresh_log_tail)
         self.starMapGui.logStdoutButton.clicked.connect(self._show_stdout_log)
         self.starMapGui.logStderrButton.clicked.connect(self._show_stderr_log)
+        self.starMapGui.logJobsButton.clicked.connect(self._show_jobs_log)
 
         # help buttons
         self.starMapGui.rosettaCxHelpButton.clicked.connect(self._help_rosetta_chimerax)
@@ -516,24 +534,85 @@ class StarMap(ToolInstance):
     # -------------------------------------------------------------------------
     def _save_rosetta_script(self):
         """Saves rosetta as .xml file"""
-        self.rosettaScriptString = self._replace_script_tags(self.rosettaScriptString)
-        #self._debug(self.rosettaScriptString)
-
         if self.stmRosettaFile:
-            target = open(self.stmRosettaFile, 'w', encoding='utf-8', newline='\n')
-            target.write(self.rosettaScriptString)
-            target.close()
-            # re-edit to add residues to the correct replaced file
-            self.rosettaScriptString = self._replace_xml_tags(self.stmRosettaFile)
-            target = open(self.stmRosettaFile, 'w', encoding='utf-8', newline='\n')
-            target.write(self.rosettaScriptString)
-            target.close()
+            self._write_rosetta_script(self.stmRosettaFile)
             self.set_value("runxml=" + os.path.basename(self.stmRosettaFile))
+        else:
+            self.rosettaScriptString = self._replace_script_tags(self.rosettaScriptString)
         #self._debug("re-initializing original Rosetta script template")
         #self._load_rosetta_script()
         self._changed_user_rosettascript_event()
         return
 
+    # -------------------------------------------------------------------------
+    def _write_rosetta_script(self, filename):
+        """Writes the Rosetta script with replaced tags to the given file"""
+        self._crop_density_maps()
+        # edit the script in memory to add the current residues, the file is written once
+        self.rosettaScriptString = self._replace_script_tags(self._replace_xml_string(self.rosettaScriptString))
+        #self._debug(self.rosettaScriptString)
+        target = open(filename, 'w', encoding='utf-8', newline='\n')
+        target.write(self.rosettaScriptString)
+        target.close()
+        return
+
+    # -------------------------------------------------------------------------
+    def _cropped_map(self, mapfile):
+        """Returns the map used by Rosetta, the cropped map if it was written for the current settings"""
+        if self.cropMapPadding <= 0 or not mapfile:
+            return mapfile
+        cropped = self.croppedMaps.get(mapfile)
+        if not cropped or not os.path.isfile(cropped):
+            return mapfile
+        return cropped
+
+    # -------------------------------------------------------------------------
+    def _crop_density_maps(self):
+        """Writes the density map and the half map cropped around the selected atoms, returns the written maps"""
+        self.croppedMaps = {}
+        if self.cropMapPadding <= 0 or not os.path.isfile(self.rosettaCxSelPdbFile):
+            return self.croppedMaps
+        maps = [self.rosettaDensityMapFile]
+        if self.starMapGui.rosettaModelCheckBox.isChecked():
+            maps.append(self.rosettaModelEvalFile)
+        for mapfile in maps:
+            if not mapfile or not os.path.isfile(mapfile):
+                continue
+            cropped = cropped_map_name(mapfile, self.rosettaCxSelPdbFile)
+            try:
+                record = crop_map_to_pdb(mapfile, self.rosettaCxSelPdbFile, cropped, self.cropMapPadding)
+            except (OSError, ValueError) as err:
+                # the scripts use the full map
+                self.logger.error("StarMap: cannot crop the density map, using the full map: " + str(err))
+                continue
+            self.croppedMaps[mapfile] = cropped
+            self.logger.info("starmap> " + os.path.basename(cropped) + ": box " + str(record["box"])
+                             + " at voxel " + ",".join(str(i) for i in record["offset"]) + " of " + os.path.basename(mapfile))
+        return self.croppedMaps
+
+    # -------------------------------------------------------------------------
+    def _selected_shell_template(self):
+        """Returns the shell template selected on the local or remote execution tab"""
+        template = None
+        try:
+            template = self.localShellTemplates[self.starMapGui.executionLocalTemplateComboBox.currentText()]
+        except KeyError:
+            self.logger.warning("StarMap: no local templates list!")
+        if self.starMapGui.executionTabWidget.currentIndex() == 2:
+            template = self.remoteShellTemplates[self.starMapGui.executionRemoteTemplateComboBox.currentText()]
+        return template
+
+    # -------------------------------------------------------------------------
+    def _write_bash_script_template(self, template, filename):
+        """Writes the shell template with replaced tags as executable file"""
+        self._crop_density_maps()
+        templateScriptString = self._replace_script_tags(template_cache.text(template))
+        target = open(filename, 'w', encoding='utf-8', newline='\n')
+        target.write(templateScriptString)
+        target.close()
+        os.chmod(filename, stat.S_IRWXU | stat.S_IRWXG | stat.S_IROTH)
+        return
+
     # -------------------------------------------------------------------------
     def _save_bash_script(self):
         """Saves settings as .sh file"""
@@ -552,24 +631,13 @@ class StarMap(ToolInstance):
                 return
 
         # generate file from template
-        template = None
-        try:
-            template = self.localShellTemplates[self.starMapGui.executionLocalTemplateComboBox.currentText()]
-        except KeyError:
-            self.logger.warning("StarMap: no local templates list!")
-        if self.starMapGui.executionTabWidget.currentIndex() == 2:
-            template = self.remoteShellTemplates[self.starMapGui.executionRemoteTemplateComboBox.currentText()]
-
+        template = self._selected_shell_template()
         #self._debug("template = " + template)
         if os.path.isfile(template):
-            file = open(template, 'r', encoding='utf-8')
-            templateScriptString = file.read()
-            templateScriptString = self._replace_script_tags(templateScriptString)
             if self.stmBashFile:
-                target = open(self.stmBashFile, 'w', encoding='utf-8', newline='\n')
-                target.write(templateScriptString)
-                target.close()
-                os.chmod(self.stmBashFile, stat.S_IRWXU | stat.S_IRWXG | stat.S_IROTH)
+                halfMap = self.rosettaModelEvalFile if self.starMapGui.rosettaModelCheckBox.isChecked() else None
+                self._check_density_maps(self.rosettaDensityMapFile, self.starMapGui.rosettaResolutionEdit.text(), halfMap)
+                self._write_bash_script_template(template, self.stmBashFile)
                 self.set_value("runsh=" + os.path.basename(self.stmBashFile))
                 self._view_bash_script()
         else:
@@ -608,9 +676,7 @@ class StarMap(ToolInstance):
                 from .config import data_location
                 MEDIC_SCRIPT_TEMPLATE = data_location('templates', MEDIC_SCRIPT_TEMPLATE) or MEDIC_SCRIPT_TEMPLATE
         if os.path.isfile(MEDIC_SCRIPT_TEMPLATE):
-            file = open(MEDIC_SCRIPT_TEMPLATE, 'r', encoding='utf-8')
-            templateScriptString = file.read()
-            templateScriptString = self._replace_script_tags(templateScriptString)
+            templateScriptString = self._replace_script_tags(template_cache.text(MEDIC_SCRIPT_TEMPLATE))
             if self.stmBashMedicFile:
                 try:
                     target = open(self.stmBashMedicFile, 'w', encoding='utf-8', newline='\n')
@@ -641,11 +707,13 @@ class StarMap(ToolInstance):
         apixFile = self.stmBashApixFile.rsplit(".", 1)[0]  + ".xml"
         self._save_apix_rosetta_script(apixFile)
 
+        self._check_rosetta()
+        self._check_density_maps(self.starMapGui.apixDensityMapFileLabel.text(), self.starMapGui.apixResolutionEdit.text())
         s = "#!/bin/sh\n"
         if platform.system() == "Windows":
-            s += ROSETTA_SCRIPTS_CMD + " \\\n"
+            s += config.ROSETTA_SCRIPTS_CMD + " \\\n"
         else:
-            s += "$(which " + os.path.basename(ROSETTA_SCRIPTS_CMD) + ") \\\n"
+            s += "$(which " + os.path.basename(config.ROSETTA_SCRIPTS_CMD) + ") \\\n"
         s += "  -parser:protocol \"" + os.path.basename(apixFile) + "\" \\\n"
         s += "  -edensity:mapfile \"" + os.path.basename(self.starMapGui.apixDensityMapFileLabel.text()) + "\" \\\n"
         s += "  -s \"" + os.path.basename(self.starMapGui.apixResultPdbFileLabel.text()) + "\" \\\n"
@@ -662,14 +730,37 @@ class StarMap(ToolInstance):
         self.starMapGui.apixExecuteButton.setEnabled(True)
         return
 
+    # -------------------------------------------------------------------------
+    def _check_density_maps(self, mapfile, resolution='', halfMap=None):
+        """Reads the map headers and warns about problems before the scripts are run"""
+        try:
+            resolution = float(resolution)
+        except ValueError:
+            resolution = None
+        headers = []
+        for filename in (mapfile, halfMap):
+            if not filename or not os.path.isfile(filename):
+                continue
+            try:
+                hdr, problems = check_map(filename, resolution)
+            except (OSError, MrcHeaderError) as err:
+                self.logger.warning("StarMap: cannot read the map header: " + str(err))
+                continue
+            self.logger.info("starmap> " + hdr.as_string())
+            for problem in problems:
+                self.logger.warning("StarMap: density map " + os.path.basename(filename) + ": " + problem)
+            headers.append(hdr)
+        if len(headers) == 2:
+            for problem in compare_maps(headers[0], headers[1]):
+                self.logger.warning("StarMap: density map and half map: " + problem)
+        return
+
     # -------------------------------------------------------------------------
     def _save_apix_rosetta_script(self, apixFile):
         """Saves the Rosetta apix xml script"""
         densMap = os.path.basename(self.starMapGui.apixDensityMapFileLabel.text())
         apixMap = densMap.rsplit(".", 1)[0]  + "_apix." + densMap.rsplit(".", 1)[1]
-        s = ''
-        with open(STARMAP_ROSETTA_APIX_SCRIPT, encoding='utf-8') as f:
-            s = f.read()
+        s = template_cache.text(STARMAP_ROSETTA_APIX_SCRIPT)
         s = s.replace("@@APIX_MAP@@", str(apixMap))
 
         if self.starMapGui.apixAnisoCheckBox.isChecked():
@@ -904,38 +995,36 @@ class StarMap(ToolInstance):
 
     # -------------------------------------------------------------------------
     def _exec_symm_check(self):
-        """Executes the symmetry check and shows the result"""
+        """Runs the StarMap symmetry check in-process"""
+        if self._cancel_symm_job(self.starMapGui.symmCheckButton):
+            return
         if not self.symmPdbFile:
             self._select_symmetry_pdb()
             if not self.symmPdbFile:
                 return
 
         self.rosettaSymmFile = self.symmPdbFile.rsplit(".", 1)[0]  + ".symm"
-        cmd = STARMAP_SYMMETRY_CMD.replace(' ', r'\ ') + ' ' + self.starMapGui.symmOptionsEdit.text() + ' -p \"' + self.symmPdbFile + '\"'
-        cmd = wsl_cmd_wrapper(cmd, True)
-        #self._debug(cmd)
-        procExe = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-        self.stdout, self.stderr = procExe.communicate()
-        self.starMapGui.logViewEdit.setText(self.stderr)
-        self.starMapGui.logStdoutButton.setEnabled(False)
-        self.starMapGui.logStderrButton.setEnabled(False)
-        self.starMapGui.tabWidget.setCurrentIndex(self.logTabIndex)
-        log = self.starMapGui.logViewEdit.toPlainText()
+        self.starMapGui.symmResultLabel.setText("Running ...")
         try:
-            msg = log.split('\n')[-2]
-        except Exception:
-            msg = "Error: cannot parse log file"
+            options = parse_ncs_options(self.starMapGui.symmOptionsEdit.text())
+            _, _, messages = make_ncs(self.symmPdbFile, outfile=self.rosettaSymmFile, **options)
+        except (OSError, ValueError) as err:
+            self.logger.error("StarMap: symmetry check failed: " + str(err))
+            messages = []
+        for msg in messages:
+            self.logger.info("starmap> " + msg)
+        self._symm_check_done(messages)
+        return
+
+    # -------------------------------------------------------------------------
+    def _symm_check_done(self, messages):
+        """Shows the result of the symmetry check"""
+        msg = messages[-1] if messages else "Error: check log for details"
         if not "Found" in msg:
             if "No symmetry found" in msg:
                 msg = "No symmetry found"
             else:
-                if not platform.system() == "Windows":
-                    msg = "Error: check log for details"
-                else:
-                    if os.path.exists(self.rosettaSymmFile):
-                        msg = "SYMM file generated"
-                    else:
-                        msg = "Error: check log for details"
+                msg = "Error: check log for details"
         self.starMapGui.symmResultLabel.setText(msg)
         self.starMapGui.symmRosettaResultLabel.setText("See StarMap symmetry check")
         if os.path.exists(self.rosettaSymmFile):
@@ -948,26 +1037,35 @@ class StarMap(ToolInstance):
 
     # -------------------------------------------------------------------------
     def _exec_rosetta_symm_check(self):
-        """Executes the Rosetta symmetry check and shows the result"""
+        """Starts the Rosetta symmetry check or cancels the running one"""
+        if self._cancel_symm_job(self.starMapGui.symmRosettaCheckButton):
+            return
         if not self.symmPdbFile:
             self._select_symmetry_pdb()
             if not self.symmPdbFile:
                 return
 
+        self._check_rosetta()
         self.rosettaSymmFile = self.symmPdbFile.rsplit(".", 1)[0]  + ".symm"
-        cmd = '/usr/bin/env perl ' + ROSETTA_SYMMDEF_CMD.replace(' ', r'\ ') + ' ' + self.starMapGui.symmRosettaOptionsEdit.text() + ' -p \"' + self.symmPdbFile + '\"'
+        cmd = '/usr/bin/env perl ' + config.ROSETTA_SYMMDEF_CMD.replace(' ', r'\ ') + ' ' + self.starMapGui.symmRosettaOptionsEdit.text() + ' -p \"' + self.symmPdbFile + '\"'
         cmd = wsl_cmd_wrapper(cmd)
 
         #self._debug(cmd)
-        with open(self.rosettaSymmFile, 'w', encoding='utf-8') as outfile:
-            procExe = subprocess.Popen(cmd, shell=True, stdout=outfile, stderr=subprocess.PIPE, universal_newlines=True)
-            self.stdout, self.stderr = procExe.communicate()
-        self.starMapGui.logViewEdit.setText(self.stderr)
-        self.starMapGui.logStdoutButton.setEnabled(False)
-        self.starMapGui.logStderrButton.setEnabled(False)
-        self.starMapGui.tabWidget.setCurrentIndex(self.logTabIndex)
-        log = self.starMapGui.logViewEdit.toPlainText()
-        msg = log.split('\n')[-2]
+        # the symmetry definition is written to stdout
+        job = StarMapJob(self.symmPdbFile.rsplit(".", 1)[0] + "_symmdef.sh", cmd=cmd, stdout=self.rosettaSymmFile)
+        self._start_symm_job(job, self.starMapGui.symmRosettaCheckButton, self._rosetta_symm_check_done)
+        self.starMapGui.symmRosettaResultLabel.setText("Running ...")
+        return
+
+    # -------------------------------------------------------------------------
+    def _rosetta_symm_check_done(self, job):
+        """Shows the result of the Rosetta symmetry check"""
+        self._symm_job_done()
+        log = self._read_symm_log(job)
+        try:
+            msg = log.split('\n')[-2]
+        except Exception:
+            msg = "Error: cannot parse log file"
         if not "Found" in msg:
             if "No symmetry found" in msg:
                 msg = "No symmetry found"
@@ -990,28 +1088,173 @@ class StarMap(ToolInstance):
             self.starMapGui.advancedSymmCheckBox.setChecked(False)
         return
 
+    # -------------------------------------------------------------------------
+    def _start_symm_job(self, job, button, callback):
+        """Runs a symmetry check as tracked job and streams its stderr to the log tab"""
+        job.callback = callback
+        self.symmJob = self.jobRunner.start(job)
+        self.symmJobButton = button
+        self.stdout = job.stdout
+        self.stderr = job.stderr
+        self.starMapGui.logStdoutButton.setEnabled(False)
+        self.starMapGui.logStderrButton.setEnabled(True)
+        self.starMapGui.tabWidget.setCurrentIndex(self.logTabIndex)
+        self._start_log_tail(job.stderr)
+        button.setText(_translate("qtStarMapWidget", "Cancel"))
+        button.setStyleSheet("background-color: rgb(255, 191, 0); color: rgb(0, 0, 0)")
+        return
+
+    # -------------------------------------------------------------------------
+    def _cancel_symm_job(self, button):
+        """Stops the running symmetry check of the button, returns True if a check is running"""
+        if not self.symmJob or self.symmJob.state != JOB_RUNNING:
+            return False
+        if button is not self.symmJobButton:
+            self.logger.warning("StarMap: a symmetry check is still running, cancel it first")
+            return True
+        exited = self.symmJob.terminate()
+        self.jobRunner.jobChanged.emit(self.symmJob)
+        if exited:
+            self._symm_job_cancelled(self.symmJob)
+        else:
+            # the button is reset by the poll when the processes have exited
+            self.symmJob.callback = self._symm_job_cancelled
+            self._symm_result_label(button).setText("Cancelling ...")
+        return True
+
+    # -------------------------------------------------------------------------
+    def _symm_job_cancelled(self, job):
+        """Resets the button of the cancelled symmetry check after its processes have exited"""
+        label = self._symm_result_label(self.symmJobButton)
+        self._symm_job_done()
+        label.setText("Cancelled")
+        return
+
+    # -------------------------------------------------------------------------
+    def _symm_result_label(self, button):
+        """Returns the result label of the symmetry check button"""
+        if button is self.starMapGui.symmCheckButton:
+            return self.starMapGui.symmResultLabel
+        return self.starMapGui.symmRosettaResultLabel
+
+    # -------------------------------------------------------------------------
+    def _symm_job_done(self):
+        """Resets the button of the finished symmetry check"""
+        self._refresh_log_tail()
+        self._stop_log_tail()
+        self.symmJobButton.setText(_translate("qtStarMapWidget", "Execute"))
+        self.symmJobButton.setStyleSheet("")
+        self.symmJob = None
+        self.symmJobButton = None
+        return
+
+    # -------------------------------------------------------------------------
+    def _read_symm_log(self, job):
+        """Returns the stderr output of the symmetry check"""
+        try:
+            with open(job.stderr, 'r', encoding='utf-8', errors='replace') as f:
+                return f.read()
+        except OSError:
+            return ""
+
     # -------------------------------------------------------------------------
     def _exec_local_bash_script(self):
         """Executes the bash script for local Rosetta calls"""
-        self._exec_external_script_thread(self.stmBashFile)
+        if self.modelPool and not self.modelPool.is_finished():
+            if not self.modelPool.stop():
+                self.logger.warning("StarMap: some processes of the stopped models are still running")
+            return
+        if self._model_pool_selected():
+            self._exec_model_pool()
+            return
+        job = self._exec_external_script(self.stmBashFile)
+        self._start_model_progress(job)
+        return
+
+    # -------------------------------------------------------------------------
+    def _start_model_progress(self, job):
+        """Shows the progress of the refinement from the written output models"""
+        if job is None:
+            return
+        if self.modelProgress:
+            self.modelProgress.stop()
+        prefix = os.path.basename(self.rosettaCxSelPdbFile).rsplit(".", 1)[0]
+        models = int(self.starMapGui.rosettaResultsEdit.text())
+        self.modelProgress = ModelProgress(os.getcwd(), prefix, models, self.tool_window.ui_area)
+        self.modelProgress.progressChanged.connect(self._model_progress_changed)
+        self.modelProgressJob = job
+        self._set_progress(0, self.modelProgress.status_line())
+        self.modelProgress.start()
+        return
+
+    # -------------------------------------------------------------------------
+    def _model_progress_changed(self, progress):
+        """Drives the progress bar with the written models"""
+        self._set_progress(progress.percent(), progress.status_line())
+        return
+
+    # -------------------------------------------------------------------------
+    def _exec_model_pool(self):
+        """Runs the single model script once per model on the local cores"""
+        if not os.path.exists(self.stmBashFile):
+            QtWidgets.QMessageBox.warning(self.starMapGui.tabWidget, "StarMap warning",
+                                          "File does not exist: " + self.stmBashFile,
+                                          QtWidgets.QMessageBox.Ok)
+            return
+        prefix = os.path.basename(self.rosettaCxSelPdbFile).rsplit(".", 1)[0]
+        models = int(self.starMapGui.rosettaResultsEdit.text())
+        workers = int(self.starMapGui.executionLocalCoresEdit.text())
+        self._stop_log_tail()
+        self.modelPool = ModelPool(self.jobRunner, os.path.abspath(self.stmBashFile), prefix, models, workers)
+        self.modelPool.poolChanged.connect(self._model_pool_changed)
+        self.modelPool.poolFinished.connect(self._model_pool_finished)
+        self.starMapGui.logViewEdit.setText("Running " + str(models) + " models on " + str(workers) + " cores: " + self.stmBashFile)
+        self.starMapGui.tabWidget.setCurrentIndex(self.logTabIndex)
+        self.modelPool.start()
+        self.starMapGui.executionLocalRunScript.setText(_translate("qtStarMapWidget", "Cancel"))
+        self.starMapGui.executionLocalRunScript.setStyleSheet("background-color: rgb(255, 191, 0); color: rgb(0, 0, 0)")
+        return
+
+    # -------------------------------------------------------------------------
+    def _model_pool_selected(self):
+        """Returns True if the local model pool template is selected"""
+        return self.starMapGui.executionLocalTemplateComboBox.currentText().endswith(POOL_TEMPLATE_SUFFIX)
+
+    # -------------------------------------------------------------------------
+    def _model_pool_changed(self, pool):
+        """Shows the progress of the model pool"""
+        total = len(pool.done) + len(pool.failed) + len(pool.running) + len(pool.queue)
+        self._set_progress(int(100 * (len(pool.done) + len(pool.failed)) / max(total, 1)), pool.status_line())
+        self.starMapGui.logViewEdit.append(pool.status_line())
+        return
+
+    # -------------------------------------------------------------------------
+    def _model_pool_finished(self, pool):
+        """Reports the collected models"""
+        self.starMapGui.executionLocalRunScript.setText(_translate("qtStarMapWidget", "Execute"))
+        self.starMapGui.executionLocalRunScript.setStyleSheet("")
+        self._set_progress(100, pool.status_line())
+        self.logger.info("starmap> " + pool.status_line())
+        if pool.failed:
+            self.logger.warning("starmap> models failed after " + str(pool.retries + 1) + " attempts, see the " + pool.script.rsplit(".", 1)[0] + "_<model>.err files")
         return
 
     # -------------------------------------------------------------------------
     def _exec_local_bash_medic_script(self):
         """Executes the bash script for local MEDIC calls"""
-        self._exec_external_script_thread(self.stmBashMedicFile)
+        self._exec_external_script(self.stmBashMedicFile)
         return
 
     # -------------------------------------------------------------------------
     def _submit_bash_medic_script(self):
         """Submits the bash script for HPC MEDIC calls"""
-        self._exec_external_script_thread(self.stmBashMedicFile, 'sbatch')
+        self._exec_external_script(self.stmBashMedicFile, 'sbatch')
         return
 
     # -------------------------------------------------------------------------
     def _exec_local_bash_apix_script(self):
         """Executes the bash script for local Rosetta calls"""
-        self._exec_external_script_thread(self.stmBashApixFile)
+        self._exec_external_script(self.stmBashApixFile)
         return
 
     # -------------------------------------------------------------------------
@@ -1020,7 +1263,8 @@ class StarMap(ToolInstance):
         submit = self.starMapGui.executionRemoteSubmitComboBox.currentText()
         if submit == 'ts':
             submit += ' -L starmap -N ' + self.starMapGui.executionRemoteCoresEdit.text()
-        self._exec_external_script_thread(self.stmBashFile, submit)
+        job = self._exec_external_script(self.stmBashFile, submit)
+        self._start_model_progress(job)
         return
 
     # -------------------------------------------------------------------------
@@ -1075,18 +1319,19 @@ class StarMap(ToolInstance):
     # -------------------------------------------------------------------------
     def _exec_local_sort_rosetta_results(self):
         """Sorts the Rosetta results PDBs by FSC value"""
-        spattern = os.path.basename(self.rosettaCxSelPdbFile).rsplit(".", 1)[0] + "_????.pdb"
-        s = "names=`grep mask " + spattern + " | grep -v starmap_result | sort -r -k5 | cut -f1 -d':'`\n"
-        s += "i=1\n"
-        s += "for name in $names; do\n"
-        s += "  echo mv $name starmap_result_$(printf \"%0004d\" $i).pdb\n"
-        s += "  mv $name starmap_result_$(printf \"%0004d\" $i).pdb\n"
-        s += "  i=$((i+1))\n"
-        s += "done\n"
-        filename = self.rosettaCxSelPdbFile.rsplit(".", 1)[0]  + "_sort.sh"
-        filename = os.path.abspath(filename)
-        self._write_bash_script(filename, s)
-        self._exec_external_script_thread(filename)
+        prefix = os.path.basename(self.rosettaCxSelPdbFile).rsplit(".", 1)[0]
+        models = result_models(prefix)
+        if not models:
+            self.logger.warning("starmap> no Rosetta result PDBs " + prefix + "_????.pdb found in " + os.getcwd())
+            return
+        ranked = rank_models(models)
+        for model, value in ranked:
+            if value is None:
+                self.logger.warning("starmap> no FSC value found at the end of " + model + ", not ranked")
+        rows = rename_ranked([r for r in ranked if r[1] is not None])
+        for rank, result, model, value in rows:
+            self.logger.info("starmap> " + model + " -> " + result + " (" + str(value) + ")")
+        self.logger.info("starmap> ranking of " + str(len(rows)) + " models written to " + os.path.abspath(RANKING_CSV))
         return
 
     # -------------------------------------------------------------------------
@@ -1096,11 +1341,12 @@ class StarMap(ToolInstance):
         self.starMapGui.analysisFscExecuteButton.update()
         if self.starMapGui.analysisFscModelMapCheckBox.isChecked():
             self._run_cmd("stmrunfsc")
+        # one per residue run gives the LCC and the z-score results
         self._set_progress(30, 'Running LCC analysis ...')
         if self.starMapGui.analysisFscLccCheckBox.isChecked():
             self._run_cmd("stmrunlcc")
-        self._set_progress(70, 'Running LCC Zscore analysis ...')
-        if self.starMapGui.analysisFscLccZscoreCheckBox.isChecked():
+        elif self.starMapGui.analysisFscLccZscoreCheckBox.isChecked():
+            self._set_progress(50, 'Running LCC Zscore analysis ...')
             self._run_cmd("stmrunzsc")
         self._set_progress(100, 'Done ...')
         self.starMapGui.analysisFscShowButton.setStyleSheet("background-color: rgb(255, 191, 0); color: rgb(0, 0, 0)")
@@ -1117,50 +1363,141 @@ class StarMap(ToolInstance):
     def _exec_local_fsc_calculation(self, batchmode=False, fsc=False, lcc=False, zsc=False):
         """Executes Rosetta FSC calculation"""
         resultPdbName = os.path.basename(os.path.realpath(self.starMapGui.analysisResultPdbFileLabel.text()))
+        self._check_rosetta()
         #self._debug("resultPdbName=" + resultPdbName)
 
-        s = "$(which " + os.path.basename(ROSETTA_DENSITY_CMD) + ")"
-        if self.starMapGui.executionFullPathBox.isChecked():
-            s = ROSETTA_DENSITY_CMD
-        if platform.system() == "Windows":
-            s = ROSETTA_DENSITY_CMD
-        s += " -s " + resultPdbName
-        s += " -mapfile " + os.path.basename(self.starMapGui.analysisDensityMapFileLabel.text())
-        s += " -mapreso " + self.starMapGui.analysisResolutionEdit.text()
-        s += " -cryoem_scatterers"
-
         if fsc:
             scriptname = os.path.basename(resultPdbName.rsplit(".", 1)[0] + "_fsc_mm.sh")
             self.fscModelMapCsvFile = os.path.basename(resultPdbName.rsplit(".", 1)[0] + "_fsc_mm.csv")
-            s += " -nresbins 200 -hires 0.01 -verbose -mask_resolution 10\n"
-        perres_applied = False
-        if lcc:
+            options = DENSITY_FSC_OPTIONS
+        # the LCC and the z-scores are read from the same per residue log
+        if lcc or zsc:
             scriptname = os.path.basename(resultPdbName.rsplit(".", 1)[0] + "_lcc_res.sh")
-            s += " -perres -ignore_unrecognized_res -out:levels protocols.hybridization.FragmentBiasAssigner:999\n"
-            perres_applied = True
-        if zsc:
-            scriptname = os.path.basename(resultPdbName.rsplit(".", 1)[0] + "_lcc_res_zscore.sh")
-            if not perres_applied:
-                s += " -perres -ignore_unrecognized_res -out:levels protocols.hybridization.FragmentBiasAssigner:999\n"
-        if not fsc:
-            s += "myself=`basename $0`\n"
-            s += "mylog=${myself%.sh}.out\n"
-            s += "grep FragmentBias ${mylog} | grep -v init | grep -v Probs_ | grep -v rsn | grep -v Size | cut -d':' -f2 >fragmentbias.tmp\n"
-            s += "grep PERRESCC ${mylog} | cut -d' ' -f4- >prerescc.tmp\n"
-            s += "paste prerescc.tmp fragmentbias.tmp | tr '\t' ' ' >zscores.tmp\n"
-            s += "cat zscores.tmp | tr -s ' ' >zscores_combined.csv\n"
-            s += "rm -f fragmentbias.tmp prerescc.tmp zscores.tmp\n"
-
-        s += "echo --- StarMap: end of log ---\n"
+            options = DENSITY_PERRES_OPTIONS
+        s = self._density_tools_script(resultPdbName, options)
         self._write_bash_script(scriptname, s)
         if not batchmode:
-            self._exec_external_script_thread(scriptname)
-        else:
-            self._exec_external_script_batchmode(scriptname)
+            self._exec_external_script(scriptname)
+        elif self._run_density_tools(scriptname, resultPdbName, options, self._analysis_map_digest()):
+            self.logger.info("starmap> using the cached result of " + scriptname)
 
         self.starMapGui.analysisFscShowButton.setEnabled(True)
         return
 
+    # -------------------------------------------------------------------------
+    def _analysis_workers(self):
+        """Returns the number of parallel density_tools runs, limited by a valid number of local cores"""
+        workers = os.cpu_count() or 1
+        # the local cores are fixed to 1 for the single static Rosetta run
+        if (platform.system() == "Darwin" or platform.system() == "Windows") and not self._model_pool_selected():
+            return workers
+        try:
+            cores = int(self.starMapGui.executionLocalCoresEdit.text())
+        except ValueError:
+            return workers
+        if cores > 0:
+            workers = min(workers, cores)
+        return workers
+
+    # -------------------------------------------------------------------------
+    def _analysis_map_digest(self):
+        """Returns the checksum and the resolution of the analysis map and the density_tools identity for the cache or None"""
+        if not self.analysisCacheEnabled or not self.analysisCache:
+            return None
+        try:
+            digest = self.analysisCache.map_digest(os.path.basename(self.starMapGui.analysisDensityMapFileLabel.text()))
+        except OSError:
+            return None
+        return digest, self.starMapGui.analysisResolutionEdit.text(), cmd_identity(config.ROSETTA_DENSITY_CMD)
+
+    # -------------------------------------------------------------------------
+    def _run_density_tools(self, scriptname, pdbname, options, mapdigest):
+        """Runs the density_tools script in batch mode, returns True if the log was taken from the cache.
+
+        Does not access the user interface, mapdigest from _analysis_map_digest is
+        computed before, so the method can run in worker threads.
+        """
+        logname = scriptname.rsplit(".", 1)[0] + ".out"
+        key = None
+        if mapdigest and self.analysisCache:
+            try:
+                key = analysis_key(pdbname, mapdigest[0], mapdigest[1], options, mapdigest[2])
+            except OSError:
+                key = None
+        if key and self.analysisCache.get(key, logname):
+            return True
+        # failed runs are not cached
+        if self._exec_external_script_batchmode(scriptname) == 0 and key:
+            self.analysisCache.put(key, logname)
+        return False
+
+    # -------------------------------------------------------------------------
+    def _density_tools_cmd(self, pdbname):
+        """Returns the density_tools call for the given model and the analysis map"""
+        s = "$(which " + os.path.basename(config.ROSETTA_DENSITY_CMD) + ")"
+        if self.starMapGui.executionFullPathBox.isChecked():
+            s = config.ROSETTA_DENSITY_CMD
+        if platform.system() == "Windows":
+            s = config.ROSETTA_DENSITY_CMD
+        s += " -s " + pdbname
+        s += " -mapfile " + os.path.basename(self.starMapGui.analysisDensityMapFileLabel.text())
+        s += " -mapreso " + self.starMapGui.analysisResolutionEdit.text()
+        s += " -cryoem_scatterers"
+        return s
+
+    # -------------------------------------------------------------------------
+    def _density_tools_script(self, pdbname, options):
+        """Returns the density_tools script, it exits with the density_tools exit status"""
+        s = self._density_tools_cmd(pdbname) + options + "\n"
+        s += "status=$?\n"
+        s += "echo --- StarMap: end of log ---\n"
+        s += "exit $status\n"
+        return s
+
+    # -------------------------------------------------------------------------
+    def cxc_exec_models_analysis(self):
+        """Runs the FSC and one per residue analysis for all ranked result models in parallel"""
+        pdbs = result_pdbs()
+        if not pdbs:
+            self.logger.error("stmrunmodels: no " + RESULT_PREFIX + "_NNNN.pdb found in " + os.getcwd() + ", sort the Rosetta results first")
+            return
+        self._check_rosetta()
+        try:
+            mapres = float(self.starMapGui.analysisResolutionEdit.text())
+        except ValueError:
+            self.logger.error("stmrunmodels: set the map resolution first (stmset mapres=...)")
+            return
+
+        # one FSC and one per residue script per model, the per residue log gives LCC and z-scores
+        scripts = []
+        for pdb in pdbs:
+            base = pdb.rsplit(".", 1)[0]
+            for suffix, options in (("_fsc_mm.sh", DENSITY_FSC_OPTIONS), ("_lcc_res.sh", DENSITY_PERRES_OPTIONS)):
+                s = self._density_tools_script(pdb, options)
+                self._write_bash_script(os.path.abspath(base + suffix), s)
+                scripts.append((base + suffix, pdb, options))
+
+        workers = self._analysis_workers()
+        self.logger.info("stmrunmodels: analysing " + str(len(pdbs)) + " models on " + str(workers) + " cores")
+        # the map is hashed once here, the workers must not access the user interface
+        mapdigest = self._analysis_map_digest()
+        cached = run_parallel(lambda script: self._run_density_tools(*script, mapdigest), scripts, workers)
+        if any(cached):
+            self.logger.info("stmrunmodels: " + str(sum(cached)) + " of " + str(len(scripts)) + " results taken from the cache")
+
+        def _summary(pdb):
+            """Reads the logs of one model"""
+            base = pdb.rsplit(".", 1)[0]
+            row, result = model_summary(pdb, base + "_fsc_mm.out", base + "_lcc_res.out", mapres)
+            if result.has_zscores():
+                result.write_zscores_csv(base + "_lcc_res_zscores_combined.csv")
+            return row
+
+        rows = run_parallel(_summary, pdbs, workers)
+        write_analysis_table(ANALYSIS_TABLE, rows)
+        self.logger.info("stmrunmodels: comparison written to " + os.path.abspath(ANALYSIS_TABLE) + "\n" + format_analysis_table(rows))
+        return
+
     # -------------------------------------------------------------------------
     def _make_fsc_csv(self):
         """Generate FSC CSV files"""
@@ -1170,50 +1507,23 @@ class StarMap(ToolInstance):
             QtWidgets.QMessageBox.warning(self.starMapGui.tabWidget, "StarMap warning",
             "File " + fscname + " does not exist!\nPlease run analysis!",
             QtWidgets.QMessageBox.Ok)
-            return
-
-        lines = [line.rstrip('\n') for line in open(fscname, encoding='utf-8')]
-        with open(self.fscModelMapCsvFile, 'w', encoding='utf-8', newline='\n') as f:
-            for line in lines:
-                if line.find("density_tools:") != -1:
-                    tok = line.split()
-                    try:
-                        float(tok[1])
-                        f.write(tok[1] + ' ' + tok[8] + '\n')
-                    except ValueError:
-                        dummy = 1
-        f.close()
+            return False
 
+        self.analysisResult.read_fsc(fscname)
+        self.analysisResult.write_fsc_csv(self.fscModelMapCsvFile)
         self.fscCsvFiles = {}
         self.fscCsvFiles['0'] = self.fscModelMapCsvFile
         self._save_fsc_veusz(fsc=True)
-        return
+        return True
 
     # -------------------------------------------------------------------------
     def _make_lcc_csv(self):
         """Generate LCC CVS files"""
         realname = os.path.realpath(self.starMapGui.analysisResultPdbFileLabel.text())
         lccname = os.path.basename(realname.rsplit(".", 1)[0] + "_lcc_res.out")
-        lines = [line.rstrip('\n') for line in open(lccname, encoding='utf-8')]
-        fscLccCsvFiles = {}
-
-        for line in lines:
-            if line.find("PERRESCC") != -1:
-                tok = line.split()
-                fscLccCsvFiles[tok[4]] = lccname.rsplit(".", 1)[0] + '_' + tok[4] + ".csv"
-
-        #self._debug("generating csv file(s):\n" + str(fscLccCsvFiles))
-        for chain in fscLccCsvFiles:
-            with open(fscLccCsvFiles[chain], 'w', encoding='utf-8', newline='\n') as f:
-                for line in lines:
-                    if line.find("PERRESCC") != -1:
-                        tok = line.split()
-                        if chain == tok[4]:
-                            f.write(tok[5] + ' ' + tok[6] + '\n')
-            f.close()
-
-        self.fscCsvFiles = {}
-        self.fscCsvFiles = fscLccCsvFiles.copy()
+        self.analysisResult.read_perres(lccname)
+        self.fscCsvFiles = self.analysisResult.write_perres_csv(lccname.rsplit(".", 1)[0], "lcc")
+        #self._debug("generating csv file(s):\n" + str(self.fscCsvFiles))
         self._save_fsc_veusz(lcc=True)
         self._save_fsc_veusz(zsc=True)
         return
@@ -1224,34 +1534,13 @@ class StarMap(ToolInstance):
         realname = os.path.realpath(self.starMapGui.analysisResultPdbFileLabel.text())
         lccname = os.path.basename(realname.rsplit(".", 1)[0] + "_lcc_res.out")
         zscname = os.path.basename(realname.rsplit(".", 1)[0] + "_lcc_res_zscore.out")
-        if not os.path.isfile(zscname):
-            try:
-                if os.path.isfile(lccname):
-                    copyfile(lccname, zscname)
-            except OSError:
-                self._debug("assuming zsc direct run")
-
-        lines = [line.rstrip('\n') for line in open(zscname, encoding='utf-8')]
-        fscLccZscoreCsvFiles = {}
-
-        for line in lines:
-            if line.find("PERRESCC") != -1:
-                tok = line.split()
-                fscLccZscoreCsvFiles[tok[4]] = zscname.rsplit(".", 1)[0] + '_' + tok[4] + ".csv"
-
-        #self._debug("generating csv file(s):\n" + str(fscLccZscoreCsvFiles))
-        for chain in fscLccZscoreCsvFiles:
-            with open(fscLccZscoreCsvFiles[chain], 'w', encoding='utf-8', newline='\n') as f:
-                for line in lines:
-                    if line.find("PERRESCC") != -1:
-                        tok = line.split()
-                        if chain == tok[4]:
-                            f.write(tok[5] + ' ' + tok[7] + '\n')
-            f.close()
+        # logs of older versions had a separate z-score run
+        logname = lccname if os.path.isfile(lccname) or not os.path.isfile(zscname) else zscname
 
-        self.fscCsvFiles = {}
-        self.fscCsvFiles = fscLccZscoreCsvFiles.copy()
-        self._make_zscore_color_cxc(lccname)
+        self.analysisResult.read_perres(logname)
+        self.fscCsvFiles = self.analysisResult.write_perres_csv(zscname.rsplit(".", 1)[0], "zscore")
+        #self._debug("generating csv file(s):\n" + str(self.fscCsvFiles))
+        self._make_zscore_color_cxc(lccname, logname)
         self._save_fsc_veusz(zsc=True)
         return
 
@@ -1271,41 +1560,44 @@ class StarMap(ToolInstance):
         return
 
     # -------------------------------------------------------------------------
-    def _make_zscore_color_cxc(self, fscname):
-        """Generate a color file for ChimeraX"""
-        csvfile = "zscores_combined.csv"
-
-        colfile = fscname.rsplit(".", 1)[0] + "_zscore.cxc"
-        self._write_zscore_color_cxc(csvfile, colfile, 4, "zscore")
-
-        colfile = fscname.rsplit(".", 1)[0] + "_zdensity.cxc"
-        self._write_zscore_color_cxc(csvfile, colfile, 5, "zdensity")
-
-        colfile = fscname.rsplit(".", 1)[0] + "_zneighborhood.cxc"
-        self._write_zscore_color_cxc(csvfile, colfile, 6, "zneighborhood")
-
-        colfile = fscname.rsplit(".", 1)[0] + "_zrama.cxc"
-        self._write_zscore_color_cxc(csvfile, colfile, 7, "zrama")
+    def _make_zscore_color_cxc(self, fscname, logfile):
+        """Generate the z-score table and color files for ChimeraX"""
+        try:
+            self.analysisResult.read_zscore_log(logfile)
+        except (OSError, ValueError):
+            self.analysisResult.zdensity = []
+        if not self.analysisResult.has_zscores():
+            self.logger.error("Error reading z-scores from: " + logfile + "\nIs there an error message in the *.out files?")
+            return
 
-        colfile = fscname.rsplit(".", 1)[0] + "_zbondstrain.cxc"
-        self._write_zscore_color_cxc(csvfile, colfile, 8, "zbondstrain")
+        self.analysisResult.write_zscores_csv(fscname.rsplit(".", 1)[0] + "_zscores_combined.csv")
+        if self.zscoreCxcFiles:
+            for attrname in ZSCORE_ATTRIBUTES:
+                colfile = fscname.rsplit(".", 1)[0] + "_" + attrname + ".cxc"
+                self.analysisResult.write_color_cxc(colfile, attrname)
+        self._color_zscores()
         return
 
     # -------------------------------------------------------------------------
-    def _write_zscore_color_cxc(self, csvfile, colfile, zcol, attrname):
-        """Generate a color file for ChimeraX"""
-        lines = [line.rstrip('\n') for line in open(csvfile, encoding='utf-8')]
-        with open(colfile, 'w', encoding='utf-8', newline='\n') as f:
-            f.write("hide atoms\n")
-            f.write("show cartoons\n")
-            try:
-                for line in lines:
-                    tok = line.split()
-                    f.write("setattr " + '/' + tok[1] + ':' + tok[2] + ' res ' + attrname + ' ' + tok[zcol] + ' create true\n')
-                f.write("color byattribute " + attrname + " palette -1,red:-0.5,white:0,gold\n")
-            except IndexError:
-                self.logger.error("Error generating file: " + str(colfile) + "\nIs there an error message in the *.out files?")
-        f.close()
+    def _color_zscores(self, attrname="zscore"):
+        """Assign the z-scores to the analysed model and color it in ChimeraX"""
+        pdbfile = os.path.realpath(self.starMapGui.analysisResultPdbFileLabel.text())
+        if not os.path.isfile(pdbfile):
+            return
+        structures = find_structures(self.session, pdbfile)
+        if not structures:
+            self._run_cmd("open " + pdbfile)
+            structures = find_structures(self.session, pdbfile)
+        if not structures:
+            return
+        register_residue_attributes(self.session)
+        matched = 0
+        for m in structures:
+            matched += assign_residue_attributes(m, self.analysisResult)
+        if not matched:
+            self.logger.warning("No residues of " + os.path.basename(pdbfile) + " match the z-score results")
+            return
+        color_by_attribute(self.session, structures, attrname)
         return
 
     # -------------------------------------------------------------------------
@@ -1316,7 +1608,8 @@ class StarMap(ToolInstance):
         xlabel = "1/res"
         ylabel = "FSC_maskedmodelmap"
         if self.starMapGui.analysisFscModelMapCheckBox.isChecked():
-            self._make_fsc_csv()
+            if not self._make_fsc_csv():
+                return
             titlelabel = "FSC between selected model and map"
         else:
             QtWidgets.QMessageBox.information(self.starMapGui.tabWidget, "StarMap info",
@@ -1324,15 +1617,14 @@ class StarMap(ToolInstance):
             QtWidgets.QMessageBox.Ok)
             return
 
-        for chain in self.fscCsvFiles:
-            if os.path.getsize(self.fscCsvFiles[chain]) <= 0:
-                self.logger.error("Data file is empty!\nPlease check log if the execution is finished!\nIt should contain the last line:\n--- StarMap: end of log ---")
-                return
-            x, y = numpy.loadtxt(self.fscCsvFiles[chain], usecols=(0, 1), unpack=True)
-            plt = pyqtgraph.plot(x, y, title=titlelabel, pen='r', background='w', left=ylabel, bottom=xlabel)
-            pyqtgraph.exporters.ImageExporter(plt.plotItem)
-            #exporter = pyqtgraph.exporters.ImageExporter(plt.plotItem)
-            #exporter.export(self.fscCsvFiles[chain].rsplit(".", 1)[0] + ".png")
+        if len(self.analysisResult.fsc) == 0:
+            self.logger.error("Data file is empty!\nPlease check log if the execution is finished!\nIt should contain the last line:\n--- StarMap: end of log ---")
+            return
+        x, y = self.analysisResult.resolution, self.analysisResult.fsc
+        plt = pyqtgraph.plot(x, y, title=titlelabel, pen='r', background='w', left=ylabel, bottom=xlabel)
+        pyqtgraph.exporters.ImageExporter(plt.plotItem)
+        #exporter = pyqtgraph.exporters.ImageExporter(plt.plotItem)
+        #exporter.export(self.fscModelMapCsvFile.rsplit(".", 1)[0] + ".png")
 
         return
 
@@ -1347,29 +1639,8 @@ class StarMap(ToolInstance):
             vszfilename = filename.rsplit(".", 1)[0] + "_lcc_res.vsz"
         if zsc:
             vszfilename = filename.rsplit(".", 1)[0] + "_lcc_res_zscore.vsz"
-        with open(vszfilename, 'w', encoding='utf-8', newline='\n') as f:
-            f.write("# generated by StarMap\n")
-            f.write("AddImportPath(u'" + str(os.getcwd()) + "')\n")
-            for chain in self.fscCsvFiles:
-                f.write("ImportFileCSV(u'" + self.fscCsvFiles[chain] + "', delimiter=' ', linked=True, dsprefix=u'1', dssuffix=u'" + self.fscCsvFiles[chain] + "')\n")
-                f.write("Add('page', name='page" + str(chain) + "', autoadd=False)\n")
-                f.write("To('page" + str(chain) + "')\n")
-                f.write("Add('graph', name='graph" + str(chain) + "', autoadd=False)\n")
-                f.write("To('graph" + str(chain) + "')\n")
-                f.write("Add('axis', name='x', autoadd=False)\n")
-                f.write("Add('axis', name='y', autoadd=False)\n")
-                f.write("To('y')\n")
-                f.write("Set('direction', 'vertical')\n")
-                f.write("To('..')\n")
-                f.write("Add('xy', name='xy1', autoadd=False)\n")
-                f.write("To('xy1')\n")
-                f.write("Set('xData', u'1col1" + self.fscCsvFiles[chain] + "')\n")
-                f.write("Set('yData', u'1col2" + self.fscCsvFiles[chain] + "')\n")
-                f.write("To('..')\n")
-                f.write("To('..')\n")
-                f.write("To('..')\n")
-            f.close()
-        #self._debug("generated Veusz script: " + f.name)
+        write_veusz(vszfilename, self.fscCsvFiles)
+        #self._debug("generated Veusz script: " + vszfilename)
         return
 
     # -------------------------------------------------------------------------
@@ -1394,6 +1665,97 @@ class StarMap(ToolInstance):
         self._make_zsc_csv()
         return
 
+    # -------------------------------------------------------------------------
+    def cxc_exec_sweep(self, spec):
+        """Generates the cxc, xml and sh files for all combinations of the given parameter values"""
+        try:
+            params, outdir = parse_sweep_spec(spec)
+        except ValueError as err:
+            self.logger.error("stmsweep: " + str(err))
+            return
+        error = self._check_sweep_values(params)
+        if error:
+            self.logger.error("stmsweep: " + error)
+            return
+        if not self.rosettaCxSelPdbFile or not self.rosettaDensityMapFile:
+            self.logger.error("stmsweep: set the input PDB and the density map first (stmset selfile=... densitymap=...)")
+            return
+        template = self._selected_shell_template()
+        if not template or not os.path.isfile(template):
+            self.logger.error("stmsweep: shell template " + str(template) + " does not exist!")
+            return
+
+        gui = self.starMapGui
+        saved = {"mapres": gui.rosettaResolutionEdit.text(),
+                 "weights": gui.advancedDensityWeightsValueBox.currentText(),
+                 "task": str(gui.rosettaStrategyTaskBox.currentIndex()),
+                 "models": gui.rosettaResultsEdit.text()}
+        savedCores = (gui.executionLocalCoresEdit.text(), gui.executionRemoteCoresEdit.text())
+        savedFiles = (self.stmChimeraxFile, self.stmRosettaFile, self.stmBashFile)
+        savedFullPath = gui.executionFullPathBox.isChecked()
+        # the variants run in their own directories and need the full input paths
+        gui.executionFullPathBox.setChecked(True)
+        variants = sweep_variants(params)
+        try:
+            for variant in variants:
+                # the task resets the number of models, it is set first
+                for name in sorted(variant, key=lambda n: n != "task"):
+                    self._set_sweep_value(name, variant[name])
+                vardir = os.path.abspath(os.path.join(outdir, variant_dirname(variant)))
+                os.makedirs(vardir, exist_ok=True)
+                base = os.path.join(vardir, "run_starmap")
+                self.stmChimeraxFile = base + ".cxc"
+                self.stmRosettaFile = base + ".xml"
+                self.stmBashFile = base + ".sh"
+                with open(self.stmChimeraxFile, 'w', encoding='utf-8', newline='\n') as f:
+                    f.write(self.get_values_script())
+                self._save_fsc_script(self.stmChimeraxFile)
+                self._changed_user_rosettascript_event()
+                self._write_rosetta_script(self.stmRosettaFile)
+                self._write_bash_script_template(template, self.stmBashFile)
+                self.logger.info("stmsweep: " + vardir)
+        finally:
+            for name in sorted(saved, key=lambda n: n != "task"):
+                self._set_sweep_value(name, saved[name])
+            gui.executionLocalCoresEdit.setText(savedCores[0])
+            gui.executionRemoteCoresEdit.setText(savedCores[1])
+            gui.executionFullPathBox.setChecked(savedFullPath)
+            self.stmChimeraxFile, self.stmRosettaFile, self.stmBashFile = savedFiles
+            self._changed_user_rosettascript_event()
+        self.logger.info("stmsweep: generated " + str(len(variants)) + " variants in " + os.path.abspath(outdir))
+        return
+
+    # -------------------------------------------------------------------------
+    def _check_sweep_values(self, params):
+        """Returns an error message if a sweep value cannot be set, otherwise an empty string"""
+        tasks = self.starMapGui.rosettaStrategyTaskBox.count()
+        weightsBox = self.starMapGui.advancedDensityWeightsValueBox
+        for name, values in params.items():
+            for value in values:
+                try:
+                    if name == "mapres" and float(value) <= 0:
+                        raise ValueError()
+                    if name == "task" and not 0 <= int(value) < tasks:
+                        return "task " + value + " is not in the range 0.." + str(tasks - 1)
+                    if name == "models" and int(value) < 1:
+                        raise ValueError()
+                except ValueError:
+                    return "invalid value for " + name + ": " + value
+                if name == "weights" and weightsBox.findText(value) < 0:
+                    return ("unknown density weights " + value + " (use "
+                            + ", ".join(weightsBox.itemText(i) for i in range(weightsBox.count())) + ")")
+        return ""
+
+    # -------------------------------------------------------------------------
+    def _set_sweep_value(self, name, value):
+        """Sets one sweep parameter in the user interface"""
+        if name == "weights":
+            box = self.starMapGui.advancedDensityWeightsValueBox
+            box.setCurrentIndex(box.findText(value))
+        else:
+            self.set_value(name + "=" + value)
+        return
+
     # -------------------------------------------------------------------------
     def _load_rosetta_script(self, scriptfile=""):
         """Loads the Rosetta script template"""
@@ -1402,11 +1764,8 @@ class StarMap(ToolInstance):
             if not scriptfile:
                 scriptfile = data_location('templates', STARMAP_ROSETTA_SCRIPT) or STARMAP_ROSETTA_SCRIPT
             #self._debug("loading script: " + scriptfile)
-            parsedScript = script.parseFile(scriptfile)
-            tags = parsedScript.asList()
-            reset()
-            self.rosettaScriptString = asXmlList(tags)
-        except ParseException:
+            self.rosettaScriptString = load_file(scriptfile).as_xml()
+        except RosettaScriptError:
             self.logger.error("Error parsing the rosetta script template!")
         except FileNotFoundError:
             self.logger.error("Error opening the rosetta script template: " + scriptfile)
@@ -1711,12 +2070,7 @@ class StarMap(ToolInstance):
         """Show stdout contents in log tab"""
         if not self.stdout:
             return
-        with open(self.stdout, 'r', encoding='utf-8') as f:
-            f.seek (0, 2)
-            fsize = f.tell()
-            f.seek (max (fsize-20000, 0), 0)
-            self.starMapGui.logViewEdit.setText(f.read())
-            self.starMapGui.logViewEdit.moveCursor(QtGui.QTextCursor.End)
+        self._start_log_tail(self.stdout)
         return
 
     # -------------------------------------------------------------------------
@@ -1724,9 +2078,42 @@ class StarMap(ToolInstance):
         """Show stderr contents in log tab"""
         if not self.stderr:
             return
-        file = open(self.stderr, 'r', encoding='utf-8')
-        self.starMapGui.logViewEdit.setText(file.read())
-        self.starMapGui.logViewEdit.moveCursor(QtGui.QTextCursor.End)
+        self._start_log_tail(self.stderr)
+        return
+
+    # -------------------------------------------------------------------------
+    def _start_log_tail(self, filename):
+        """Show the last lines of the log and follow it"""
+        self.logTail = LogTail(filename)
+        self.starMapGui.logViewEdit.clear()
+        self._refresh_log_tail()
+        self.logTimer.start()
+        return
+
+    # -------------------------------------------------------------------------
+    def _stop_log_tail(self):
+        """Stop following the log file"""
+        self.logTimer.stop()
+        self.logTail = None
+        return
+
+    # -------------------------------------------------------------------------
+    def _refresh_log_tail(self):
+        """Append only the new lines of the followed log file"""
+        if not self.logTail:
+            return
+        if self.starMapGui.tabWidget.currentIndex() != self.logTabIndex:
+            return
+        lines = self.logTail.read_new_lines()
+        if not lines:
+            return
+        edit = self.starMapGui.logViewEdit
+        cursor = edit.textCursor()
+        cursor.movePosition(QtGui.QTextCursor.End)
+        if not edit.document().isEmpty():
+            cursor.insertText('\n')
+        cursor.insertText('\n'.join(lines))
+        edit.moveCursor(QtGui.QTextCursor.End)
         return
 
     # -------------------------------------------------------------------------
@@ -1752,29 +2139,50 @@ class StarMap(ToolInstance):
         return
 
     # -------------------------------------------------------------------------
-    def _exec_external_script_thread(self, scriptfile, submit=''):
-        """Executes or submits the the given script as thread"""
+    def _exec_external_script(self, scriptfile, submit=''):
+        """Executes or submits the the given script as tracked job"""
         if not os.path.exists(scriptfile):
             QtWidgets.QMessageBox.warning(self.starMapGui.tabWidget, "StarMap warning",
                                           "File does not exist: " + scriptfile,
                                           QtWidgets.QMessageBox.Ok)
-            return
+            return None
 
+        self._stop_log_tail()
         self.starMapGui.logStdoutButton.setEnabled(True)
         self.starMapGui.logStderrButton.setEnabled(True)
-        execThread = ExternalBashThread()
-        execThread.set_script(os.path.abspath(scriptfile), submit)
-        execThread.start()
-        execThread.join()
-        self.stdout = execThread.stdout
-        self.stderr = execThread.stderr
+        job = self.jobRunner.submit(os.path.abspath(scriptfile), submit)
+        self.stdout = job.stdout
+        self.stderr = job.stderr
         self.starMapGui.logViewEdit.setText(self.stdout)
+        self.starMapGui.logViewEdit.append(job.status_line())
         self.starMapGui.tabWidget.setCurrentIndex(self.logTabIndex)
+        return job
+
+    # -------------------------------------------------------------------------
+    def _job_changed(self, job):
+        """Reports state changes of the tracked jobs"""
+        self.logger.info("starmap> job " + job.status_line())
+        if job.stdout == self.stdout:
+            self.starMapGui.logViewEdit.append(job.status_line())
+        # submitted jobs return at once, only local runs end the watching
+        if job is self.modelProgressJob and not job.submit and job.state != JOB_RUNNING:
+            self.modelProgress.update()
+            self.modelProgress.stop()
+            self._set_progress(self.modelProgress.percent(), self.modelProgress.status_line() + " (" + job.state + ")")
+            self.modelProgressJob = None
+        return
+
+    # -------------------------------------------------------------------------
+    def _show_jobs_log(self):
+        """Show the state of all jobs started in this session in log tab"""
+        self._stop_log_tail()
+        self.starMapGui.logViewEdit.setText(self.jobRunner.status_report())
+        self.starMapGui.logViewEdit.moveCursor(QtGui.QTextCursor.End)
         return
 
     # -------------------------------------------------------------------------
     def _exec_external_script_batchmode(self, cmd):
-        """Executes or submits the the given script as thread"""
+        """Executes or submits the the given script as thread, returns the exit status"""
         stdout = cmd.rsplit(".", 1)[0]  + ".out"
         stderr = cmd.rsplit(".", 1)[0]  + ".err"
         cmd = os.path.abspath(cmd)
@@ -1783,7 +2191,23 @@ class StarMap(ToolInstance):
         with open(stdout, 'w', encoding='utf-8') as o:
             with open(stderr, 'w', encoding='utf-8') as e:
                 procExe = subprocess.Popen(cmd, shell=True, stdout=o, stderr=e, universal_newlines=True)
-        procExe.wait()
+        return procExe.wait()
+
+    # -------------------------------------------------------------------------
+    def _update_local_cores(self):
+        """Sets the local cores from the number of models"""
+        try:
+            models = int(self.starMapGui.rosettaResultsEdit.text())
+        except ValueError:
+            return
+        cores = min(os.cpu_count() or 1, models + 1)
+        # Darwin has only static Rosetta executables for local execution, also WSL binary install,
+        # the model pool runs one static executable per model
+        if (platform.system() == "Darwin" or platform.system() == "Windows") and not self._model_pool_selected():
+            cores = 1
+        if self._model_pool_selected():
+            cores = min(os.cpu_count() or 1, models)
+        self.starMapGui.executionLocalCoresEdit.setText(str(cores))
         return
 
    # -------------------------------------------------------------------------
@@ -1815,6 +2239,15 @@ class StarMap(ToolInstance):
                 self.starMapGui.advancedConstraintsSetsFileCheckBox.setChecked(True)
             else:
                 self.starMapGui.advancedConstraintsSetsFileCheckBox.setChecked(False)
+        if qname == "zsccxc":
+            self.zscoreCxcFiles = qval == "True"
+        if qname == "anacache":
+            self.analysisCacheEnabled = qval == "True"
+        if qname == "cropmap":
+            try:
+                self.cropMapPadding = float(qval)
+            except ValueError:
+                self.cropMapPadding = CROP_PADDING if qval == "True" else 0.0
         if qname == "fullpath":
             if qval == "True":
                 self.starMapGui.executionFullPathBox.setChecked(True)
@@ -1856,13 +2289,7 @@ class StarMap(ToolInstance):
             self.starMapGui.apixResolutionEdit.setText(qval)
         if qname == "models":
             self.starMapGui.rosettaResultsEdit.setText(qval)
-            if os.cpu_count() < int(qval)+1:
-                self.starMapGui.executionLocalCoresEdit.setText(str(os.cpu_count()))
-            else:
-                self.starMapGui.executionLocalCoresEdit.setText(str(int(qval)+1))
-            # Darwin has only static Rosetta executables for local execution, also WSL binary install
-            if platform.system() == "Darwin" or platform.system() == "Windows":
-                self.starMapGui.executionLocalCoresEdit.setText(str(1))
+            self._update_local_cores()
             self.starMapGui.executionRemoteCoresEdit.setText(str(int(qval)+1))
         # saved scripts
         if qname == "runcxc":
@@ -1967,8 +2394,12 @@ class StarMap(ToolInstance):
         """Returns settings script"""
         if fsc:
             cxc = "ui tool show StarMap"
-            cxc += "\nstmset alspdb=" + os.path.basename(self.rosettaCxSelPdbFile)
-            cxc += "\nstmset densitymap=" + os.path.basename(self.rosettaDensityMapFile)
+            if not self.starMapGui.executionFullPathBox.isChecked():
+                cxc += "\nstmset alspdb=" + os.path.basename(self.rosettaCxSelPdbFile)
+                cxc += "\nstmset densitymap=" + os.path.basename(self.rosettaDensityMapFile)
+            else:
+                cxc += "\nstmset alspdb=" + os.path.abspath(self.rosettaCxSelPdbFile)
+                cxc += "\nstmset densitymap=" + os.path.abspath(self.rosettaDensityMapFile)
             cxc += "\nstmset mapres=" + self.starMapGui.rosettaResolutionEdit.text()
             cxc += "\nstmrunfsc"
             cxc += "\nstmrunlcc"
@@ -2001,6 +2432,8 @@ class StarMap(ToolInstance):
         cxc += "\nstmset consset=" + str(consset)
         fullpath = self.starMapGui.executionFullPathBox.isChecked()
         cxc += "\nstmset fullpath=" + str(fullpath)
+        if self.cropMapPadding > 0:
+            cxc += "\nstmset cropmap=" + str(self.cropMapPadding)
         # files
         if not self.starMapGui.executionFullPathBox.isChecked():
             if symm:
@@ -2082,214 +2515,166 @@ class StarMap(ToolInstance):
     def _replace_xml_tags(self, template):
         """Reads the given template from the disk and replaces the xml tags"""
         try:
-            parsedScript = script.parseFile(template)
-            l = parsedScript.asList()
+            return self._rosetta_script_editor().edit_file(template)
+        except RosettaScriptError as err:
+            self.logger.error("Error in Rosetta XML replacements: " + str(err))
 
-            # TODO handle residues > 800
-            if self.selectedResiduesCount < 800:
-                removeTagAndMoverByTagName(l, "LocalRelax")
-                cleanupList(l)
-            else:
-                removeTagAndMoverByTagName(l, "FastRelax")
-                cleanupList(l)
-
-            # handle symmetry check and setup
-            if not self.starMapGui.advancedSymmCheckBox.isChecked():
-                removeTagAndMoverByTagName(l, "SetupForSymmetry")
-                removeTagAndMoverByTagName(l, "SymMinMover")
-                cleanupList(l)
-                #self._debug("tags without <SetupForSymmetry>:\n" + str(l))
-            else:
-                removeTagAndMoverByTagName(l, "SetupForDensityScoring")
-                removeTagAndMoverByTagName(l, "MinMover")
-                cleanupList(l)
-                #self._debug("tags without <SetupForDensityScoring>:\n" + str(l))
-
-            # remove constraints
-            if not self.starMapGui.advancedConstraintsSetsFileCheckBox.isChecked():
-                removeTagAndMoverByTagName(l, "ConstraintSetMover")
-                cleanupList(l)
-                #self._debug("tags without <ConstraintSetMover>:\n" + str(l))
-
-            # handle model evaluation
-            if self.starMapGui.rosettaModelCheckBox.isChecked():
-                removeTagAndMoverByValueName(l, "reportFSC")
-                cleanupList(l)
-                #self._debug("tags without <ReportFSC::reportFSC>:\n" + str(l))
-            else:
-                removeTagAndMoverByValueName(l, "reportFSC_withtest")
-                #self._debug("tags without <ReportFSC::reportFSC_withtest>:\n" + str(l))
-
-            # handle tasks strategy (user = 1)
-            if self.starMapGui.rosettaStrategyValueBox.currentIndex() == 1:
-                reset()
-                replaceUserDefinedRebuildingValues(l, "CartesianSampler", self.starMapGui.rosettaStrategyResiduesEdit.text())
-                cleanupList(l)
-
-            # full rebuild taks
-            # -- default
-
-            # minimum rebuild task
-            if self.starMapGui.rosettaStrategyTaskBox.currentIndex() == 1:
-                removeTagAndMoverByValueName(l, "cen5_50")
-                removeTagAndMoverByValueName(l, "cen5_60")
-                removeTagAndMoverByValueName(l, "cen5_70")
-                #self._debug("tags without <CartesianSampler::can5_50|cen5_60|cen5_70>:\n" + str(l))
-
-            # refinement only task
-            if self.starMapGui.rosettaStrategyTaskBox.currentIndex() == 2 or self.starMapGui.rosettaStrategyTaskBox.currentIndex() == 3:
-                removeTagAndMoverByValueName(l, "cen5_50")
-                removeTagAndMoverByValueName(l, "cen5_60")
-                removeTagAndMoverByValueName(l, "cen5_70")
-                removeTagAndMoverByValueName(l, "cen5_80")
-                removeTagAndMoverByValueName(l, "cen5_rama")
-                #self._debug("tags without <CartesianSampler::can5_50|cen5_60|cen5_70|cen5_80|cen5_rama>:\n" + str(l))
-
-            # torsian refinement
-            s = asXmlList(l)
-            if self.starMapGui.rosettaStrategyTaskBox.currentIndex() == 3:
-                s = s.replace("mover=\"relaxcart\"", "mover=\"relax\"", 9)
-
-            return s
-
-        except ParseException:
-            self.logger.error("Error in Rosetta XML replacements")
+        return ""
+
+    # -------------------------------------------------------------------------
+    def _replace_xml_string(self, script):
+        """Replaces the xml tags of the given script text"""
+        try:
+            return self._rosetta_script_editor().edit_string(script)
+        except RosettaScriptError as err:
+            self.logger.error("Error in Rosetta XML replacements: " + str(err))
 
         return ""
 
+    # -------------------------------------------------------------------------
+    def _rosetta_script_editor(self):
+        """Returns an editor with the Rosetta script options of the user interface"""
+        userResidues = None
+        # tasks strategy (user = 1)
+        if self.starMapGui.rosettaStrategyValueBox.currentIndex() == 1:
+            userResidues = self.starMapGui.rosettaStrategyResiduesEdit.text()
+        return RosettaScriptEditor(self.selectedResiduesCount,
+                                   self.starMapGui.advancedSymmCheckBox.isChecked(),
+                                   self.starMapGui.advancedConstraintsSetsFileCheckBox.isChecked(),
+                                   self.starMapGui.rosettaModelCheckBox.isChecked(),
+                                   userResidues,
+                                   self.starMapGui.rosettaStrategyTaskBox.currentIndex())
+
     # -------------------------------------------------------------------------
     def _replace_script_tags(self, script):
         """Replace @@ tags"""
+        if "@@ROSETTA_SCRIPT_EXE@@" in script:
+            self._check_rosetta()
+        s, unknown = replace_tags(script, self._script_tag_values())
+        if unknown:
+            self.logger.warning("Unknown tags left in the script: @@" + "@@, @@".join(unknown) + "@@")
+        return s
+
+    # -------------------------------------------------------------------------
+    def _rosetta_cmdline(self, rosettaCmd, fullPath):
+        """Returns how the given Rosetta executable is called in the scripts"""
+        if fullPath:
+            return rosettaCmd + " "
+        if platform.system() == "Windows":
+            return rosettaCmd
+        return "$(which " + os.path.basename(rosettaCmd) + ")"
+
+    # -------------------------------------------------------------------------
+    def _script_tag_values(self):
+        """Returns the values of all @@ tags from the user interface"""
+        gui = self.starMapGui
+        fullPath = gui.executionFullPathBox.isChecked()
+        path = os.path.realpath if fullPath else os.path.basename
+        tags = {}
+
         # use mpi if cores < 1
-        cores = int(self.starMapGui.executionLocalCoresEdit.text())
-        if self.starMapGui.executionTabWidget.currentIndex() == 2:
-            cores = int(self.starMapGui.executionRemoteCoresEdit.text())
-        if cores == 1:
-            if not self.starMapGui.executionFullPathBox.isChecked():
-                if platform.system() == "Windows":
-                    cmdline = ROSETTA_SCRIPTS_CMD
-                else:
-                    cmdline = "$(which " + os.path.basename(ROSETTA_SCRIPTS_CMD) + ")"
-            else:
-                cmdline = ROSETTA_SCRIPTS_CMD + " "
-        else:
-            if not self.starMapGui.executionFullPathBox.isChecked():
-                if platform.system() == "Windows":
-                    cmdline = ROSETTA_SCRIPTS_MPI_CMD
-                else:
-                    cmdline = "$(which " + os.path.basename(ROSETTA_SCRIPTS_MPI_CMD) + ")"
-            else:
-                cmdline = ROSETTA_SCRIPTS_MPI_CMD + " "
+        cores = int(gui.executionLocalCoresEdit.text())
+        if gui.executionTabWidget.currentIndex() == 2:
+            cores = int(gui.executionRemoteCoresEdit.text())
+        rosettaCmd = config.ROSETTA_SCRIPTS_CMD if cores == 1 else config.ROSETTA_SCRIPTS_MPI_CMD
+        cmdline = self._rosetta_cmdline(rosettaCmd, fullPath)
+        # job array tasks always run the single process executable
+        serialCmdline = self._rosetta_cmdline(config.ROSETTA_SCRIPTS_CMD, fullPath)
 
         # filename of the rosetta script
-        if self.starMapGui.executionFullPathBox.isChecked():
-            s = script.replace("@@ROSETTA_SCRIPT_FILE@@", os.path.realpath(self.stmRosettaFile))
-        else:
-            s = script.replace("@@ROSETTA_SCRIPT_FILE@@", os.path.basename(self.stmRosettaFile))
+        tags["ROSETTA_SCRIPT_FILE"] = path(self.stmRosettaFile)
         # replace cores
-        s = s.replace("@@CORES@@", str(cores))
+        tags["CORES"] = str(cores)
         # filename of the saved chimera selection
-        if self.starMapGui.executionFullPathBox.isChecked():
-            s = s.replace("@@INPUT_PDB_FILE@@", os.path.realpath(self.rosettaCxSelPdbFile))
-        else:
-            s = s.replace("@@INPUT_PDB_FILE@@", os.path.basename(self.rosettaCxSelPdbFile))
+        tags["INPUT_PDB_FILE"] = path(self.rosettaCxSelPdbFile)
         # number of output models
-        s = s.replace("@@NSTRUCT@@", self.starMapGui.rosettaResultsEdit.text())
+        tags["NSTRUCT"] = gui.rosettaResultsEdit.text()
         # control density
-        if self.starMapGui.executionFullPathBox.isChecked():
-            s = s.replace("@@DENSITY_FILE@@", os.path.realpath(self.rosettaDensityMapFile))
-        else:
-            s = s.replace("@@DENSITY_FILE@@", os.path.basename(self.rosettaDensityMapFile))
+        tags["DENSITY_FILE"] = path(self._cropped_map(self.rosettaDensityMapFile))
 
         # legacy atom pair weight fix in template
-        s = s.replace("@@CONSTRAINT_APW@@", '0')
-        if self.starMapGui.executionFullPathBox.isChecked():
-            s = s.replace("@@CONSTRAINT_SET_FILE@@", os.path.realpath(self.starMapGui.advancedConstraintsSetsFileLabel.text()))
-        else:
-            s = s.replace("@@CONSTRAINT_SET_FILE@@", os.path.basename(self.starMapGui.advancedConstraintsSetsFileLabel.text()))
+        tags["CONSTRAINT_APW"] = '0'
+        tags["CONSTRAINT_SET_FILE"] = path(gui.advancedConstraintsSetsFileLabel.text())
 
         # symmetry replacements
-        if self.starMapGui.advancedSymmCheckBox.isChecked():
-            if self.starMapGui.executionFullPathBox.isChecked():
-                s = s.replace("@@SYMMETRY_FILE@@", os.path.realpath(self.starMapGui.advancedSymmFileLabel.text()))
-            else:
-                s = s.replace("@@SYMMETRY_FILE@@", os.path.basename(self.starMapGui.advancedSymmFileLabel.text()))
-            if not self.starMapGui.advancedSymmHelixCheckBox.isChecked():
+        if gui.advancedSymmCheckBox.isChecked():
+            tags["SYMMETRY_FILE"] = path(gui.advancedSymmFileLabel.text())
+            if not gui.advancedSymmHelixCheckBox.isChecked():
                 cmdline = cmdline + " -score_symm_complex true "
-            s = s.replace("@@USE_SYMMETRY@@", '1')
+                serialCmdline = serialCmdline + " -score_symm_complex true "
+            tags["USE_SYMMETRY"] = '1'
         else:
-            s = s.replace("@@RUN_SYMMETRY_COMMANDLINE@@", "")
+            tags["RUN_SYMMETRY_COMMANDLINE"] = ""
             # xml trouble
-            s = s.replace("@@SYMMETRY_FILE@@", "@@XML_TAG_WILL_BE_DELETED@@")
-            s = s.replace("@@USE_SYMMETRY@@", '0')
+            tags["SYMMETRY_FILE"] = "@@XML_TAG_WILL_BE_DELETED@@"
+            tags["USE_SYMMETRY"] = '0'
 
         # strategy
-        s = s.replace("@@STRATEGY@@", self.starMapGui.rosettaStrategyValueBox.currentText())
+        tags["STRATEGY"] = gui.rosettaStrategyValueBox.currentText()
 
         # density weight
-        s = s.replace("@@DENSITY_WEIGHT@@", self.starMapGui.advancedDensityWeightsValueBox.currentText())
+        tags["DENSITY_WEIGHT"] = gui.advancedDensityWeightsValueBox.currentText()
 
         # validation
-        s = s.replace("@@HIRES@@", self.starMapGui.rosettaResolutionEdit.text())
-        if self.starMapGui.rosettaModelCheckBox.isChecked():
-            if self.starMapGui.executionFullPathBox.isChecked():
-                s = s.replace("@@VALIDATION_HALF2_FILE@@", os.path.realpath(self.starMapGui.rosettaModelFileLabel.text()))
+        tags["HIRES"] = gui.rosettaResolutionEdit.text()
+        if gui.rosettaModelCheckBox.isChecked():
+            if self.rosettaModelEvalFile in self.croppedMaps:
+                tags["VALIDATION_HALF2_FILE"] = path(self._cropped_map(self.rosettaModelEvalFile))
             else:
-                s = s.replace("@@VALIDATION_HALF2_FILE@@", os.path.basename(self.starMapGui.rosettaModelFileLabel.text()))
+                tags["VALIDATION_HALF2_FILE"] = path(gui.rosettaModelFileLabel.text())
         else:
-            s = s.replace("@@VALIDATION_HALF2_FILE@@", "@@XML_TAG_WILL_BE_DELETED@@")
+            tags["VALIDATION_HALF2_FILE"] = "@@XML_TAG_WILL_BE_DELETED@@"
 
         # user defined tags
-        s = s.replace("@@USER1@@", self.starMapGui.userReplaceEdit_1.text())
-        s = s.replace("@@USER2@@", self.starMapGui.userReplaceEdit_2.text())
-        s = s.replace("@@USER3@@", self.starMapGui.userReplaceEdit_3.text())
-        s = s.replace("@@USER4@@", self.starMapGui.userReplaceEdit_4.text())
-        s = s.replace("@@USER5@@", self.starMapGui.userReplaceEdit_5.text())
-        s = s.replace("@@USER6@@", self.starMapGui.userReplaceEdit_6.text())
-        s = s.replace("@@USER7@@", self.starMapGui.userReplaceEdit_7.text())
-        s = s.replace("@@USER8@@", self.starMapGui.userReplaceEdit_8.text())
+        for i in range(1, 9):
+            tags["USER" + str(i)] = getattr(gui, "userReplaceEdit_" + str(i)).text()
 
         # how to call rosetta
-        s = s.replace("@@ROSETTA_SCRIPT_EXE@@", cmdline)
+        tags["ROSETTA_SCRIPT_EXE"] = cmdline
+        tags["ROSETTA_SCRIPT_SERIAL_EXE"] = serialCmdline
+
+        # job arrays run one model per task, at most cores tasks at once
+        tags["ARRAY_TASKS"] = "1-" + tags["NSTRUCT"]
+        tags["ARRAY_LIMIT"] = str(cores)
 
         # MEDIC
-        s = s.replace("@@ANALYSIS_HIRES@@", self.starMapGui.analysisResolutionEdit.text())
+        tags["ANALYSIS_HIRES"] = gui.analysisResolutionEdit.text()
         if not self.rosettaResultPdbFile:
-            self.rosettaResultPdbFile = self.starMapGui.analysisResultPdbFileLabel.text()
-        s = s.replace("@@MEDIC_INPUT_PDB@@", os.path.basename(self.rosettaResultPdbFile))
+            self.rosettaResultPdbFile = gui.analysisResultPdbFileLabel.text()
+        tags["MEDIC_INPUT_PDB"] = os.path.basename(self.rosettaResultPdbFile)
         suffix = "_MEDIC_bfac_pred.pdb"
-        if self.starMapGui.medicRosettaRelaxCheckBox.isChecked():
-            s = s.replace("@@MEDIC_SKIP_RELAX@@", self.stmMedicSkipRelaxFlag)
+        if gui.medicRosettaRelaxCheckBox.isChecked():
+            tags["MEDIC_SKIP_RELAX"] = self.stmMedicSkipRelaxFlag
         else:
-            s = s.replace("@@MEDIC_SKIP_RELAX@@", "")
+            tags["MEDIC_SKIP_RELAX"] = ""
             #suffix = "_refine" + suffix
-        if self.starMapGui.medicCleanCheckBox.isChecked():
-            s = s.replace("@@MEDIC_CLEAN_PDB@@", self.stmMedicCleanFlag)
+        if gui.medicCleanCheckBox.isChecked():
+            tags["MEDIC_CLEAN_PDB"] = self.stmMedicCleanFlag
             #suffix = "_clean" + suffix
         else:
-            s = s.replace("@@MEDIC_CLEAN_PDB@@", "")
+            tags["MEDIC_CLEAN_PDB"] = ""
         self.stmMedicResultFile = self.rosettaResultPdbFile.rsplit(".", 1)[0]  + suffix
-        s = s.replace("@@MEDIC_RESULT_PDB@@", os.path.basename(self.stmMedicResultFile))
+        tags["MEDIC_RESULT_PDB"] = os.path.basename(self.stmMedicResultFile)
 
         # MEDIC result
-        medRes = os.path.basename(self.starMapGui.analysisResultPdbFileLabel.text())
+        medRes = os.path.basename(gui.analysisResultPdbFileLabel.text())
         medRes = medRes.rsplit(".", 1)[0]
         medRes = medRes.replace("_clean", "")
         medRes = medRes.replace("_refine", "")
-        s = s.replace("@@MEDIC_INPUT@@", medRes)
+        tags["MEDIC_INPUT"] = medRes
         global MEDIC_SUMMARY
         MEDIC_SUMMARY = "MEDIC_summary_" + medRes + ".txt"
         self.stmMedicSummaryFile = MEDIC_SUMMARY
         self.stmMedicResultCxc = "MEDIC_summary_" + medRes + ".cxc"
-        self.starMapGui.medicSummaryTxtLabel.setText(self._short_path(MEDIC_SUMMARY))
-        self.starMapGui.medicResultCxcLabel.setText(self._short_path(self.stmMedicResultCxc))
+        gui.medicSummaryTxtLabel.setText(self._short_path(MEDIC_SUMMARY))
+        gui.medicResultCxcLabel.setText(self._short_path(self.stmMedicResultCxc))
 
-        if not self.starMapGui.medicRunClusterCheckBox.isChecked():
-            s = s.replace("@@MEDIC_RUN_PARAMS@@", "-j " + self.starMapGui.medicLocalCoresEdit.text())
+        if not gui.medicRunClusterCheckBox.isChecked():
+            tags["MEDIC_RUN_PARAMS"] = "-j " + gui.medicLocalCoresEdit.text()
         else:
-            s = s.replace("@@MEDIC_RUN_PARAMS@@", "--scheduler --queue " + self.starMapGui.medicQueueNameEdit.text() + " --workers " + self.starMapGui.medicClusterWorkersEdit.text())
+            tags["MEDIC_RUN_PARAMS"] = "--scheduler --queue " + gui.medicQueueNameEdit.text() + " --workers " + gui.medicClusterWorkersEdit.text()
 
-        return s
+        return tags
 
     # -------------------------------------------------------------------------
     @classmethod
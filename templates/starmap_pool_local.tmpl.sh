@@ -0,0 +1,27 @@
+#!/bin/sh
+
+# one model per call, started by StarMap with the model number as argument
+TASK=$1
+
+# run Rosetta script
+echo "### start: " $(date)
+echo "### node : " $(hostname)
+echo "### model: " ${TASK}
+
+@@ROSETTA_SCRIPT_SERIAL_EXE@@ \
+    -parser:protocol "@@ROSETTA_SCRIPT_FILE@@" \
+    -edensity:mapfile "@@DENSITY_FILE@@" \
+    -s "@@INPUT_PDB_FILE@@" \
+    -in::file::centroid_input \
+    -mapreso @@HIRES@@ \
+    -nstruct 1 \
+    -out:suffix _pool${TASK} \
+    -out:file:scorefile score_pool${TASK}.sc \
+    -default_max_cycles 200 \
+    -crystal_refine \
+    -edensity::cryoem_scatterers true \
+    -ignore_unrecognized_res \
+    -exclude_dna_dna false \
+    -out:level 200
+
+echo "### end: " $(date)
@@ -0,0 +1,45 @@
+#!/bin/zsh
+
+#SBATCH --partition cssb,allcpu
+#SBATCH --job-name starmap
+#SBATCH --time 7-00:00
+#SBATCH --output starmap_cluster_%a.out
+#SBATCH --array @@ARRAY_TASKS@@%@@ARRAY_LIMIT@@
+#SBATCH --ntasks 1
+#SBATCH --cpus-per-task 1
+
+source /etc/profile.d/modules.sh
+module load rosetta/3.13
+unset LD_PRELOAD
+
+# one model per array task
+TASK=${SLURM_ARRAY_TASK_ID}
+MODEL=$(basename "@@INPUT_PDB_FILE@@" .pdb)
+
+# run Rosetta script
+echo "### start: " $(date)
+echo "### node : " $(hostname)
+echo "### task : " ${TASK}
+
+@@ROSETTA_SCRIPT_SERIAL_EXE@@ \
+  -parser:protocol "@@ROSETTA_SCRIPT_FILE@@" \
+  -edensity:mapfile "@@DENSITY_FILE@@" \
+  -s "@@INPUT_PDB_FILE@@" \
+  -in::file::centroid_input \
+  -mapreso @@HIRES@@ \
+  -nstruct 1 \
+  -out:suffix _task${TASK} \
+  -out:file:scorefile score_task${TASK}.sc \
+  -default_max_cycles 200 \
+  -crystal_refine \
+  -edensity::cryoem_scatterers true \
+  -ignore_unrecognized_res \
+  -exclude_dna_dna false \
+  -out:level 200
+
+# same model numbering as a single run with -nstruct @@NSTRUCT@@
+if [ -f ${MODEL}_task${TASK}_0001.pdb ]; then
+  mv ${MODEL}_task${TASK}_0001.pdb ${MODEL}_$(printf "%04d" ${TASK}).pdb
+fi
+
+echo "### end: " $(date)